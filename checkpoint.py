@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from settings import CHECKPOINT_SUFFIX
+
+
+def _get_texts_hash(texts: list) -> str:
+    return hashlib.sha256("\x1e".join(texts).encode("utf-8")).hexdigest()
+
+
+class CheckpointJournal:
+    """
+    Sidecar journal (<document><CHECKPOINT_SUFFIX>) of the finished batches of a document translation.
+    Every batch is appended as soon as it is translated, keyed by (call index, batch index) of translate_texts,
+    so a restarted job of the same document and the same settings skips the finished batches.
+    The journal is discarded when the document or the job settings changed, and removed when the job succeeded.
+    """
+
+    def __init__(self, file_path_source: str, job_key: str = "", journal_path: str = None):
+        """
+        :param file_path_source: the path of the document
+        :param job_key: the settings of the job that change the translations (engine, languages, glossary, ...)
+        :param journal_path: the path of the journal (None for the sidecar of the document)
+        """
+        self.journal_path = journal_path or file_path_source + CHECKPOINT_SUFFIX
+        file_hash = hashlib.sha256()
+        with open(file_path_source, "rb") as file_input:
+            for block in iter(lambda: file_input.read(1024 * 1024), b""):
+                file_hash.update(block)
+        self.header = {"file_hash": file_hash.hexdigest(), "job_key": job_key}
+        self.restored = 0
+        self._call_index = 0
+        self._batches = {}  # (call index, batch index): (hash of the source texts, translated texts)
+        # 批次在线程池中完成，写入需要加锁
+        self._lock = threading.Lock()
+
+        lines = []
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as file_input:
+                lines = file_input.readlines()
+        if len(lines) > 0 and self._parse_line(lines[0]) == self.header:
+            for line in lines[1:]:
+                entry = self._parse_line(line)
+                # 崩溃时最后一行可能只写了一半
+                if entry is None:
+                    continue
+                self._batches[(entry["call"], entry["batch"])] = (entry["hash"], entry["texts_translated"])
+            logging.info("Checkpoint journal {0}: {1} batches finished.".format(self.journal_path,
+                                                                               len(self._batches)))
+            self._file = open(self.journal_path, "a", encoding="utf-8")
+        else:
+            if len(lines) > 0:
+                logging.info("Checkpoint journal {0} is outdated, starting over.".format(self.journal_path))
+            self._file = open(self.journal_path, "w", encoding="utf-8")
+            self._write(self.header)
+
+    @staticmethod
+    def _parse_line(line: str) -> dict:
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    def _write(self, entry: dict) -> None:
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def next_call(self) -> int:
+        """
+        :return: the index of the next call of translate_texts on the document (the calls are made one by one)
+        """
+        with self._lock:
+            call_index = self._call_index
+            self._call_index += 1
+        return call_index
+
+    def get(self, call_index: int, batch_index: int, texts: list) -> list:
+        """
+        :param call_index: the index returned by next_call
+        :param batch_index: the index of the batch in the call
+        :param texts: the source texts of the batch
+        :return: the translated texts of the batch, None if the batch is not finished
+        """
+        with self._lock:
+            batch = self._batches.get((call_index, batch_index))
+            # 原文不同（如翻译记忆在两次运行之间有变化）则重新翻译
+            if batch is None or batch[0] != _get_texts_hash(texts):
+                return None
+            self.restored += 1
+        return batch[1]
+
+    def put(self, call_index: int, batch_index: int, texts: list, texts_translated: list) -> None:
+        """
+        Append a finished batch to the journal.
+        """
+        entry = {"call": call_index, "batch": batch_index, "hash": _get_texts_hash(texts),
+                 "texts_translated": list(texts_translated)}
+        with self._lock:
+            self._batches[(call_index, batch_index)] = (entry["hash"], entry["texts_translated"])
+            self._write(entry)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def remove(self) -> None:
+        """
+        Close and delete the journal after the job succeeded.
+        """
+        self.close()
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
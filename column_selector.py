@@ -0,0 +1,118 @@
+from preprocess import is_source_language_text
+from settings import LANGUAGE_HEADER_DICT
+
+
+class ColumnSelector:
+    """
+    Select the sheets and the columns of a table file (xlsx/csv/tsv) to translate,
+    and the column to write the translated texts into.
+    The first row of every sheet is the header row.
+    """
+
+    def __init__(self,
+                 source_columns: list = None,
+                 sheets: list = None,
+                 target_column: str = None,
+                 auto_detect: bool = False,
+                 detect_ratio: float = 0.5,
+                 detect_sample_size: int = 200):
+        """
+        :param source_columns: the headers of the columns to translate
+        :param sheets: the names of the sheets to translate (None for all sheets)
+        :param target_column: the header of the column to write the translated texts into (None to overwrite in place),
+                              "{column}" in it is replaced by the header of the source column
+        :param auto_detect: detect the source-language column if source_columns is None, by the header first
+                            (e.g. "zh-CN"), then by the script of the cells
+        :param detect_ratio: the min ratio of the cells in the source language for a column to be detected
+        :param detect_sample_size: the number of cells of every column checked when detecting
+        """
+        self.source_columns = source_columns
+        self.sheets = sheets
+        self.target_column = target_column
+        self.auto_detect = auto_detect
+        self.detect_ratio = detect_ratio
+        self.detect_sample_size = detect_sample_size
+
+    def select_sheet(self, sheet_name: str) -> bool:
+        """
+        :param sheet_name: the name of the sheet
+        :return: True if the sheet is to be translated
+        """
+        return self.sheets is None or sheet_name in self.sheets
+
+    def select_columns(self, headers: list, columns_values: list, source_language_code: str) -> list:
+        """
+        :param headers: the headers of the columns
+        :param columns_values: the values of every column (without the header), used to detect the source language
+        :param source_language_code: source language code
+        :return: the positions of the columns to translate
+        """
+        headers = [str(header) if header is not None else "" for header in headers]
+        if self.source_columns is not None:
+            return [position for position, header in enumerate(headers) if header in self.source_columns]
+        if not self.auto_detect:
+            return list(range(len(headers)))
+
+        # 按表头识别
+        aliases = {alias.lower() for alias in LANGUAGE_HEADER_DICT.get(source_language_code, [])}
+        aliases.add(str(source_language_code).lower())
+        positions = [position for position, header in enumerate(headers) if header.strip().lower() in aliases]
+        if len(positions) > 0:
+            return positions
+
+        # 按单元格的文字识别，取源语言比例最高的一列
+        best_position, best_ratio = None, 0.0
+        for position, values in enumerate(columns_values):
+            texts = [value for value in values if isinstance(value, str)][:self.detect_sample_size]
+            if len(texts) == 0:
+                continue
+            ratio = sum(1 for text in texts if is_source_language_text(text, source_language_code)) / len(texts)
+            if ratio > best_ratio:
+                best_position, best_ratio = position, ratio
+        if best_position is None or best_ratio < self.detect_ratio:
+            return []
+        return [best_position]
+
+    def select_dataframe_columns(self, df, source_language_code: str) -> tuple:
+        """
+        :param df: the DataFrame loaded from the source file (the header is df.columns)
+        :param source_language_code: source language code
+        :return: (the positions of the columns to translate, {source position: target position},
+                  {new target position: header})
+        """
+        headers = list(df.columns)
+        columns_values = [df.iloc[:self.detect_sample_size, position].tolist() for position in range(len(headers))]
+        positions = self.select_columns(headers, columns_values, source_language_code)
+        column_map, new_headers = self.get_target_positions(headers, positions)
+        return positions, column_map, new_headers
+
+    def get_target_column(self, source_column: str) -> str:
+        """
+        :param source_column: the header of the source column
+        :return: the header of the target column (None to overwrite in place)
+        """
+        if self.target_column is None:
+            return None
+        return self.target_column.replace("{column}", str(source_column))
+
+    def get_target_positions(self, headers: list, positions: list) -> tuple:
+        """
+        :param headers: the headers of the columns
+        :param positions: the positions of the columns to translate
+        :return: ({source position: target position}, {new target position: header}),
+                 the target columns not found in the headers are appended after the last column
+        """
+        headers = [str(header) if header is not None else "" for header in headers]
+        column_map = {}
+        new_headers = {}
+        for position in positions:
+            target_column = self.get_target_column(headers[position])
+            if target_column is None:
+                column_map[position] = position
+            elif target_column in headers:
+                column_map[position] = headers.index(target_column)
+            else:
+                headers.append(target_column)
+                new_headers[len(headers) - 1] = target_column
+                column_map[position] = len(headers) - 1
+        return column_map, new_headers
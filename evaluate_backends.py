@@ -0,0 +1,88 @@
+import difflib
+import logging
+import os
+import time
+
+import pandas as pd
+
+from preprocess import get_translatable_indexes
+from translate_with_custom_model import load_translator, translate_texts
+
+
+def read_test_texts(test_dir: str = "test", source_language_code: str = "zh-CN") -> list:
+    """
+    Collect the texts of the test fixtures (txt lines and csv/xlsx cells).
+    :param test_dir: the directory of the test fixtures
+    :param source_language_code: source language code
+    :return: the unique texts to translate
+    """
+    texts = []
+    for file_name in sorted(os.listdir(test_dir)):
+        file_path = os.path.join(test_dir, file_name)
+        if file_name.endswith(".txt"):
+            with open(file_path, "r", encoding="utf-8") as file_input:
+                texts.extend(line.rstrip("\n") for line in file_input)
+        elif file_name.endswith(".csv"):
+            texts.extend(pd.read_csv(file_path, header=None).stack().tolist())
+        elif file_name.endswith(".xlsx"):
+            for df in pd.read_excel(file_path, header=None, sheet_name=None).values():
+                texts.extend(df.stack().tolist())
+    texts = [texts[index] for index in get_translatable_indexes(texts, source_language_code)]
+    return list(dict.fromkeys(texts))
+
+
+def evaluate_backends(model_name: str,
+                      backends: tuple = ("int8", "onnx"),
+                      test_dir: str = "test",
+                      num_threads: int = None,
+                      batch_size: int = 16) -> dict:
+    """
+    Measure the speed and the accuracy of the optimized CPU backends against the fp32 torch model.
+    :param model_name: the name or path of the model
+    :param backends: the backends to compare with the fp32 model
+    :param test_dir: the directory of the test fixtures
+    :param num_threads: the number of intra-op threads on CPU (None for the torch default)
+    :param batch_size: the size of every batch of the texts sent to the model
+    :return: {backend: {"seconds", "speedup", "exact_match", "similarity", "differences"}}
+    """
+    texts = read_test_texts(test_dir)
+    report = {}
+    references = None
+    for backend in ("torch",) + tuple(backends):
+        try:
+            translator = load_translator(model_name, device="cpu", backend=backend, num_threads=num_threads)
+        except ImportError as e:
+            logging.warning("Backend {0} skipped: {1}".format(backend, str(e)))
+            continue
+        start_time = time.perf_counter()
+        texts_translated = translate_texts(texts, translator, batch_size=batch_size)
+        seconds = time.perf_counter() - start_time
+        del translator
+        if references is None:
+            references, reference_seconds = texts_translated, seconds
+
+        # 与fp32模型的译文对比：完全一致的比例与平均字符相似度
+        similarities = [difflib.SequenceMatcher(None, reference, text_translated).ratio()
+                        for reference, text_translated in zip(references, texts_translated)]
+        report[backend] = {
+            "seconds": seconds,
+            "speedup": reference_seconds / seconds if seconds > 0 else 0.0,
+            "exact_match": sum(1 for similarity in similarities if similarity == 1.0) / max(len(texts), 1),
+            "similarity": sum(similarities) / max(len(texts), 1),
+            "differences": [(text, reference, text_translated)
+                            for text, reference, text_translated in zip(texts, references, texts_translated)
+                            if reference != text_translated],
+        }
+        logging.info("{0}: {1:.2f}s ({2:.2f}x), exact match {3:.1%}, similarity {4:.3f}".format(
+            backend, seconds, report[backend]["speedup"], report[backend]["exact_match"],
+            report[backend]["similarity"]))
+    return report
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    model_name = r"D:\LongtuKoreaTranslationModel\fine-tuned-models\nllb-200-1.3B\zh2ko_0907"
+    report = evaluate_backends(model_name)
+    for backend, result in report.items():
+        for text, reference, text_translated in result["differences"]:
+            print("[{0}] {1}\n  fp32: {2}\n  {0}: {3}".format(backend, text, reference, text_translated))
@@ -0,0 +1,162 @@
+import copy
+import itertools
+import xml.etree.ElementTree as ElementTree
+
+from PyQt5.QtCore import pyqtSignal
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+from column_selector import ColumnSelector
+from preprocess import get_translatable_indexes, merge_deduplication_stats, translate_deduplicated
+from settings import EXCEL_STREAMING_CHUNK_SIZE
+
+SHEET_MAIN_NAMESPACE = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+def _read_sheet_layout(worksheet) -> tuple:
+    """
+    Read the column widths and the merged ranges of a read-only worksheet, which openpyxl skips in read-only mode.
+    The sheet xml is parsed incrementally, so the memory stays constant.
+    :param worksheet: openpyxl ReadOnlyWorksheet
+    :return: ([(min column, max column, width, hidden)], [merged range string])
+    """
+    columns = []
+    merged_ranges = []
+    # 只读模式不会解析列宽与合并单元格，这里单独扫描一遍sheet的xml
+    with worksheet._get_source() as source:
+        for _, element in ElementTree.iterparse(source):
+            if element.tag == SHEET_MAIN_NAMESPACE + "col":
+                width = element.get("width")
+                columns.append((int(element.get("min")), int(element.get("max")),
+                                float(width) if width is not None else None,
+                                element.get("hidden") in ("1", "true")))
+            elif element.tag == SHEET_MAIN_NAMESPACE + "mergeCell":
+                merged_ranges.append(element.get("ref"))
+            elif element.tag == SHEET_MAIN_NAMESPACE + "row":
+                element.clear()
+    return columns, merged_ranges
+
+
+def _copy_cell(worksheet_target, cell, value):
+    """
+    :param worksheet_target: openpyxl WriteOnlyWorksheet
+    :param cell: the source cell of a read-only worksheet
+    :param value: the value of the target cell
+    :return: a write-only cell with the value and the style of the source cell
+    """
+    if not getattr(cell, "has_style", False):
+        return value
+    cell_target = WriteOnlyCell(worksheet_target, value=value)
+    cell_target.font = copy.copy(cell.font)
+    cell_target.fill = copy.copy(cell.fill)
+    cell_target.border = copy.copy(cell.border)
+    cell_target.alignment = copy.copy(cell.alignment)
+    cell_target.protection = copy.copy(cell.protection)
+    cell_target.number_format = cell.number_format
+    return cell_target
+
+
+def translate_workbook_streaming(file_path_source: str,
+                                 file_path_target: str,
+                                 translate_function,
+                                 progress_bar_init: pyqtSignal(int) = None,
+                                 progress_bar_num: pyqtSignal(int) = None,
+                                 chunk_size: int = EXCEL_STREAMING_CHUNK_SIZE,
+                                 column_selector: ColumnSelector = None,
+                                 source_language_code: str = None) -> dict:
+    """
+    Translate a large xlsx workbook with constant memory: the source is read in read-only mode,
+    translated every chunk_size rows and written sheet by sheet into a write-only workbook.
+    Cell styles, column widths and merged ranges are kept, other sheet features (charts, images, ...) are not.
+    :param file_path_source: source file path
+    :param file_path_target: target file path
+    :param translate_function: a function that translates a text list and returns the translated list
+    :param progress_bar_init: signal to init the progressbar
+    :param progress_bar_num: signal to update the value of progressbar
+    :param chunk_size: the number of rows translated at a time
+    :param column_selector: the sheets/columns to translate (None to translate every cell)
+    :param source_language_code: source language code (used to detect the source-language column and to skip
+                                 the cells not in the source language)
+    :return: the deduplication stats of the workbook
+    """
+    workbook_source = load_workbook(filename=file_path_source, read_only=True)
+    workbook_target = Workbook(write_only=True)
+    deduplication_stats = None
+
+    # 进度条（按行计算，行数取自sheet的dimension信息）
+    if progress_bar_init is not None:
+        progress_bar_init.emit(sum(worksheet.max_row or 0 for worksheet in workbook_source.worksheets))
+    len_rows_finished = 0
+
+    for worksheet_source in workbook_source.worksheets:
+        worksheet_target = workbook_target.create_sheet(title=worksheet_source.title)
+        columns, merged_ranges = _read_sheet_layout(worksheet_source)
+        # 列宽必须在写入单元格之前设置
+        for min_column, max_column, width, hidden in columns:
+            column_dimension = worksheet_target.column_dimensions[get_column_letter(min_column)]
+            column_dimension.min, column_dimension.max = min_column, max_column
+            column_dimension.width = width
+            column_dimension.hidden = hidden
+
+        # 列选择在读到第一块时确定，表头行不翻译
+        positions, column_map, new_headers = None, {}, {}
+        if column_selector is not None and not column_selector.select_sheet(worksheet_source.title):
+            positions = []
+        is_header_chunk = column_selector is not None
+        rows = worksheet_source.iter_rows()
+        while True:
+            rows_chunk = list(itertools.islice(rows, chunk_size))
+            if len(rows_chunk) == 0:
+                break
+            if column_selector is not None and positions is None:
+                headers = [cell.value for cell in rows_chunk[0]]
+                columns_values = [[row[position].value for row in rows_chunk[1:column_selector.detect_sample_size + 1]
+                                   if position < len(row)]
+                                  for position in range(len(headers))]
+                positions = column_selector.select_columns(headers, columns_values, source_language_code)
+                column_map, new_headers = column_selector.get_target_positions(headers, positions)
+
+            coordinates = []  # (row index in the chunk, column position)
+            for row_index, row in enumerate(rows_chunk):
+                if is_header_chunk and row_index == 0:
+                    continue
+                for position in (range(len(row)) if positions is None else positions):
+                    if position < len(row) and row[position].value is not None:
+                        coordinates.append((row_index, position))
+            # 数字、日期、ID、路径、占位符等单元格不翻译，原样保留
+            values = [rows_chunk[row_index][position].value for row_index, position in coordinates]
+            indexes = get_translatable_indexes(values, source_language_code)
+            texts = [values[index] for index in indexes]
+            texts_translated, deduplication_stats_chunk = translate_deduplicated(texts, translate_function)
+            deduplication_stats = merge_deduplication_stats(deduplication_stats, deduplication_stats_chunk)
+
+            # 按原顺序写回（写入目标列或原位置），写入目标列时未翻译的单元格照抄原文
+            texts_translated_dict = {(row_index, column_map.get(position, position)): value
+                                     for (row_index, position), value in zip(coordinates, values)}
+            for index, text_translated in zip(indexes, texts_translated):
+                row_index, position = coordinates[index]
+                texts_translated_dict[(row_index, column_map.get(position, position))] = text_translated
+            for row_index, row in enumerate(rows_chunk):
+                row_width = max([len(row)] + [position + 1 for position in new_headers])
+                values = []
+                for position in range(row_width):
+                    cell = row[position] if position < len(row) else None
+                    value = cell.value if cell is not None else None
+                    if is_header_chunk and row_index == 0:
+                        value = new_headers.get(position, value)
+                    value = texts_translated_dict.get((row_index, position), value)
+                    values.append(_copy_cell(worksheet_target, cell, value) if cell is not None else value)
+                worksheet_target.append(values)
+            is_header_chunk = False
+            len_rows_finished += len(rows_chunk)
+            if progress_bar_num is not None:
+                progress_bar_num.emit(len_rows_finished)
+
+        # 合并单元格在关闭sheet时写入
+        for merged_range in merged_ranges:
+            worksheet_target.merged_cells.add(merged_range)
+
+    workbook_target.save(filename=file_path_target)
+    workbook_source.close()
+    return deduplication_stats
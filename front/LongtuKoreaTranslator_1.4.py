@@ -3,64 +3,104 @@
 import functools
 import logging
 import os
+import threading
 
 from PyQt5 import QtCore, QtWidgets
 from PyQt5.QtCore import QThread, pyqtSignal
 
+from checkpoint import CheckpointJournal
+from job_queue import JobQueue
 from settings import GLOSSARY_DICT, PRIVATE_KEY_NAME, PROJECT_ID
-from translate import translate_texts, FileTranslateFactory
+from translate import translate_texts, FileTranslateFactory, get_job_key
+from translation_client import get_client
+from translation_memory import TranslationMemory
 
 logging.basicConfig(level=logging.DEBUG)
 
 
 class DocumentTranslateThread(QThread):
     progress_bar_setVisible = pyqtSignal(bool)
-    document_enabled = pyqtSignal(bool)
     progress_bar_init = pyqtSignal(int)
     progress_bar_updateNum = pyqtSignal(int)
+    documents_failed = pyqtSignal(str)
 
     def __init__(self,
-                 file_path_source: str,
+                 job_queue: JobQueue,
                  project_id: str,
-                 source_language_code: str,
-                 target_language_code: str,
-                 glossary_id: str = None
+                 translation_memory: TranslationMemory = None
                  ):
         """
-        :param file_path_source: your_source file path
+        :param job_queue: the persistent queue of the document jobs
         :param project_id: your project id
-        :param source_language_code: source language code
-        :param target_language_code: target language code
-        :param glossary_id: your glossary id
+        :param translation_memory: the translation memory shared with the main thread
         """
         super().__init__()
-        self.file_path = file_path_source
+        self.job_queue = job_queue
         self.project_id = project_id
-        self.source_language_code = source_language_code
-        self.target_language_code = target_language_code
-        self.glossary_id = glossary_id
+        self.translation_memory = translation_memory
         logging.debug("{0} successfully initialized.".format(self.__class__.__name__))
 
-    def run(self):
+    def translate_document(self,
+                           file_path_source: str,
+                           source_language_code: str,
+                           target_language_code: str,
+                           glossary_id: str = None):
+        file_type = os.path.splitext(file_path_source)[1].lstrip(".")
+        translator = FileTranslateFactory().create_document_translator(file_type)
+        # 断点日志：中断后重新翻译时跳过已完成的批次
+        checkpoint = CheckpointJournal(file_path_source,
+                                       get_job_key(source_language_code, target_language_code, glossary_id))
         try:
-            # 显示进度条、禁用按钮
-            self.progress_bar_setVisible.emit(True)
-            self.document_enabled.emit(False)
-            # 翻译文件
-            file_type = os.path.splitext(self.file_path)[1].lstrip(".")
-            translator = FileTranslateFactory().create_document_translator(file_type)
-            translator.translate(self.file_path,
+            translator.translate(file_path_source,
                                  self.project_id,
-                                 self.source_language_code,
-                                 self.target_language_code,
-                                 glossary_id=self.glossary_id,
+                                 source_language_code,
+                                 target_language_code,
+                                 glossary_id=glossary_id,
                                  progress_bar_init=self.progress_bar_init,
-                                 progress_bar_num=self.progress_bar_updateNum)
-            # 隐藏进度条、启用按钮
-            self.progress_bar_setVisible.emit(False)
-            self.document_enabled.emit(True)
+                                 progress_bar_num=self.progress_bar_updateNum,
+                                 translation_memory=self.translation_memory,
+                                 checkpoint=checkpoint)
+        except Exception:
+            checkpoint.close()
+            raise
+        checkpoint.remove()
+        return translator.usage
+
+    def run(self):
+        failed_documents = []
+        try:
+            # 显示进度条
+            self.progress_bar_setVisible.emit(True)
+            # 依次翻译队列中的文件，直到队列为空
+            while True:
+                job = self.job_queue.claim()
+                if job is None:
+                    break
+                job_id, file_path, params = job
+                try:
+                    logging.debug("Translating {0}.".format(file_path))
+                    usage = self.translate_document(file_path, **params)
+                except Exception as e:
+                    logging.error("Exception occurred: {0}".format(str(e)))
+                    self.job_queue.fail(job_id, str(e))
+                    failed_documents.append("{0}: {1}".format(os.path.basename(file_path), str(e)))
+                    continue
+                # 部分文本翻译失败时保留原文，文件照常输出
+                failed_texts = usage.get("failed_texts", 0)
+                if failed_texts > 0:
+                    error = "{0} texts failed and kept the source text".format(failed_texts)
+                    self.job_queue.finish(job_id, error)
+                    failed_documents.append("{0}: {1}".format(os.path.basename(file_path), error))
+                else:
+                    self.job_queue.finish(job_id)
         except Exception as e:
             logging.error("Exception occurred: {0}".format(str(e)))
+            failed_documents.append(str(e))
+        finally:
+            # 无论成功与否都隐藏进度条，并报告失败的文件
+            self.progress_bar_setVisible.emit(False)
+            if len(failed_documents) > 0:
+                self.documents_failed.emit("\n".join(failed_documents))
 
 
 class Ui_Dialog(object):
@@ -69,6 +109,11 @@ class Ui_Dialog(object):
         self.project_id = PROJECT_ID
         self.glossary_dict = GLOSSARY_DICT
         self.glossary_id = None
+        self.translation_memory = TranslationMemory()
+        # 文件翻译任务队列（持久化，程序重启后继续翻译未完成的文件）
+        self.job_queue = JobQueue("google")
+        # 后台预先建立翻译客户端（凭据与gRPC通道），首次翻译时无需等待
+        threading.Thread(target=get_client, daemon=True).start()
 
     def setupUi(self, Dialog):
 
@@ -118,6 +163,9 @@ class Ui_Dialog(object):
         self.glossaryComboBox.currentTextChanged.connect(self.glossary_selected)
         QtCore.QMetaObject.connectSlotsByName(Dialog)
 
+        # 继续翻译上次退出时未完成的文件
+        self.start_document_queue()
+
     def retranslateUi(self, Dialog):
         _translate = QtCore.QCoreApplication.translate
         Dialog.setWindowTitle(_translate("Dialog", "LongtuKoreaTranslator"))
@@ -137,47 +185,55 @@ class Ui_Dialog(object):
         lines = source_QTextEdit.toPlainText().split('\n')
         # filter
         lines = [line for line in lines if len(line) > 0]
-        text_translated = translate_texts(lines, self.project_id,
-                                          source_language_code,
-                                          target_language_code,
-                                          glossary_id=self.glossary_id)
+        text_translated = translate_texts(lines, self.project_id, source_language_code, target_language_code,
+                                          glossary_id=self.glossary_id,
+                                          translation_memory=self.translation_memory)
         text_translated = "\n".join(text_translated)
         target_QTextEdit.append(text_translated)
 
     def document_translate_clicked(self,
                                    source_language_code: str,
                                    target_language_code: str, ):
-        # 设置文件对话框参数并显示
+        # 设置文件对话框参数并显示（可多选，选中的文件依次排队翻译）
         options = QtWidgets.QFileDialog.Options()
         options |= QtWidgets.QFileDialog.ReadOnly
-        file_path, _ = QtWidgets.QFileDialog.getOpenFileName(None, "Select a file", "",
-                                                             "Excel Files (*.xlsx);;Text Files (*.txt);;CSV Files (*.csv);;TSV Files (*.tsv)",
-                                                             options=options)
+        file_paths, _ = QtWidgets.QFileDialog.getOpenFileNames(None, "Select files", "",
+                                                               "Excel Files (*.xlsx);;Text Files (*.txt);;CSV Files (*.csv);;TSV Files (*.tsv)",
+                                                               options=options)
         # 如果
-        if file_path == "":
+        if len(file_paths) == 0:
+            return
+        for file_path in file_paths:
+            self.job_queue.put(file_path, {"source_language_code": source_language_code,
+                                           "target_language_code": target_language_code,
+                                           "glossary_id": self.glossary_id})
+        self.start_document_queue()
+
+    def start_document_queue(self):
+        # 线程运行中会继续取出新加入的任务；线程结束时再检查一次队列，避免漏掉刚加入的任务
+        if self.document_translate_thread is not None and self.document_translate_thread.isRunning():
+            return
+        if self.job_queue.pending() == 0:
             return
-        else:
-            # 大坑解决：如果实例化这个线程类的时候没有定义为类变量而只是使用局部变量，则这个函数结束运行后会自动销毁，造成难以排查的bug。
-            self.document_translate_thread = DocumentTranslateThread(file_path,
-                                                                     self.project_id,
-                                                                     source_language_code,
-                                                                     target_language_code,
-                                                                     glossary_id=self.glossary_id)
-
-            self.document_translate_thread.progress_bar_setVisible.connect(self.setVisible_progress_bar)
-            self.document_translate_thread.document_enabled.connect(self.set_document_enabled)
-            self.document_translate_thread.progress_bar_init.connect(self.init_progress_bar)
-            self.document_translate_thread.progress_bar_updateNum.connect(self.updateNum_progress_bar)
-            logging.debug("Starting document translate thread.")
-            self.document_translate_thread.start()
+        # 大坑解决：如果实例化这个线程类的时候没有定义为类变量而只是使用局部变量，则这个函数结束运行后会自动销毁，造成难以排查的bug。
+        self.document_translate_thread = DocumentTranslateThread(self.job_queue,
+                                                                 self.project_id,
+                                                                 translation_memory=self.translation_memory)
+
+        self.document_translate_thread.progress_bar_setVisible.connect(self.setVisible_progress_bar)
+        self.document_translate_thread.progress_bar_init.connect(self.init_progress_bar)
+        self.document_translate_thread.progress_bar_updateNum.connect(self.updateNum_progress_bar)
+        self.document_translate_thread.documents_failed.connect(self.show_documents_failed)
+        self.document_translate_thread.finished.connect(self.start_document_queue)
+        logging.debug("Starting document translate thread.")
+        self.document_translate_thread.start()
+
+    def show_documents_failed(self, message: str):
+        QtWidgets.QMessageBox.warning(None, "LongtuKoreaTranslator", message)
 
     def setVisible_progress_bar(self, visible: bool):
         self.progressBar.setVisible(visible)
 
-    def set_document_enabled(self, enabled: bool):
-        self.chineseDocumentPushButton.setEnabled(enabled)
-        self.koreanDocumentPushButton.setEnabled(enabled)
-
     def init_progress_bar(self, max_num: int):
         # Initialize the progress bar
         self.progressBar.setMinimum(0)
@@ -2,54 +2,187 @@
 
 import functools
 import logging
+import multiprocessing
 import os
 
 from PyQt5 import QtCore, QtWidgets
 from PyQt5.QtCore import QThread, pyqtSignal
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline
+from transformers import pipeline
 
-from settings import GLOSSARY_DICT, PROJECT_ID
-from translate_with_custom_model import translate_texts, FileTranslateFactory
+from checkpoint import CheckpointJournal
+from glossary_engine import Glossary
+from glossary_index import GlossaryIndex
+from job_queue import JobQueue
+from model_pool import ModelProcessPool, ProcessPoolTranslator, get_pool_size
+from settings import GENERATION_PROFILE, GLOSSARY_DICT, MODEL_POOL_ENABLED, PROJECT_ID
+from translate_with_custom_model import (translate_texts, FileTranslateFactory, LanguagePairTranslator,
+                                         get_job_key, get_language_codes, get_source_language_code,
+                                         get_target_language_code, load_translator)
+from translation_memory import TranslationMemory
 
 logging.basicConfig(level=logging.DEBUG)
 
 
 class DocumentTranslateThread(QThread):
     progress_bar_setVisible = pyqtSignal(bool)
-    document_enabled = pyqtSignal(bool)
     progress_bar_init = pyqtSignal(int)
     progress_bar_updateNum = pyqtSignal(int)
+    documents_failed = pyqtSignal(str)
 
     def __init__(self,
-                 file_path_source: str,
-                 translator: pipeline
+                 job_queue: JobQueue,
+                 get_translator,
+                 glossary_index: GlossaryIndex,
+                 translation_memory: TranslationMemory = None
                  ):
         """
-        :param file_path_source: your_source file path
-        :param translator: transformers.pipeline
+        :param job_queue: the persistent queue of the document jobs
+        :param get_translator: a function that returns the translator of a translator name (e.g. "translator_zh2ko")
+        :param glossary_index: the local glossary index
+        :param translation_memory: the translation memory shared with the main thread
         """
         super().__init__()
-        self.file_path = file_path_source
-        self.translator = translator
+        self.job_queue = job_queue
+        self.get_translator = get_translator
+        self.glossary_index = glossary_index
+        self.translation_memory = translation_memory
         logging.debug("{0} successfully initialized.".format(self.__class__.__name__))
 
+    def translate_document(self,
+                           file_path_source: str,
+                           translator_name: str,
+                           glossary_id: str = None):
+        translator = self.get_translator(translator_name)
+        glossary = self.glossary_index.get_glossary(glossary_id,
+                                                    get_source_language_code(translator),
+                                                    get_target_language_code(translator))
+        file_type = os.path.splitext(file_path_source)[1].lstrip(".")
+        file_translator = FileTranslateFactory().create_document_translator(file_type)
+        # 断点日志：中断后重新翻译时跳过已完成的批次
+        checkpoint = CheckpointJournal(file_path_source, get_job_key(translator, glossary, GENERATION_PROFILE))
+        try:
+            file_translator.translate(file_path_source,
+                                      translator,
+                                      progress_bar_init=self.progress_bar_init,
+                                      progress_bar_num=self.progress_bar_updateNum,
+                                      translation_memory=self.translation_memory,
+                                      glossary=glossary,
+                                      generation_profile=GENERATION_PROFILE,
+                                      checkpoint=checkpoint)
+        except Exception:
+            checkpoint.close()
+            raise
+        checkpoint.remove()
+        return file_translator.usage
+
     def run(self):
+        failed_documents = []
         try:
-            # 显示进度条、禁用按钮
+            # 显示进度条
             self.progress_bar_setVisible.emit(True)
-            self.document_enabled.emit(False)
-            # 翻译文件
-            file_type = os.path.splitext(self.file_path)[1].lstrip(".")
-            file_translator = FileTranslateFactory().create_document_translator(file_type)
-            file_translator.translate(self.file_path,
-                                      self.translator,
-                                      progress_bar_init=self.progress_bar_init,
-                                      progress_bar_num=self.progress_bar_updateNum)
-            # 隐藏进度条、启用按钮
+            # 依次翻译队列中的文件，直到队列为空
+            while True:
+                job = self.job_queue.claim()
+                if job is None:
+                    break
+                job_id, file_path, params = job
+                try:
+                    logging.debug("Translating {0}.".format(file_path))
+                    usage = self.translate_document(file_path, **params)
+                except Exception as e:
+                    logging.error("Exception occurred: {0}".format(str(e)))
+                    self.job_queue.fail(job_id, str(e))
+                    failed_documents.append("{0}: {1}".format(os.path.basename(file_path), str(e)))
+                    continue
+                # 部分文本翻译失败时保留原文，文件照常输出
+                failed_texts = usage.get("failed_texts", 0)
+                if failed_texts > 0:
+                    error = "{0} texts failed and kept the source text".format(failed_texts)
+                    self.job_queue.finish(job_id, error)
+                    failed_documents.append("{0}: {1}".format(os.path.basename(file_path), error))
+                else:
+                    self.job_queue.finish(job_id)
+        except Exception as e:
+            logging.error("Exception occurred: {0}".format(str(e)))
+            failed_documents.append(str(e))
+        finally:
+            # 无论成功与否都隐藏进度条，并报告失败的文件
             self.progress_bar_setVisible.emit(False)
-            self.document_enabled.emit(True)
+            if len(failed_documents) > 0:
+                self.documents_failed.emit("\n".join(failed_documents))
+
+
+class ModelLoadThread(QThread):
+    model_loaded = pyqtSignal(object)
+
+    def __init__(self, model_name: str):
+        """
+        :param model_name: the name or path of the model
+        """
+        super().__init__()
+        self.model_name = model_name
+        logging.debug("{0} successfully initialized.".format(self.__class__.__name__))
+
+    def run(self):
+        # 加载失败时发送None
+        translator = None
+        try:
+            translator = load_translator(self.model_name)
+            logging.debug("Model {0} loaded on {1}.".format(self.model_name, translator.device))
         except Exception as e:
             logging.error("Exception occurred: {0}".format(str(e)))
+        self.model_loaded.emit(translator)
+
+
+class GlossaryIndexBuildThread(QThread):
+    glossary_index_built = pyqtSignal(bool)
+
+    def __init__(self, glossary_index: GlossaryIndex):
+        """
+        :param glossary_index: the local glossary index to (re)build
+        """
+        super().__init__()
+        self.glossary_index = glossary_index
+        logging.debug("{0} successfully initialized.".format(self.__class__.__name__))
+
+    def run(self):
+        # 构建失败时发送False（术语表不可用，其余功能照常）
+        built = False
+        try:
+            rebuilt = self.glossary_index.build()
+            logging.debug("Glossary index built, {0} glossaries rebuilt.".format(len(rebuilt)))
+            built = True
+        except Exception as e:
+            logging.warning("Glossary index not built: {0}".format(str(e)))
+        self.glossary_index_built.emit(built)
+
+
+class GlossaryLoadThread(QThread):
+    def __init__(self,
+                 glossary_index: GlossaryIndex,
+                 glossary_id: str,
+                 source_language_code: str,
+                 target_language_code: str):
+        """
+        :param glossary_index: the local glossary index
+        :param glossary_id: the glossary id to load
+        :param source_language_code: source language code
+        :param target_language_code: target language code
+        """
+        super().__init__()
+        self.glossary_index = glossary_index
+        self.glossary_id = glossary_id
+        self.source_language_code = source_language_code
+        self.target_language_code = target_language_code
+        logging.debug("{0} successfully initialized.".format(self.__class__.__name__))
+
+    def run(self):
+        # 加载后缓存在索引中，之后切换到该术语表只需查字典
+        try:
+            self.glossary_index.get_glossary(self.glossary_id, self.source_language_code, self.target_language_code)
+            logging.debug("Glossary {0} loaded.".format(self.glossary_id))
+        except Exception as e:
+            logging.warning("Glossary {0} not loaded: {1}".format(self.glossary_id, str(e)))
 
 
 class Ui_Dialog(object):
@@ -58,16 +191,20 @@ class Ui_Dialog(object):
         self.project_id = PROJECT_ID
         self.glossary_dict = GLOSSARY_DICT
         self.glossary_id = None
+        self.translation_memory = TranslationMemory()
+        # 文件翻译任务队列（持久化，模型加载后继续翻译上次未完成的文件）
+        self.job_queue = JobQueue("model")
+        # 本地术语表索引：在后台线程中只重建有变化的术语表（构建完成前术语表下拉框不可用），选中某个游戏时才加载该术语表
+        self.glossary_index = GlossaryIndex()
+        self.glossary_index_ready = False
+        self.glossary_index_build_thread = GlossaryIndexBuildThread(self.glossary_index)
+        self.glossary_load_thread = None
 
-        model_name = "models/nllb-200-1.3B/zh2ko_0907"
-        model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.translator_zh2ko = pipeline("translation", model=model, tokenizer=tokenizer,
-                                         src_lang="zho_Hans", tgt_lang="kor_Hang",
-                                         device="cuda:0")
-        self.translator_ko2zh = pipeline("translation", model=model, tokenizer=tokenizer,
-                                         src_lang="kor_Hang", tgt_lang="zho_Hans",
-                                         device="cuda:0")
+        # 模型在后台线程中加载，加载完成前翻译按钮不可用
+        self.translator_zh2ko = None
+        self.translator_ko2zh = None
+        self.model_pool = None
+        self.model_load_thread = ModelLoadThread("models/nllb-200-1.3B/zh2ko_0907")
 
     def setupUi(self, Dialog):
 
@@ -100,20 +237,37 @@ class Ui_Dialog(object):
         self.progressBar.setInvertedAppearance(False)
         self.progressBar.setObjectName("progressBar")
         self.progressBar.setVisible(False)
+        self.glossaryComboBox = QtWidgets.QComboBox(Dialog)
+        self.glossaryComboBox.setGeometry(QtCore.QRect(469, 540, 110, 40))
+        self.glossaryComboBox.setObjectName("glossaryComboBox")
+        self.glossaryComboBox.addItem("")
 
         self.retranslateUi(Dialog)
         self.Chinese2KoreanPushButton.clicked.connect(
-            functools.partial(self.text_translate_clicked, self.translator_zh2ko, self.chineseTextEdit,
+            functools.partial(self.text_translate_clicked, "translator_zh2ko", self.chineseTextEdit,
                               self.koreanTextEdit))  # type: ignore
         self.Korean2ChinesePushButton.clicked.connect(
-            functools.partial(self.text_translate_clicked, self.translator_ko2zh, self.koreanTextEdit,
+            functools.partial(self.text_translate_clicked, "translator_ko2zh", self.koreanTextEdit,
                               self.chineseTextEdit))  # type: ignore
         self.chineseDocumentPushButton.clicked.connect(
-            functools.partial(self.document_translate_clicked, self.translator_zh2ko))  # type: ignore
+            functools.partial(self.document_translate_clicked, "translator_zh2ko"))  # type: ignore
         self.koreanDocumentPushButton.clicked.connect(
-            functools.partial(self.document_translate_clicked, self.translator_ko2zh))  # type: ignore
+            functools.partial(self.document_translate_clicked, "translator_ko2zh"))  # type: ignore
+        self.glossaryComboBox.currentTextChanged.connect(self.glossary_selected)
         QtCore.QMetaObject.connectSlotsByName(Dialog)
 
+        # 模型加载期间进度条显示为忙碌状态
+        self.set_translate_enabled(False)
+        self.init_progress_bar(0)
+        self.setVisible_progress_bar(True)
+        self.model_load_thread.model_loaded.connect(self.model_loaded)
+        logging.debug("Starting model load thread.")
+        self.model_load_thread.start()
+        self.glossaryComboBox.setEnabled(False)
+        self.glossary_index_build_thread.glossary_index_built.connect(self.glossary_index_built)
+        logging.debug("Starting glossary index build thread.")
+        self.glossary_index_build_thread.start()
+
     def retranslateUi(self, Dialog):
         _translate = QtCore.QCoreApplication.translate
         Dialog.setWindowTitle(_translate("Dialog", "LongtuKoreaTranslator"))
@@ -121,44 +275,92 @@ class Ui_Dialog(object):
         self.Korean2ChinesePushButton.setText(_translate("Dialog", "한 -> 中"))
         self.chineseDocumentPushButton.setText(_translate("Dialog", "文件"))
         self.koreanDocumentPushButton.setText(_translate("Dialog", "파일"))
+        self.glossaryComboBox.setItemText(0, _translate("Dialog", "术语表/용어집"))
+        self.glossaryComboBox.addItems(self.glossary_dict.keys())
 
     def text_translate_clicked(self,
-                               translator: pipeline,
+                               translator_name: str,
                                source_QTextEdit: QtWidgets.QTextEdit,
                                target_QTextEdit: QtWidgets.QTextEdit):
+        translator = getattr(self, translator_name)
         target_QTextEdit.clear()
         lines = source_QTextEdit.toPlainText().split('\n')
         # filter
         lines = [line for line in lines if len(line) > 0]
-        text_translated = translate_texts(lines, translator)
+        text_translated = translate_texts(lines, translator, translation_memory=self.translation_memory,
+                                          glossary=self.get_glossary(translator),
+                                          generation_profile=GENERATION_PROFILE)
         text_translated = "\n".join(text_translated)
         target_QTextEdit.append(text_translated)
 
     def document_translate_clicked(self,
-                                   translator: pipeline):
-        # 设置文件对话框参数并显示
+                                   translator_name: str):
+        # 设置文件对话框参数并显示（可多选，选中的文件依次排队翻译）
         options = QtWidgets.QFileDialog.Options()
         options |= QtWidgets.QFileDialog.ReadOnly
-        file_path, _ = QtWidgets.QFileDialog.getOpenFileName(None, "Select a file", "",
-                                                             "Excel Files (*.xlsx);;Text Files (*.txt);;CSV Files (*.csv);;TSV Files (*.tsv)",
-                                                             options=options)
+        file_paths, _ = QtWidgets.QFileDialog.getOpenFileNames(None, "Select files", "",
+                                                               "Excel Files (*.xlsx);;Text Files (*.txt);;CSV Files (*.csv);;TSV Files (*.tsv)",
+                                                               options=options)
         # 如果
-        if file_path == "":
+        if len(file_paths) == 0:
+            return
+        for file_path in file_paths:
+            self.job_queue.put(file_path, {"translator_name": translator_name, "glossary_id": self.glossary_id})
+        self.start_document_queue()
+
+    def start_document_queue(self):
+        # 线程运行中会继续取出新加入的任务；线程结束时再检查一次队列，避免漏掉刚加入的任务
+        if self.document_translate_thread is not None and self.document_translate_thread.isRunning():
+            return
+        # 模型与术语表索引都就绪后才开始翻译文件
+        if self.translator_zh2ko is None or not self.glossary_index_ready:
             return
-        else:
-            # 大坑解决：如果实例化这个线程类的时候没有定义为类变量而只是使用局部变量，则这个函数结束运行后会自动销毁，造成难以排查的bug。
-            self.document_translate_thread = DocumentTranslateThread(file_path, translator)
+        if self.job_queue.pending() == 0:
+            return
+        # 大坑解决：如果实例化这个线程类的时候没有定义为类变量而只是使用局部变量，则这个函数结束运行后会自动销毁，造成难以排查的bug。
+        self.document_translate_thread = DocumentTranslateThread(self.job_queue,
+                                                                 self.get_document_translator,
+                                                                 self.glossary_index,
+                                                                 translation_memory=self.translation_memory)
+
+        self.document_translate_thread.progress_bar_setVisible.connect(self.setVisible_progress_bar)
+        self.document_translate_thread.progress_bar_init.connect(self.init_progress_bar)
+        self.document_translate_thread.progress_bar_updateNum.connect(self.updateNum_progress_bar)
+        self.document_translate_thread.documents_failed.connect(self.show_documents_failed)
+        self.document_translate_thread.finished.connect(self.start_document_queue)
+        logging.debug("Starting document translate thread.")
+        self.document_translate_thread.start()
 
-            self.document_translate_thread.progress_bar_setVisible.connect(self.setVisible_progress_bar)
-            self.document_translate_thread.document_enabled.connect(self.set_document_enabled)
-            self.document_translate_thread.progress_bar_init.connect(self.init_progress_bar)
-            self.document_translate_thread.progress_bar_updateNum.connect(self.updateNum_progress_bar)
-            logging.debug("Starting document translate thread.")
-            self.document_translate_thread.start()
+    def show_documents_failed(self, message: str):
+        QtWidgets.QMessageBox.warning(None, "LongtuKoreaTranslator", message)
 
     def setVisible_progress_bar(self, visible: bool):
         self.progressBar.setVisible(visible)
 
+    def set_translate_enabled(self, enabled: bool):
+        self.Chinese2KoreanPushButton.setEnabled(enabled)
+        self.Korean2ChinesePushButton.setEnabled(enabled)
+        self.set_document_enabled(enabled)
+
+    def model_loaded(self, translator: pipeline):
+        self.setVisible_progress_bar(False)
+        if translator is None:
+            return
+        # 两个方向共用同一个模型
+        self.translator_zh2ko = LanguagePairTranslator(translator, "zho_Hans", "kor_Hang")
+        self.translator_ko2zh = LanguagePairTranslator(translator, "kor_Hang", "zho_Hans")
+        self.set_translate_enabled(True)
+        # 加载模型加载期间选中的术语表
+        self.load_glossary()
+        # 继续翻译上次退出时未完成的文件
+        self.start_document_queue()
+
+    def glossary_index_built(self, built: bool):
+        self.glossary_index_ready = True
+        self.glossaryComboBox.setEnabled(built)
+        # 继续翻译上次退出时未完成的文件（如果模型已经加载完成）
+        self.start_document_queue()
+
     def set_document_enabled(self, enabled: bool):
         self.chineseDocumentPushButton.setEnabled(enabled)
         self.koreanDocumentPushButton.setEnabled(enabled)
@@ -173,15 +375,65 @@ class Ui_Dialog(object):
         # Update Progress Bar
         self.progressBar.setValue(value)
 
+    def get_document_translator(self, translator_name: str):
+        translator = getattr(self, translator_name)
+        if not MODEL_POOL_ENABLED or translator.translator.device.type != "cpu":
+            return translator
+        # CPU上的文件翻译交给多进程模型池（第一次翻译文件时启动）
+        if self.model_pool is None:
+            # 界面已加载的模型也计入模型池的内存上限；一个工作进程都容纳不下时，直接使用界面已加载的模型
+            num_workers = get_pool_size(self.model_load_thread.model_name, loaded_copies=1)
+            if num_workers < 1:
+                logging.warning("MODEL_POOL_MAX_MEMORY leaves no room for a model worker, translating in-process.")
+                return translator
+            self.model_pool = ModelProcessPool(self.model_load_thread.model_name, num_workers=num_workers,
+                                               loaded_copies=1)
+        src_lang, tgt_lang = get_language_codes(translator)
+        return ProcessPoolTranslator(self.model_pool, src_lang, tgt_lang)
+
+    def shutdown(self):
+        # 退出时停止模型池的工作进程
+        if self.model_pool is not None:
+            self.model_pool.close()
+            self.model_pool = None
+
+    def get_glossary(self, translator: pipeline) -> Glossary:
+        return self.glossary_index.get_glossary(self.glossary_id,
+                                                get_source_language_code(translator),
+                                                get_target_language_code(translator))
+
+    def glossary_selected(self):
+        self.glossary_id = self.glossary_dict.get(self.glossaryComboBox.currentText(), None)
+        self.load_glossary()
+
+    def load_glossary(self):
+        # 第一次选中某个术语表时需要从索引反序列化（"全部"约0.5秒），放到后台线程中，界面不卡顿；
+        # 加载中再次切换时，等当前加载结束后再加载最后选中的术语表
+        if self.translator_zh2ko is None or self.glossary_id is None:
+            return
+        if self.glossary_load_thread is not None and (self.glossary_load_thread.isRunning()
+                                                      or self.glossary_load_thread.glossary_id == self.glossary_id):
+            return
+        self.glossary_load_thread = GlossaryLoadThread(self.glossary_index,
+                                                       self.glossary_id,
+                                                       get_source_language_code(self.translator_zh2ko),
+                                                       get_target_language_code(self.translator_zh2ko))
+        self.glossary_load_thread.finished.connect(self.load_glossary)
+        self.glossary_load_thread.start()
+
 
 if __name__ == "__main__":
     import sys
 
+    # 打包后的程序启动模型池的工作进程时需要
+    multiprocessing.freeze_support()
+
     # GUI程序
 
     app = QtWidgets.QApplication(sys.argv)
     Dialog = QtWidgets.QDialog()
     ui = Ui_Dialog()
     ui.setupUi(Dialog)
+    app.aboutToQuit.connect(ui.shutdown)
     Dialog.show()
     sys.exit(app.exec_())
@@ -1,8 +1,37 @@
+import hashlib
+import json
+import logging
 import os
+import time
 
+from google.api_core import exceptions as google_exceptions
 from google.cloud import translate_v3 as translate
 
 from settings import *
+from rate_limit import AdaptiveRateLimiter
+from translation_client import get_client, get_rate_limiter
+
+# The state of the last sync (the local content hash, the input uri and the entry count of every glossary)
+SYNC_STATE_PATH = "sync_state.json"
+
+
+def call_api(rate_limiter: AdaptiveRateLimiter, function, **kwargs):
+    """Call a glossary method of the client within a rate limit.
+
+    Args:
+        rate_limiter: The rate limiter (usually get_rate_limiter(project_id), shared by all the translators).
+        function: The method of the client (e.g. client.create_glossary).
+        **kwargs: The arguments of the method.
+
+    Returns:
+        The return value of the method.
+    """
+    rate_limiter.acquire()
+    try:
+        return function(**kwargs)
+    except google_exceptions.ResourceExhausted:
+        rate_limiter.report_quota_exceeded()
+        raise
 
 
 def create_glossary(
@@ -23,7 +52,7 @@ def create_glossary(
     :param timeout:
     :return:
     """
-    client = translate.TranslationServiceClient()
+    client = get_client()
 
     # Supported language codes: https://cloud.google.com/translate/docs/languages
     location = "us-central1"  # The location of the glossary
@@ -44,7 +73,7 @@ def create_glossary(
     parent = f"projects/{project_id}/locations/{location}"
     # glossary is a custom dictionary Translation API uses
     # to translate the domain-specific terminology.
-    operation = client.create_glossary(parent=parent, glossary=glossary)
+    operation = call_api(get_rate_limiter(project_id), client.create_glossary, parent=parent, glossary=glossary)
 
     result = operation.result(timeout)
     print(f"Created: {result.name}")
@@ -64,14 +93,14 @@ def list_glossaries(
     Returns:
         The glossary.
     """
-    client = translate.TranslationServiceClient()
+    client = get_client()
 
     location = "us-central1"
 
     parent = f"projects/{project_id}/locations/{location}"
 
     # Iterate over all results
-    for glossary in client.list_glossaries(parent=parent):
+    for glossary in call_api(get_rate_limiter(project_id), client.list_glossaries, parent=parent):
         print(f"Name: {glossary.name}")
         print(f"Entry count: {glossary.entry_count}")
         print(f"Input uri: {glossary.input_config.gcs_source.input_uri}")
@@ -98,11 +127,11 @@ def get_glossary(
     Returns:
         The glossary.
     """
-    client = translate.TranslationServiceClient()
+    client = get_client()
 
     name = client.glossary_path(project_id, "us-central1", glossary_id)
 
-    response = client.get_glossary(name=name)
+    response = call_api(get_rate_limiter(project_id), client.get_glossary, name=name)
     print(f"Glossary name: {response.name}")
     print(f"Entry count: {response.entry_count}")
     print(f"Input URI: {response.input_config.gcs_source.input_uri}")
@@ -125,17 +154,189 @@ def delete_glossary(
     Returns:
         The glossary that was deleted.
     """
-    client = translate.TranslationServiceClient()
+    client = get_client()
 
     name = client.glossary_path(project_id, "us-central1", glossary_id)
 
-    operation = client.delete_glossary(name=name)
+    operation = call_api(get_rate_limiter(project_id), client.delete_glossary, name=name)
     result = operation.result(timeout)
     print(f"Deleted: {result.name}")
 
     return result
 
 
+def get_local_glossary_path(
+        glossary_id: str,
+        input_uri: str
+) -> str:
+    """
+    :param glossary_id: the glossary id
+    :param input_uri: the GCS uri of the glossary
+    :return: the local csv uploaded to the uri (the outputs of merge_xlsx_files.py)
+    """
+    if glossary_id == GLOSSARY_ID_ALL:
+        return "glossary_all.csv"
+    return os.path.join("output", os.path.basename(input_uri))
+
+
+def get_content_hash(file_path: str) -> str:
+    """
+    :param file_path: the path of the local glossary
+    :return: the sha256 of the file content, None if the file does not exist
+    """
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "rb") as file_input:
+        return hashlib.sha256(file_input.read()).hexdigest()
+
+
+def wait_operations(
+        operations: dict,
+        timeout: int = 180,
+        poll_interval: float = 2.0,
+) -> tuple:
+    """Poll long-running operations together until all of them are done.
+
+    Args:
+        operations: {glossary_id: the long-running operation}
+        timeout: The timeout for all the operations.
+        poll_interval: The interval between two polls in seconds.
+
+    Returns:
+        ({glossary_id: result}, {glossary_id: exception})
+    """
+    deadline = time.monotonic() + timeout
+    pending = dict(operations)
+    results, errors = {}, {}
+    while len(pending) > 0:
+        for glossary_id, operation in list(pending.items()):
+            if operation.done():
+                try:
+                    results[glossary_id] = operation.result()
+                except Exception as e:
+                    errors[glossary_id] = e
+                del pending[glossary_id]
+        if len(pending) == 0:
+            break
+        if time.monotonic() > deadline:
+            for glossary_id in pending:
+                errors[glossary_id] = TimeoutError("Operation on {0} timed out.".format(glossary_id))
+            break
+        time.sleep(poll_interval)
+    return results, errors
+
+
+def sync_glossaries(
+        project_id: str,
+        glossary_uri_dict: dict = GLOSSARY_GCS_URI_DICT,
+        language_code_list: list = ["zh-CN", "ko"],
+        client: translate.TranslationServiceClient = None,
+        rate_limiter: AdaptiveRateLimiter = None,
+        sync_state_path: str = SYNC_STATE_PATH,
+        timeout: int = 180,
+        poll_interval: float = 2.0,
+        dry_run: bool = False,
+) -> dict:
+    """Recreate only the glossaries that changed since the last sync.
+
+    A glossary is changed if it does not exist remotely, if its remote input uri or entry count differs from
+    the last sync, or if the content hash of its local csv differs from the last sync.
+    The local csv must already be uploaded to its GCS uri. The delete operations of all the changed glossaries
+    run concurrently, then the create operations, and every batch of operations is polled together.
+
+    Args:
+        project_id: The GCP project ID.
+        glossary_uri_dict: {glossary_id: input_uri} of the glossaries to sync.
+        language_code_list: The language codes of the glossaries.
+        client: The TranslationServiceClient (a fake client in tests, the shared client if None).
+        rate_limiter: The rate limiter of the API calls (a private limiter in tests, the shared limiter of
+            the project if None).
+        sync_state_path: The path of the sync state file.
+        timeout: The timeout for every batch of operations.
+        poll_interval: The interval between two polls in seconds.
+        dry_run: Only report the changed glossaries.
+
+    Returns:
+        {"created": [...], "deleted": [...], "unchanged": [...], "errors": {glossary_id: message}}
+    """
+    if client is None:
+        client = get_client()
+    if rate_limiter is None:
+        rate_limiter = get_rate_limiter(project_id)
+    location = "us-central1"
+    parent = f"projects/{project_id}/locations/{location}"
+
+    sync_state = {}
+    if os.path.exists(sync_state_path):
+        with open(sync_state_path, "r", encoding="utf-8") as file_input:
+            sync_state = json.load(file_input)
+    remote_glossaries = {glossary.name: glossary
+                         for glossary in call_api(rate_limiter, client.list_glossaries, parent=parent)}
+
+    # 对比本地内容hash与远端的输入uri、条目数
+    to_create, to_delete, unchanged = [], [], []
+    content_hashes = {}
+    for glossary_id, input_uri in glossary_uri_dict.items():
+        name = client.glossary_path(project_id, location, glossary_id)
+        content_hashes[glossary_id] = get_content_hash(get_local_glossary_path(glossary_id, input_uri))
+        remote_glossary = remote_glossaries.get(name)
+        # 第一次同步时，输入uri一致的远端术语表视为最新，只记录其状态
+        if glossary_id not in sync_state and remote_glossary is not None \
+                and remote_glossary.input_config.gcs_source.input_uri == input_uri:
+            sync_state[glossary_id] = {"input_uri": input_uri,
+                                       "entry_count": remote_glossary.entry_count,
+                                       "content_hash": content_hashes[glossary_id]}
+        state = sync_state.get(glossary_id, {})
+        if remote_glossary is not None \
+                and remote_glossary.input_config.gcs_source.input_uri == input_uri \
+                and remote_glossary.entry_count == state.get("entry_count") \
+                and content_hashes[glossary_id] in (None, state.get("content_hash")):
+            unchanged.append(glossary_id)
+            continue
+        if remote_glossary is not None:
+            to_delete.append(glossary_id)
+        to_create.append(glossary_id)
+    print(f"Changed: {to_create}")
+    print(f"Unchanged: {unchanged}")
+    summary = {"created": [], "deleted": [], "unchanged": unchanged, "errors": {}}
+    if dry_run:
+        return summary
+
+    # 并发删除，再并发创建，每批操作一起轮询
+    operations = {glossary_id: call_api(rate_limiter, client.delete_glossary,
+                                        name=client.glossary_path(project_id, location, glossary_id))
+                  for glossary_id in to_delete}
+    results, errors = wait_operations(operations, timeout, poll_interval)
+    summary["deleted"] = list(results.keys())
+    summary["errors"].update({glossary_id: str(e) for glossary_id, e in errors.items()})
+
+    operations = {}
+    for glossary_id in to_create:
+        if glossary_id in errors:
+            continue
+        glossary = translate.types.Glossary(
+            name=client.glossary_path(project_id, location, glossary_id),
+            language_codes_set=translate.types.Glossary.LanguageCodesSet(language_codes=language_code_list),
+            input_config=translate.types.GlossaryInputConfig(
+                gcs_source=translate.types.GcsSource(input_uri=glossary_uri_dict[glossary_id])),
+        )
+        operations[glossary_id] = call_api(rate_limiter, client.create_glossary, parent=parent, glossary=glossary)
+    results, errors = wait_operations(operations, timeout, poll_interval)
+    summary["errors"].update({glossary_id: str(e) for glossary_id, e in errors.items()})
+    for glossary_id, result in results.items():
+        summary["created"].append(glossary_id)
+        sync_state[glossary_id] = {"input_uri": glossary_uri_dict[glossary_id],
+                                   "entry_count": result.entry_count,
+                                   "content_hash": content_hashes[glossary_id]}
+        print(f"Created: {result.name} ({result.entry_count} entries)")
+    for glossary_id, message in summary["errors"].items():
+        logging.error("Failed to sync {0}: {1}".format(glossary_id, message))
+
+    with open(sync_state_path, "w", encoding="utf-8") as file_output:
+        json.dump(sync_state, file_output, ensure_ascii=False, indent=2)
+    return summary
+
+
 if __name__ == '__main__':
     # 设置环境变量
     private_key_path = os.path.abspath("../front/longtukoreatranslator_key.json")
@@ -144,6 +345,4 @@ if __name__ == '__main__':
     # get_glossary(PROJECT_ID, GLOSSARY_ID_ALL)  # 获取有关术语表的信息
     # delete_glossary(PROJECT_ID, GLOSSARY_ID_TEA_WANG)  # 删除术语表（list_glossaries操作中，Name中最后一个下划线后的就是glossary_id）
     # create_glossary(PROJECT_ID, INPUT_URI_GCS, GLOSSARY_ID_TEA_WANG, ["zh-CN", "ko"])  # 创建术语表（高级版）
-    # for glossary_id, gcs_uri in GLOSSARY_GCS_URI_DICT.items():
-    #     delete_glossary(PROJECT_ID, glossary_id)
-    #     create_glossary(PROJECT_ID, gcs_uri, glossary_id, ["zh-CN", "ko"])
+    # sync_glossaries(PROJECT_ID)  # 只重建有变化的术语表（并发执行删除与创建）
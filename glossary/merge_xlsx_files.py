@@ -1,39 +1,167 @@
+import hashlib
+import json
+import logging
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
+import pyarrow  # noqa: F401 feather/parquet输出需要pyarrow，缺少时在开始合并前就报错
 from tqdm import tqdm
 
 INPUT_DIR = "input/"
 OUTPUT_DIR = "output/"
 LANGUAGE_LIST = ["zh-CN", "zh-TW", "en", "ko", "ja", "th", "pt", "id", "vi"]
+# the manifest of the parsed input files (mtime, size and hash), only the changed files are parsed again
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, "manifest.json")
 
-df_all = pd.DataFrame()
-for dir_path, dir_names, file_names in os.walk(INPUT_DIR):
-    for file_name in tqdm(file_names, desc=dir_path):
-        if file_name.endswith(".xlsx"):
-            # get file path
-            file_path = os.path.join(dir_path, file_name)
-            # read files
-            df = pd.read_excel(file_path)
-            languages = [language for language in LANGUAGE_LIST if language in df.columns]
-            df = df[languages]
-            # tag the source file
-            df["source"] = file_name
-            # combine the output file path
-            output_file = re.sub(INPUT_DIR, OUTPUT_DIR, file_path)
-            output_file = re.sub(".xlsx", ".csv", output_file)
-            # create directory
-            output_directory = os.path.dirname(output_file)
-            os.makedirs(output_directory, exist_ok=True)
-            # save
-            df.to_csv(output_file, index=False)
-            # merge
-            df_all = pd.concat([df_all, df], axis=0, ignore_index=True)
+
+def get_file_hash(file_path: str) -> str:
+    """
+    :param file_path: the path of the file
+    :return: the sha256 of the file content
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file_input:
+        for block in iter(lambda: file_input.read(1024 * 1024), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def get_output_paths(file_path: str) -> tuple:
+    """
+    :param file_path: the path of an input xlsx file
+    :return: (the path of the csv output, the path of the parsed DataFrame cache)
+    """
+    output_file = re.sub(INPUT_DIR, OUTPUT_DIR, file_path)
+    output_file = re.sub(".xlsx", ".csv", output_file)
+    return output_file, os.path.splitext(output_file)[0] + ".pkl"
+
+
+def parse_xlsx_file(file_path: str) -> pd.DataFrame:
+    """
+    Parse a glossary xlsx file, save it as csv and cache the parsed DataFrame (run in a worker process).
+    :param file_path: the path of an input xlsx file
+    :return: the language columns of the glossary, with the column "source" (the file name)
+    """
+    # read files
+    df = pd.read_excel(file_path)
+    languages = [language for language in LANGUAGE_LIST if language in df.columns]
+    df = df[languages]
+    # tag the source file
+    df["source"] = os.path.basename(file_path)
+    # combine the output file path
+    output_file, cache_file = get_output_paths(file_path)
+    # create directory
+    output_directory = os.path.dirname(output_file)
+    os.makedirs(output_directory, exist_ok=True)
+    # save
+    df.to_csv(output_file, index=False)
+    df.to_pickle(cache_file)
+    return df
+
+
+def load_manifest(manifest_path: str = MANIFEST_PATH) -> dict:
+    """
+    :param manifest_path: the path of the manifest
+    :return: {input file path: {"mtime", "size", "hash"}}
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as file_input:
+        return json.load(file_input)
+
+
+def save_manifest(manifest: dict, manifest_path: str = MANIFEST_PATH) -> None:
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as file_output:
+        json.dump(manifest, file_output, ensure_ascii=False, indent=2)
+
+
+def get_changed_files(file_paths: list, manifest: dict) -> list:
+    """
+    :param file_paths: the paths of the input xlsx files
+    :param manifest: the manifest of the last run, updated in place
+    :return: the files that are new or modified since the last run
+    """
+    changed_files = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        entry = manifest.get(file_path)
+        cache_file = get_output_paths(file_path)[1]
+        # mtime与大小没变则认为没变；否则再比较hash（只是被touch过的文件不必重新解析）
+        if entry is not None and os.path.exists(cache_file):
+            if entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                continue
+            file_hash = get_file_hash(file_path)
+            if entry["hash"] == file_hash:
+                entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+                continue
+        else:
+            file_hash = get_file_hash(file_path)
+        manifest[file_path] = {"mtime": stat.st_mtime, "size": stat.st_size, "hash": file_hash}
+        changed_files.append(file_path)
+    return changed_files
+
+
+def merge_xlsx_files(input_dir: str = INPUT_DIR, max_workers: int = None) -> pd.DataFrame:
+    """
+    Merge the glossary xlsx files into glossary_all.(xlsx|csv|feather|parquet).
+    The changed files are parsed in a process pool, the unchanged ones are loaded from the cache of the last run.
+    :param input_dir: the directory of the glossary xlsx files
+    :param max_workers: the number of the worker processes (None for the number of CPUs)
+    :return: the merged glossary
+    """
+    file_paths = []
+    for dir_path, dir_names, file_names in os.walk(input_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith(".xlsx"):
+                # get file path
+                file_paths.append(os.path.join(dir_path, file_name))
+
+    manifest = load_manifest()
+    # 已删除的文件从清单中移除
+    is_removed = any(file_path not in file_paths for file_path in manifest)
+    manifest = {file_path: entry for file_path, entry in manifest.items() if file_path in file_paths}
+    changed_files = get_changed_files(file_paths, manifest)
+    logging.info("{0} of {1} glossary files changed.".format(len(changed_files), len(file_paths)))
+
+    dfs = {}
+    if len(changed_files) > 0:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for file_path, df in tqdm(zip(changed_files, executor.map(parse_xlsx_file, changed_files)),
+                                      total=len(changed_files), desc="parse"):
+                dfs[file_path] = df
+    for file_path in file_paths:
+        if file_path not in dfs:
+            dfs[file_path] = pd.read_pickle(get_output_paths(file_path)[1])
+
+    # 只在最后拼接一次
+    df_all = pd.concat([dfs[file_path] for file_path in file_paths], axis=0, ignore_index=True)
     # move column "source" to the end
     df_all["source"] = df_all.pop("source")
 
-# excel文件输出
-df_all.to_excel(os.path.join(INPUT_DIR, "../glossary_all.xlsx"), index=False)
-# csv文件输出
-df_all.to_csv(os.path.join(INPUT_DIR, "../glossary_all.csv"), index=False)
+    output_path = os.path.join(input_dir, "../glossary_all")
+    if len(changed_files) > 0 or is_removed or not all(os.path.exists(output_path + extension) for extension in
+                                                          (".xlsx", ".csv", ".feather", ".parquet")):
+        # excel文件输出
+        df_all.to_excel(output_path + ".xlsx", index=False)
+        # csv文件输出
+        df_all.to_csv(output_path + ".csv", index=False)
+        # 列式存储输出（读取比csv/xlsx快得多，需要pyarrow）
+        # 混合类型的列（如数字与文字混排）统一存为字符串
+        df_columnar = df_all.copy()
+        for column in df_columnar.columns:
+            if df_columnar[column].dtype == object:
+                df_columnar[column] = df_columnar[column].where(df_columnar[column].isna(),
+                                                                df_columnar[column].astype(str))
+        df_columnar.to_feather(output_path + ".feather")
+        df_columnar.to_parquet(output_path + ".parquet", index=False)
+    save_manifest(manifest)
+    return df_all
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    merge_xlsx_files()
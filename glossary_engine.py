@@ -0,0 +1,135 @@
+import re
+
+import pandas as pd
+
+from settings import GLOSSARY_MIN_TERM_LENGTH
+
+# 术语占位符，翻译后替换为目标语言的术语（模型可能在占位符内插入空格，还原时放宽匹配）
+PLACEHOLDER_FORMAT = "<glossary_id={0}>"
+PLACEHOLDER_PATTERN = re.compile(r"<\s*glossary_id\s*=\s*(\d+)\s*>")
+
+
+class Glossary:
+    """
+    Local glossary for the custom model path.
+    The source terms are compiled into an Aho-Corasick automaton, so that every text is scanned once
+    for the longest matching terms no matter how many terms the glossary has.
+    """
+
+    def __init__(self, terms: list, fingerprint: str = ""):
+        """
+        :param terms: [(source term, target term)]
+        :param fingerprint: the id of the glossary content (used as the glossary id of the translation memory)
+        """
+        self.source_terms = [source_term for source_term, _ in terms]
+        self.target_terms = [target_term for _, target_term in terms]
+        self.fingerprint = fingerprint
+        self._build_automaton()
+
+    def _build_automaton(self) -> None:
+        # goto表、失败指针、每个状态结束的(术语长度, 术语id)
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        for term_id, term in enumerate(self.source_terms):
+            state = 0
+            for character in term:
+                if character not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append([])
+                    self._goto[state][character] = len(self._goto) - 1
+                state = self._goto[state][character]
+            self._outputs[state].append((len(term), term_id))
+
+        # 按层次遍历构造失败指针，并合并后缀状态的输出
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for character, next_state in self._goto[state].items():
+                fail_state = self._fail[state]
+                while fail_state != 0 and character not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(character, 0)
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+                queue.append(next_state)
+
+    def find_terms(self, text: str) -> list:
+        """
+        Find the terms in the text, leftmost-longest and without overlap.
+        :param text: the text to search
+        :return: [(start, end, term id)] in order
+        """
+        matches = []
+        state = 0
+        for index, character in enumerate(text):
+            while state != 0 and character not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(character, 0)
+            for length, term_id in self._outputs[state]:
+                matches.append((index + 1 - length, index + 1, term_id))
+        # 起点靠前者优先，同起点时长者优先
+        matches.sort(key=lambda match: (match[0], match[0] - match[1]))
+        selected = []
+        end = 0
+        for match in matches:
+            if match[0] >= end:
+                selected.append(match)
+                end = match[1]
+        return selected
+
+    def mask(self, text: str) -> str:
+        """
+        :param text: the source text
+        :return: the text with the terms replaced by placeholders
+        """
+        pieces = []
+        end = 0
+        for start, term_end, term_id in self.find_terms(text):
+            pieces.append(text[end:start])
+            pieces.append(PLACEHOLDER_FORMAT.format(term_id))
+            end = term_end
+        pieces.append(text[end:])
+        return "".join(pieces)
+
+    @staticmethod
+    def is_masked_only(text: str) -> bool:
+        """
+        :param text: the masked text
+        :return: whether nothing but placeholders and whitespace is left (nothing for the model to translate)
+        """
+        return PLACEHOLDER_PATTERN.sub("", text).strip() == ""
+
+    def unmask(self, text_translated: str) -> str:
+        """
+        :param text_translated: the translated text with placeholders
+        :return: the text with the placeholders replaced by the target terms
+        """
+        return PLACEHOLDER_PATTERN.sub(
+            lambda match: self.target_terms[int(match.group(1))] if int(match.group(1)) < len(self.target_terms)
+            else match.group(0),
+            text_translated)
+
+    @classmethod
+    def from_dataframe(cls,
+                       df: pd.DataFrame,
+                       source_language_code: str,
+                       target_language_code: str,
+                       fingerprint: str = "",
+                       min_term_length: int = GLOSSARY_MIN_TERM_LENGTH):
+        """
+        :param df: the glossary table, one column per language code (the layout of glossary_all.csv)
+        :param source_language_code: source language code
+        :param target_language_code: target language code
+        :param fingerprint: the id of the glossary content
+        :param min_term_length: the source terms shorter than this are ignored
+        :return: the compiled glossary
+        """
+        terms = {}
+        if source_language_code in df.columns and target_language_code in df.columns:
+            df = df[[source_language_code, target_language_code]].dropna()
+            for source_term, target_term in zip(df[source_language_code], df[target_language_code]):
+                source_term, target_term = str(source_term).strip(), str(target_term).strip()
+                # 同一术语出现多次时以第一次为准
+                if len(source_term) >= min_term_length and target_term != "" and source_term not in terms:
+                    terms[source_term] = target_term
+        return cls(list(terms.items()), fingerprint)
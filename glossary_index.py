@@ -0,0 +1,190 @@
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+
+import pandas as pd
+
+from glossary_engine import Glossary
+from settings import (GLOSSARY_GCS_URI_DICT, GLOSSARY_ID_ALL, GLOSSARY_INDEX_MMAP_SIZE, GLOSSARY_INDEX_PATH,
+                      GLOSSARY_INPUT_DIR, GLOSSARY_LANGUAGE_LIST, GLOSSARY_MIN_TERM_LENGTH)
+
+
+def get_glossary_id(file_name: str) -> str:
+    """
+    :param file_name: the file name of a glossary xlsx in glossary/input (e.g. "루나 용어집.xlsx")
+    :return: the glossary id whose GCS csv has the same name (e.g. "glossary_luna"),
+             the file name without the extension if the glossary is not uploaded to Google
+    """
+    file_stem = os.path.splitext(file_name)[0]
+    for glossary_id, gcs_uri in GLOSSARY_GCS_URI_DICT.items():
+        if glossary_id != GLOSSARY_ID_ALL and os.path.splitext(os.path.basename(gcs_uri))[0] == file_stem:
+            return glossary_id
+    return file_stem
+
+
+class GlossaryIndex:
+    """
+    Local glossary store (sqlite) built from glossary/input/*.xlsx, one segment per game.
+    The glossary id GLOSSARY_ID_ALL is the view of all the segments.
+    A segment is read (through the memory-mapped database file) and compiled only when it is first used,
+    the compiled glossaries are kept in the database and in memory: the first use of a compiled glossary in a process
+    only unpickles it (about half a second for GLOSSARY_ID_ALL, the GUI does it in a background thread),
+    switching back to it later is a dict lookup (microseconds) until build() changes a segment.
+    build() reads the changed xlsx files and can take seconds, the GUI runs it in a background thread.
+    """
+
+    def __init__(self,
+                 index_path: str = GLOSSARY_INDEX_PATH,
+                 min_term_length: int = GLOSSARY_MIN_TERM_LENGTH):
+        """
+        :param index_path: the path of the sqlite file
+        :param min_term_length: the source terms shorter than this are ignored
+        """
+        if os.path.dirname(index_path) != "":
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        self.index_path = index_path
+        self.min_term_length = min_term_length
+        self._glossaries = {}  # (glossary id, source language code, target language code): Glossary
+        # 文档翻译线程与主线程共用同一个连接
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(index_path, check_same_thread=False)
+        self._connection.execute("PRAGMA mmap_size={0}".format(GLOSSARY_INDEX_MMAP_SIZE))
+        language_columns = ", ".join('"{0}" TEXT'.format(language) for language in GLOSSARY_LANGUAGE_LIST)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS glossary_segments ("
+            "glossary_id TEXT PRIMARY KEY, "
+            "file_name TEXT NOT NULL, "
+            "file_hash TEXT NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS glossary_terms (glossary_id TEXT NOT NULL, {0})".format(language_columns)
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS glossary_terms_glossary_id ON glossary_terms (glossary_id)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS compiled_glossaries ("
+            "fingerprint TEXT PRIMARY KEY, "
+            "glossary BLOB NOT NULL)"
+        )
+        self._connection.commit()
+
+    def build(self, input_dir: str = GLOSSARY_INPUT_DIR) -> list:
+        """
+        (Re)build the segments of the xlsx files that are new or modified since the last build,
+        and drop the segments whose files are removed.
+        :param input_dir: the directory of the glossary xlsx files
+        :return: the glossary ids of the rebuilt segments
+        """
+        file_hashes = {}
+        for file_name in sorted(os.listdir(input_dir)):
+            if file_name.endswith(".xlsx") and not file_name.startswith("~$"):
+                with open(os.path.join(input_dir, file_name), "rb") as file_input:
+                    file_hashes[file_name] = hashlib.sha256(file_input.read()).hexdigest()
+
+        with self._lock:
+            segments = {file_name: (glossary_id, file_hash) for glossary_id, file_name, file_hash in
+                        self._connection.execute("SELECT glossary_id, file_name, file_hash FROM glossary_segments")}
+            rebuilt = []
+            for file_name, file_hash in file_hashes.items():
+                if file_name in segments and segments[file_name][1] == file_hash:
+                    continue
+                glossary_id = get_glossary_id(file_name)
+                df = pd.read_excel(os.path.join(input_dir, file_name))
+                languages = [language for language in GLOSSARY_LANGUAGE_LIST if language in df.columns]
+                df = df[languages].astype(object).where(df[languages].notna(), None)
+                self._connection.execute("DELETE FROM glossary_terms WHERE glossary_id = ?", (glossary_id,))
+                self._connection.executemany(
+                    "INSERT INTO glossary_terms (glossary_id, {0}) VALUES (?, {1})".format(
+                        ", ".join('"{0}"'.format(language) for language in languages),
+                        ", ".join("?" * len(languages))),
+                    [(glossary_id,) + tuple(None if value is None else str(value) for value in row)
+                     for row in df.itertuples(index=False)],
+                )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO glossary_segments (glossary_id, file_name, file_hash) VALUES (?, ?, ?)",
+                    (glossary_id, file_name, file_hash),
+                )
+                rebuilt.append(glossary_id)
+                logging.debug("Indexed {0} terms of {1} as {2}.".format(len(df), file_name, glossary_id))
+            for file_name, (glossary_id, _) in segments.items():
+                if file_name not in file_hashes:
+                    self._connection.execute("DELETE FROM glossary_terms WHERE glossary_id = ?", (glossary_id,))
+                    self._connection.execute("DELETE FROM glossary_segments WHERE glossary_id = ?", (glossary_id,))
+                    rebuilt.append(glossary_id)
+            # 任一术语表变化后，已编译的术语表（包括"全部"）全部失效
+            if len(rebuilt) > 0:
+                self._connection.execute("DELETE FROM compiled_glossaries")
+                self._glossaries.clear()
+            self._connection.commit()
+        return rebuilt
+
+    def glossary_ids(self) -> list:
+        """
+        :return: the glossary ids of the segments in the index
+        """
+        with self._lock:
+            return [row[0] for row in self._connection.execute("SELECT glossary_id FROM glossary_segments")]
+
+    def _get_fingerprint(self, glossary_id: str, source_language_code: str, target_language_code: str) -> str:
+        # 术语表的指纹由对应文件的hash决定，"全部"由所有文件的hash决定
+        if glossary_id == GLOSSARY_ID_ALL:
+            rows = self._connection.execute("SELECT file_hash FROM glossary_segments ORDER BY glossary_id")
+        else:
+            rows = self._connection.execute("SELECT file_hash FROM glossary_segments WHERE glossary_id = ?",
+                                            (glossary_id,))
+        file_hashes = [row[0] for row in rows]
+        if len(file_hashes) == 0:
+            return None
+        return "{0}:{1}:{2}:{3}:{4}".format(glossary_id, hashlib.sha256("".join(file_hashes).encode()).hexdigest(),
+                                            source_language_code, target_language_code, self.min_term_length)
+
+    def get_glossary(self, glossary_id: str, source_language_code: str, target_language_code: str) -> Glossary:
+        """
+        :param glossary_id: your glossary id (a value of settings.GLOSSARY_DICT)
+        :param source_language_code: source language code
+        :param target_language_code: target language code
+        :return: the compiled glossary, None if the glossary is not in the index
+        """
+        if glossary_id is None:
+            return None
+        key = (glossary_id, source_language_code, target_language_code)
+        with self._lock:
+            if key in self._glossaries:
+                return self._glossaries[key]
+            fingerprint = self._get_fingerprint(glossary_id, source_language_code, target_language_code)
+            if fingerprint is None:
+                logging.warning("Glossary {0} is not in the glossary index.".format(glossary_id))
+                return None
+            row = self._connection.execute("SELECT glossary FROM compiled_glossaries WHERE fingerprint = ?",
+                                           (fingerprint,)).fetchone()
+            if row is not None:
+                glossary = pickle.loads(row[0])
+            else:
+                # 只读取所选术语表的两列，编译后存入数据库
+                columns = [language for language in GLOSSARY_LANGUAGE_LIST
+                           if language in (source_language_code, target_language_code)]
+                if len(columns) < 2:
+                    return None
+                query = "SELECT {0} FROM glossary_terms".format(", ".join('"{0}"'.format(column) for column in columns))
+                if glossary_id == GLOSSARY_ID_ALL:
+                    rows = self._connection.execute(query + " ORDER BY rowid").fetchall()
+                else:
+                    rows = self._connection.execute(query + " WHERE glossary_id = ? ORDER BY rowid",
+                                                    (glossary_id,)).fetchall()
+                glossary = Glossary.from_dataframe(pd.DataFrame(rows, columns=columns),
+                                                   source_language_code, target_language_code,
+                                                   fingerprint, self.min_term_length)
+                self._connection.execute("INSERT INTO compiled_glossaries (fingerprint, glossary) VALUES (?, ?)",
+                                         (fingerprint, pickle.dumps(glossary)))
+                self._connection.commit()
+                logging.debug("Compiled {0} terms of {1}.".format(len(glossary.source_terms), glossary_id))
+            self._glossaries[key] = glossary
+        return glossary
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
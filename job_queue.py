@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from settings import JOB_QUEUE_PATH
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class JobQueue:
+    """
+    Persistent queue (sqlite) of the document jobs, survives the restarts of the application.
+    The jobs left running by a crash are queued again when the queue is opened, and their checkpoint journals
+    let them skip the finished batches.
+    """
+
+    def __init__(self, queue_name: str, db_path: str = JOB_QUEUE_PATH):
+        """
+        :param queue_name: the name of the queue (e.g. the engine), every application only takes its own jobs
+        :param db_path: the path of the sqlite file
+        """
+        if os.path.dirname(db_path) != "":
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.queue_name = queue_name
+        self.db_path = db_path
+        # 文档翻译线程与主线程共用同一个连接
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "queue_name TEXT NOT NULL, "
+            "file_path TEXT NOT NULL, "
+            "params TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "error TEXT, "
+            "created REAL NOT NULL, "
+            "updated REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_queue_status ON jobs (queue_name, status)")
+        # 上次运行中断的任务重新排队
+        cursor = self._connection.execute("UPDATE jobs SET status = ?, updated = ? WHERE queue_name = ? AND status = ?",
+                                          (JOB_QUEUED, time.time(), queue_name, JOB_RUNNING))
+        if cursor.rowcount > 0:
+            logging.info("{0} interrupted jobs queued again.".format(cursor.rowcount))
+        self._connection.commit()
+
+    def put(self, file_path: str, params: dict = None) -> int:
+        """
+        :param file_path: the path of the document
+        :param params: the settings of the job (JSON serializable)
+        :return: the id of the job
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (queue_name, file_path, params, status, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.queue_name, file_path, json.dumps(params or {}, ensure_ascii=False), JOB_QUEUED, now, now),
+            )
+            self._connection.commit()
+        return cursor.lastrowid
+
+    def claim(self) -> tuple:
+        """
+        Take the oldest queued job and mark it running.
+        :return: (job id, file path, params), None if the queue is empty
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT job_id, file_path, params FROM jobs WHERE queue_name = ? AND status = ? "
+                "ORDER BY job_id LIMIT 1",
+                (self.queue_name, JOB_QUEUED),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE jobs SET status = ?, updated = ? WHERE job_id = ?",
+                                     (JOB_RUNNING, time.time(), row[0]))
+            self._connection.commit()
+        return row[0], row[1], json.loads(row[2])
+
+    def _set_status(self, job_id: int, status: str, error: str = None) -> None:
+        with self._lock:
+            self._connection.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE job_id = ?",
+                                     (status, error, time.time(), job_id))
+            self._connection.commit()
+
+    def finish(self, job_id: int, error: str = None) -> None:
+        """
+        :param job_id: the id of the job
+        :param error: the partial failure of a finished job (e.g. some texts kept the source text)
+        """
+        self._set_status(job_id, JOB_DONE, error)
+
+    def fail(self, job_id: int, error: str) -> None:
+        self._set_status(job_id, JOB_FAILED, error)
+
+    def pending(self) -> int:
+        """
+        :return: the number of the queued jobs
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM jobs WHERE queue_name = ? AND status = ?",
+                                            (self.queue_name, JOB_QUEUED)).fetchone()[0]
+
+    def jobs(self, status: str = None) -> list:
+        """
+        :param status: only the jobs of this status (None for all the jobs)
+        :return: [(job id, file path, status, error)] in the order of the jobs
+        """
+        query = "SELECT job_id, file_path, status, error FROM jobs WHERE queue_name = ?"
+        params = (self.queue_name,)
+        if status is not None:
+            query += " AND status = ?"
+            params += (status,)
+        with self._lock:
+            return self._connection.execute(query + " ORDER BY job_id", params).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,150 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+from transformers import AutoTokenizer
+
+from settings import MODEL_BACKEND, MODEL_POOL_MAX_MEMORY, MODEL_POOL_MAX_WORKERS
+from translate_with_custom_model import export_onnx_model, load_translator
+
+# the memory of a worker relative to the size of the weight files (activations, beams, the runtime itself)
+WORKER_MEMORY_FACTOR = 1.5
+
+# 每个工作进程持有的模型（由_init_worker加载）
+_worker_translator = None
+
+
+def _init_worker(model_name: str, backend: str, num_threads: int) -> None:
+    global _worker_translator
+    _worker_translator = load_translator(model_name, device="cpu", backend=backend, num_threads=num_threads)
+    logging.debug("Model {0} loaded in process {1}.".format(model_name, os.getpid()))
+
+
+def _translate_batch(texts: list, src_lang: str, tgt_lang: str, generation_kwargs: dict) -> list:
+    with torch.inference_mode():
+        results = _worker_translator(texts, src_lang=src_lang, tgt_lang=tgt_lang, batch_size=len(texts),
+                                     **generation_kwargs)
+    return [{"translation_text": result["translation_text"]} for result in results]
+
+
+def get_model_size(model_name: str) -> int:
+    """
+    :param model_name: the path of a local model
+    :return: the size of the weight files in bytes (0 if unknown)
+    """
+    if not os.path.isdir(model_name):
+        return 0
+    file_sizes = {}
+    for file_name in os.listdir(model_name):
+        extension = os.path.splitext(file_name)[1]
+        if extension in (".safetensors", ".bin"):
+            file_sizes.setdefault(extension, 0)
+            file_sizes[extension] += os.path.getsize(os.path.join(model_name, file_name))
+    # 同时有safetensors与bin时只会加载其中一种
+    return file_sizes.get(".safetensors", file_sizes.get(".bin", 0))
+
+
+def get_pool_size(model_name: str,
+                  num_workers: int = MODEL_POOL_MAX_WORKERS,
+                  max_memory: int = MODEL_POOL_MAX_MEMORY,
+                  loaded_copies: int = 0) -> int:
+    """
+    :param model_name: the name or path of the model
+    :param num_workers: the number of worker processes wanted (None for the number of CPUs)
+    :param max_memory: the max memory of all the copies of the model in bytes (None for no limit)
+    :param loaded_copies: the copies of the model already loaded in the parent process (e.g. 1 in the GUI)
+    :return: the number of workers that fit in max_memory, 0 if not even one fits (translate in-process then)
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    worker_memory = get_model_size(model_name) * WORKER_MEMORY_FACTOR
+    if max_memory is not None and worker_memory > 0:
+        # 主进程中已加载的模型也计入内存上限
+        num_workers = min(num_workers, int(max_memory // worker_memory) - loaded_copies)
+    return max(num_workers, 0)
+
+
+class ModelProcessPool:
+    """
+    Translation engine of worker processes, every worker holds its own copy of the model on CPU
+    (from_pretrained copies the weights into new tensors, and the int8 backend quantizes them into new ones,
+    so the workers share no memory). The number of workers is capped by max_memory, which also counts the copies
+    already loaded in the parent process (ValueError if not even one worker fits, see get_pool_size),
+    and the CPU threads are split evenly among the workers.
+    """
+
+    def __init__(self,
+                 model_name: str,
+                 num_workers: int = MODEL_POOL_MAX_WORKERS,
+                 backend: str = MODEL_BACKEND,
+                 max_memory: int = MODEL_POOL_MAX_MEMORY,
+                 loaded_copies: int = 0):
+        """
+        :param model_name: the name or path of the model
+        :param num_workers: the number of worker processes (None for the number of CPUs)
+        :param backend: the backend of the model in every worker (see load_translator)
+        :param max_memory: the max memory of all the copies of the model in bytes (None for no limit)
+        :param loaded_copies: the copies of the model already loaded in the parent process (e.g. 1 in the GUI)
+        """
+        cpu_count = os.cpu_count() or 1
+        self.num_workers = get_pool_size(model_name, num_workers, max_memory, loaded_copies)
+        # 内存上限连一个工作进程都容纳不下时不能启动模型池（调用方应先用get_pool_size检查，改为在本进程内翻译）
+        if self.num_workers < 1:
+            raise ValueError("模型池的内存上限不足以启动工作进程:{0}".format(model_name))
+        self.model_name = model_name
+        self.backend = backend
+        # 主进程只加载分词器，用于按长度分桶
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # ONNX模型在启动工作进程前导出一次，工作进程直接加载导出的模型
+        if backend == "onnx":
+            export_onnx_model(model_name)
+        # CUDA与fork不兼容，工作进程一律使用spawn启动
+        self._executor = ProcessPoolExecutor(max_workers=self.num_workers,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker,
+                                             initargs=(model_name, backend, max(cpu_count // self.num_workers, 1)))
+        logging.debug("Started {0} model workers.".format(self.num_workers))
+
+    def translate_batch(self, texts: list, src_lang: str, tgt_lang: str, generation_kwargs: dict = None) -> list:
+        """
+        :param texts: a batch of texts
+        :param src_lang: source language code of the model (e.g. "zho_Hans")
+        :param tgt_lang: target language code of the model (e.g. "kor_Hang")
+        :param generation_kwargs: the generation kwargs of the pipeline call
+        :return: the pipeline outputs of the batch
+        """
+        return self._executor.submit(_translate_batch, texts, src_lang, tgt_lang, generation_kwargs or {}).result()
+
+    def close(self) -> None:
+        """
+        Stop the worker processes (after the batches in flight are finished).
+        """
+        self._executor.shutdown()
+
+
+class ProcessPoolTranslator:
+    """
+    One direction of a ModelProcessPool, usable wherever a pipeline is expected.
+    translate_texts sends num_workers batches to it at the same time.
+    """
+
+    def __init__(self, model_pool: ModelProcessPool, src_lang: str, tgt_lang: str):
+        """
+        :param model_pool: the shared ModelProcessPool
+        :param src_lang: source language code of the model (e.g. "zho_Hans")
+        :param tgt_lang: target language code of the model (e.g. "kor_Hang")
+        """
+        self.model_pool = model_pool
+        self.name_or_path = model_pool.model_name
+        self.backend = model_pool.backend
+        self.tokenizer = model_pool.tokenizer
+        self.num_workers = model_pool.num_workers
+        self._preprocess_params = {"src_lang": src_lang, "tgt_lang": tgt_lang}
+
+    def __call__(self, texts, batch_size: int = None, **generation_kwargs):
+        return self.model_pool.translate_batch(texts,
+                                               self._preprocess_params["src_lang"],
+                                               self._preprocess_params["tgt_lang"],
+                                               generation_kwargs)
@@ -0,0 +1,280 @@
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+
+HAN_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+HANGUL_PATTERN = re.compile(r"[\u1100-\u11ff\u3130-\u318f\uac00-\ud7af]")
+KANA_PATTERN = re.compile(r"[\u3040-\u30ff]")
+
+# 无需翻译的单元格：数字、UUID、资源路径/URL、英文键名、以及只有占位符/标点的格式串
+NUMBER_PATTERN = re.compile(r"[+-]?(?:\d[\d,]*(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?%?")
+UUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+PATH_PATTERN = re.compile(r"[A-Za-z]+://\S+|(?:[A-Za-z]:)?[\w.\-]*(?:[/\\][\w.\-]+)+|[\w\-]+\.[A-Za-z][A-Za-z0-9]{1,4}",
+                          re.ASCII)
+KEY_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[_.][A-Za-z0-9]+)+", re.ASCII)
+PLACEHOLDER_PATTERN = re.compile(r"\{[^{}]*\}|%(?:\d+\$)?[-+ #0]*\d*(?:\.\d+)?[sdfioxXeEgGc%]|<[^<>]*>|\[[^\[\]]*\]"
+                                 r"|\\[nrt]|\$\w+\$?")
+
+# 句末标点（含其后的引号/括号与空白）或换行视为句子边界；英文句号后必须跟空白，避免拆开小数
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?:[。！？!?…]+|\.(?=\s))[」』”’\"'）)]*\s*|\n\s*")
+
+
+def deduplicate_texts(texts: list) -> tuple:
+    """
+    Collapse the identical texts, so that every unique text is translated only once.
+    :param texts: your text list to translate
+    :return: (unique texts in the order of first occurrence, the index in the unique texts of every text)
+    """
+    unique_indexes = {}
+    inverse_indexes = []
+    for text in texts:
+        inverse_indexes.append(unique_indexes.setdefault(text, len(unique_indexes)))
+    return list(unique_indexes.keys()), inverse_indexes
+
+
+def expand_texts(unique_texts_translated: list, inverse_indexes: list) -> list:
+    """
+    Fan the translated unique texts back out to every occurrence.
+    :param unique_texts_translated: the translated unique texts
+    :param inverse_indexes: the inverse indexes returned by deduplicate_texts
+    :return: the translated texts in the original order
+    """
+    return [unique_texts_translated[index] for index in inverse_indexes]
+
+
+def get_deduplication_stats(texts: list, unique_texts: list) -> dict:
+    """
+    :param texts: the texts before deduplication
+    :param unique_texts: the texts after deduplication
+    :return: how many texts and characters the deduplication saved
+    """
+    characters = sum(len(text) for text in texts)
+    unique_characters = sum(len(text) for text in unique_texts)
+    stats = {
+        "texts": len(texts),
+        "unique_texts": len(unique_texts),
+        "characters": characters,
+        "unique_characters": unique_characters,
+        "saved_ratio": 1 - unique_characters / characters if characters > 0 else 0.0,
+    }
+    logging.info("Deduplication: {0} -> {1} texts, {2} -> {3} characters ({4:.1%} saved).".format(
+        stats["texts"], stats["unique_texts"], stats["characters"], stats["unique_characters"], stats["saved_ratio"]))
+    return stats
+
+
+def translate_deduplicated(texts: list, translate_function) -> tuple:
+    """
+    Translate every unique text once and fan the results back out to every occurrence.
+    :param texts: your text list to translate
+    :param translate_function: a function that translates a text list and returns the translated list
+    :return: (the translated texts in the original order, the deduplication stats)
+    """
+    unique_texts, inverse_indexes = deduplicate_texts(texts)
+    stats = get_deduplication_stats(texts, unique_texts)
+    unique_texts_translated = translate_function(unique_texts)
+    return expand_texts(unique_texts_translated, inverse_indexes), stats
+
+
+def split_sentences(text: str) -> list:
+    """
+    Split the text at zh/ko/en sentence boundaries, the punctuation and whitespace stay with the previous sentence.
+    :param text: the text to split
+    :return: the sentences, "".join(sentences) == text
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_BOUNDARY_PATTERN.finditer(text):
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+
+def split_segments(texts: list, split_function=split_sentences) -> list:
+    """
+    Split every text into segments to translate, the whitespace around every segment is kept aside.
+    :param texts: your text list to translate
+    :param split_function: a function that splits a text into pieces, "".join(pieces) == text
+    :return: [(index of the text, leading whitespace, segment, trailing whitespace)]
+    """
+    segments = []
+    for text_index, text in enumerate(texts):
+        # 不可拆分的文本同样去掉首尾空白（如单元格末尾的换行），译文拼回时再加上
+        for piece in split_function(text) or [text]:
+            segment = piece.strip()
+            leading = piece[:len(piece) - len(piece.lstrip())]
+            trailing = piece[len(segment) + len(leading):]
+            segments.append((text_index, leading, segment, trailing))
+    return segments
+
+
+def join_segments(segments: list, segments_translated: list, len_texts: int, target_language_code: str) -> list:
+    """
+    Stitch the translated segments back into the texts, with the original whitespace around every segment.
+    :param segments: the segments returned by split_segments
+    :param segments_translated: the translated segments, in the order of the segments
+    :param len_texts: the number of the texts
+    :param target_language_code: target language code
+    :return: the translated texts
+    """
+    # 目标语言使用空格分词时，原文中相邻句子之间没有空白的补一个空格
+    separator = "" if target_language_code in ("zh-CN", "zh-TW", "ja") else " "
+    texts_translated = [""] * len_texts
+    for segment_index, (text_index, leading, segment, trailing) in enumerate(segments):
+        is_last = segment_index + 1 == len(segments) or segments[segment_index + 1][0] != text_index
+        if trailing == "" and segment != "" and not is_last:
+            trailing = separator
+        texts_translated[text_index] += leading + segments_translated[segment_index] + trailing
+    return texts_translated
+
+
+def merge_deduplication_stats(stats: dict, stats_other: dict) -> dict:
+    """
+    Merge the deduplication stats of two chunks of the same document.
+    :param stats: the stats so far (None for the first chunk)
+    :param stats_other: the stats of the next chunk
+    :return: the merged stats
+    """
+    if stats is None:
+        return dict(stats_other)
+    stats_merged = {key: stats[key] + stats_other[key]
+                    for key in ("texts", "unique_texts", "characters", "unique_characters")}
+    characters = stats_merged["characters"]
+    stats_merged["saved_ratio"] = 1 - stats_merged["unique_characters"] / characters if characters > 0 else 0.0
+    return stats_merged
+
+
+def get_dataframe_texts(df: pd.DataFrame, column_positions: list = None) -> tuple:
+    """
+    Extract the texts to translate from a DataFrame column-wise instead of cell by cell.
+    The cells are converted like DataFrame.iterrows does (through the common dtype of the DataFrame),
+    so the texts are exactly the same as the ones extracted row by row.
+    :param df: the DataFrame loaded from the source file
+    :param column_positions: the positions of the columns to translate (None for all columns)
+    :return: (the texts in row-major order, (row positions, column positions) of the texts)
+    """
+    values = df.to_numpy()
+    # 缺失值不翻译（read_csv中的缺失值均为NaN）
+    if values.dtype.kind == "f":
+        mask = ~np.isnan(values)
+    elif values.dtype.kind == "O":
+        mask = ~pd.isna(values)
+    else:
+        mask = np.ones(values.shape, dtype=bool)
+    if column_positions is not None:
+        column_mask = np.zeros(values.shape[1], dtype=bool)
+        column_mask[list(column_positions)] = True
+        mask &= column_mask
+    rows, columns = np.nonzero(mask)
+    texts = values[rows, columns].astype(str).tolist()
+    return texts, (rows, columns)
+
+
+def set_dataframe_texts(df: pd.DataFrame, coordinates: tuple, texts_translated: list, column_map: dict = None) -> None:
+    """
+    Write the translated texts back into the DataFrame, one bulk assignment per column.
+    :param df: the DataFrame loaded from the source file
+    :param coordinates: the (row positions, column positions) returned by get_dataframe_texts
+    :param texts_translated: the translated texts in the same order
+    :param column_map: {source column position: target column position} (None to overwrite in place)
+    """
+    rows, columns = coordinates
+    texts_translated = np.array(texts_translated, dtype=object)
+    for column in np.unique(columns):
+        column_mask = columns == column
+        column_target = int(column) if column_map is None else column_map[int(column)]
+        column_values = df.iloc[:, column_target].to_numpy(dtype=object, copy=True)
+        column_values[rows[column_mask]] = texts_translated[column_mask]
+        df.isetitem(column_target, column_values)
+
+
+def copy_dataframe_columns(df: pd.DataFrame, column_map: dict) -> None:
+    """
+    Copy the source columns into their target columns, so that the cells not translated keep the source value.
+    :param df: the DataFrame loaded from the source file
+    :param column_map: {source column position: target column position}
+    """
+    for column, column_target in column_map.items():
+        if column_target == column:
+            continue
+        column_values = df.iloc[:, column].to_numpy(dtype=object)
+        column_values_target = df.iloc[:, column_target].to_numpy(dtype=object, copy=True)
+        column_mask = pd.notna(column_values)
+        column_values_target[column_mask] = column_values[column_mask]
+        df.isetitem(column_target, column_values_target)
+
+
+def count_lines(file_path: str) -> int:
+    """
+    Count the lines of a file without loading it into memory.
+    :param file_path: the path of the file
+    :return: the number of lines (a last line without the trailing newline is counted too)
+    """
+    len_lines = 0
+    last_block = b""
+    with open(file_path, "rb") as file_input:
+        for block in iter(lambda: file_input.read(1024 * 1024), b""):
+            len_lines += block.count(b"\n")
+            last_block = block
+    if last_block != b"" and not last_block.endswith(b"\n"):
+        len_lines += 1
+    return len_lines
+
+
+def is_source_language_text(text: str, source_language_code: str) -> bool:
+    """
+    Tell by the script whether the text is written in the source language.
+    :param text: the text to check
+    :param source_language_code: source language code
+    :return: True if the text is written in the source language (always True for the languages without a known script)
+    """
+    if source_language_code in ("zh-CN", "zh-TW"):
+        return HAN_PATTERN.search(text) is not None and HANGUL_PATTERN.search(text) is None \
+            and KANA_PATTERN.search(text) is None
+    elif source_language_code == "ko":
+        return HANGUL_PATTERN.search(text) is not None
+    elif source_language_code == "ja":
+        return KANA_PATTERN.search(text) is not None
+    return True
+
+
+def is_translatable_text(text: str, source_language_code: str = None) -> bool:
+    """
+    Tell whether the text needs to be sent to the translation backend.
+    Numbers, UUIDs, resource paths, URLs, ASCII keys and format-only strings (placeholders/punctuation) are skipped,
+    and for zh/ko/ja sources the text must contain at least one character of the source script.
+    :param text: the text to check
+    :param source_language_code: source language code
+    :return: True if the text is to be translated
+    """
+    text = text.strip()
+    if text == "":
+        return False
+    if NUMBER_PATTERN.fullmatch(text) or UUID_PATTERN.fullmatch(text) or PATH_PATTERN.fullmatch(text):
+        return False
+    text_without_placeholders = PLACEHOLDER_PATTERN.sub("", text)
+    if not any(character.isalpha() for character in text_without_placeholders):
+        return False
+    if source_language_code in ("zh-CN", "zh-TW"):
+        return HAN_PATTERN.search(text_without_placeholders) is not None
+    elif source_language_code == "ko":
+        return HANGUL_PATTERN.search(text_without_placeholders) is not None
+    elif source_language_code == "ja":
+        return KANA_PATTERN.search(text_without_placeholders) is not None \
+            or HAN_PATTERN.search(text_without_placeholders) is not None
+    return KEY_PATTERN.fullmatch(text) is None
+
+
+def get_translatable_indexes(texts: list, source_language_code: str = None) -> list:
+    """
+    :param texts: the cell values or lines of a document
+    :param source_language_code: source language code
+    :return: the indexes of the texts to translate, the others are passed through untouched
+    """
+    indexes = [index for index, text in enumerate(texts)
+               if isinstance(text, str) and is_translatable_text(text, source_language_code)]
+    logging.info("Pre-filter: {0} of {1} texts skipped.".format(len(texts) - len(indexes), len(texts)))
+    return indexes
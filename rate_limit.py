@@ -0,0 +1,189 @@
+import contextlib
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+try:
+    from filelock import FileLock  # 跨进程共享限流状态需要filelock
+except ImportError:
+    FileLock = None
+
+
+def call_with_retry(function,
+                    retryable_exceptions: tuple,
+                    max_retries: int,
+                    initial_delay: float = 1.0,
+                    max_delay: float = 32.0,
+                    on_retry=None):
+    """
+    Call the function, and call it again with jittered exponential backoff when it raises a retryable exception.
+    :param function: the function to call without arguments
+    :param retryable_exceptions: the exceptions worth retrying (e.g. quota exhausted, service unavailable)
+    :param max_retries: the max number of retries, the last exception is raised when they are used up
+    :param initial_delay: the delay before the first retry in seconds, doubled for every following retry
+    :param max_delay: the max delay in seconds
+    :param on_retry: a function called with (exception, retry number, delay) before every retry
+    :return: the return value of the function
+    """
+    for retry in range(max_retries + 1):
+        try:
+            return function()
+        except retryable_exceptions as e:
+            if retry == max_retries:
+                raise
+            # 一半固定、一半随机的等待时间，避免多个线程同时重试
+            delay = min(max_delay, initial_delay * 2 ** retry)
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            if on_retry is not None:
+                on_retry(e, retry + 1, delay)
+            time.sleep(delay)
+
+
+class AdaptiveRateLimiter:
+    """
+    Token-bucket limiter of the requests per minute and the characters per minute of one project.
+    The buckets are shared by all the threads of the process and, through a state file guarded by a lock file,
+    by all the processes on the machine (GUI, CLI, glossary tools).
+    The rate shrinks multiplicatively on every quota error (at most once per cooldown) and grows back linearly,
+    so the throughput stays close to the real quota; the learned rate is kept in the state file across the runs.
+    """
+
+    def __init__(self,
+                 state_path: str,
+                 requests_per_minute: int = None,
+                 characters_per_minute: int = None,
+                 decrease_factor: float = 0.5,
+                 recovery_per_minute: float = 0.1,
+                 min_scale: float = 0.05,
+                 decrease_cooldown: float = 5.0):
+        """
+        :param state_path: the path of the state file shared by the processes (None to share only within the process)
+        :param requests_per_minute: the quota of requests per minute (None for no limit)
+        :param characters_per_minute: the quota of characters per minute (None for no limit)
+        :param decrease_factor: the rate is multiplied by it on a quota error
+        :param recovery_per_minute: the share of the quota regained every minute without quota errors
+        :param min_scale: the min share of the quota
+        :param decrease_cooldown: the quota errors within this many seconds after a decrease are caused by
+                                  the requests already in flight, and do not decrease the rate again
+        """
+        self.limits = {"requests": requests_per_minute, "characters": characters_per_minute}
+        self.decrease_factor = decrease_factor
+        self.recovery_per_minute = recovery_per_minute
+        self.min_scale = min_scale
+        self.decrease_cooldown = decrease_cooldown
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._file_lock = None
+        self._state = None
+        if state_path is not None:
+            if FileLock is None:
+                logging.warning("filelock is not installed, the rate limit is only shared within the process.")
+            else:
+                if os.path.dirname(state_path) != "":
+                    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+                self._file_lock = FileLock(state_path + ".lock")
+
+    def _new_state(self, now: float) -> dict:
+        return {"scale": 1.0, "updated": now, "decreased": 0.0,
+                "tokens": {key: limit for key, limit in self.limits.items() if limit is not None}}
+
+    def _load(self, now: float) -> dict:
+        if self._file_lock is None:
+            if self._state is None:
+                self._state = self._new_state(now)
+            return self._state
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as file_input:
+                state = json.load(file_input)
+        except (OSError, ValueError):
+            return self._new_state(now)
+        # 配额设置变化后按新的配额重新开始
+        if set(state.get("tokens", {})) != {key for key, limit in self.limits.items() if limit is not None}:
+            return self._new_state(now)
+        return state
+
+    def _save(self, state: dict) -> None:
+        if self._file_lock is None:
+            return
+        # 先写临时文件再替换，写入中途崩溃不会留下损坏的状态文件（否则学到的速率会被重置）
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.state_path) or ".",
+                                                      prefix=os.path.basename(self.state_path), suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "w", encoding="utf-8") as file_output:
+                json.dump(state, file_output)
+            os.replace(temp_path, self.state_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _refill(self, state: dict, now: float) -> None:
+        elapsed = max(now - state["updated"], 0.0)
+        # 没有配额错误时缓慢恢复速率
+        state["scale"] = min(1.0, state["scale"] + self.recovery_per_minute * elapsed / 60)
+        for key, tokens in state["tokens"].items():
+            capacity = self.limits[key] * state["scale"]
+            state["tokens"][key] = min(capacity, tokens + capacity * elapsed / 60)
+        state["updated"] = now
+
+    def _wait_time(self, state: dict, amounts: dict) -> float:
+        wait_time = 0.0
+        for key, tokens in state["tokens"].items():
+            capacity = self.limits[key] * state["scale"]
+            # 超过桶容量的请求在桶满时放行（之后的请求等待桶重新填满）
+            needed = min(amounts[key], capacity)
+            if tokens < needed:
+                wait_time = max(wait_time, (needed - tokens) * 60 / capacity)
+        return wait_time
+
+    def acquire(self, characters: int = 0) -> None:
+        """
+        Block until a request with the given number of characters fits in the rate, then take its tokens.
+        :param characters: the number of characters of the request
+        """
+        amounts = {"requests": 1, "characters": characters}
+        while True:
+            with self._lock, self._file_lock or contextlib.nullcontext():
+                now = time.time()
+                state = self._load(now)
+                self._refill(state, now)
+                wait_time = self._wait_time(state, amounts)
+                if wait_time <= 0:
+                    for key in state["tokens"]:
+                        state["tokens"][key] -= amounts[key]
+                self._save(state)
+            if wait_time <= 0:
+                return
+            time.sleep(wait_time)
+
+    def report_quota_exceeded(self) -> None:
+        """
+        Shrink the rate after a quota error (e.g. RESOURCE_EXHAUSTED).
+        """
+        with self._lock, self._file_lock or contextlib.nullcontext():
+            now = time.time()
+            state = self._load(now)
+            self._refill(state, now)
+            if now - state["decreased"] >= self.decrease_cooldown:
+                state["scale"] = max(self.min_scale, state["scale"] * self.decrease_factor)
+                state["decreased"] = now
+                # 清空令牌桶，让在途的请求先消化掉
+                for key in state["tokens"]:
+                    state["tokens"][key] = min(state["tokens"][key], 0.0)
+                logging.warning("Quota exceeded, the rate limit is reduced to {0:.0%} of the quota.".format(
+                    state["scale"]))
+            self._save(state)
+
+    def rate(self) -> dict:
+        """
+        :return: the current rate of every limit per minute
+        """
+        with self._lock, self._file_lock or contextlib.nullcontext():
+            now = time.time()
+            state = self._load(now)
+            self._refill(state, now)
+        return {key: limit * state["scale"] for key, limit in self.limits.items() if limit is not None}
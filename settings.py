@@ -1,3 +1,5 @@
+import os
+
 # Project ID (can be found on the welcome page of your Google Project)
 PROJECT_ID = "longtukoreatranslator"
 
@@ -14,6 +16,18 @@ GLOSSARY_ID_KAIROS = "glossary_kairos"  # 카이로스
 GLOSSARY_ID_TEA_WANG = "glossary_tea_wang"  # 태왕
 GLOSSARY_ID_YULGANG_GLOBAL = "glossary_yulgang_global"  # 열강 global
 
+# The concurrency and the quota of Google Translation API (see the Quotas page of the project, None for no limit)
+TRANSLATION_API_MAX_WORKERS = 4
+TRANSLATION_API_REQUESTS_PER_MINUTE = None
+TRANSLATION_API_CHARACTERS_PER_MINUTE = 6000000
+# The limits of every translate_text request (30,000 codepoints is the recommended max length of a request)
+TRANSLATION_API_MAX_CODEPOINTS = 30000
+TRANSLATION_API_MAX_ITEMS = 1024
+# The retries of a request failed with RESOURCE_EXHAUSTED/UNAVAILABLE, with jittered exponential backoff (in seconds)
+TRANSLATION_API_MAX_RETRIES = 5
+TRANSLATION_API_RETRY_INITIAL_DELAY = 1.0
+TRANSLATION_API_RETRY_MAX_DELAY = 32.0
+
 # A game name to glossary id dict
 GLOSSARY_DICT = {
     "全部/전체": GLOSSARY_ID_ALL,
@@ -65,3 +79,100 @@ MODEL_DICT = {
 
 # the name of the Google private key
 PRIVATE_KEY_NAME = "longtukoreatranslator_key.json"
+
+# The directory to keep the local caches (translation memory, compiled glossaries, ...)
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".LongtuKoreaTranslator")
+
+# The sqlite file of the translation memory and the max number of the entries kept in it (LRU eviction)
+TRANSLATION_MEMORY_PATH = os.path.join(CACHE_DIR, "translation_memory.sqlite3")
+TRANSLATION_MEMORY_MAX_ENTRIES = 1000000
+
+# The number of lines of a txt file read and translated at a time
+TXT_CHUNK_SIZE = 5000
+
+# xlsx files larger than this (in bytes) are translated in the streaming (read-only/write-only) mode,
+# and the number of rows translated at a time in this mode
+EXCEL_STREAMING_THRESHOLD = 10 * 1024 * 1024
+EXCEL_STREAMING_CHUNK_SIZE = 5000
+
+# csv/tsv files larger than this (in bytes) are translated chunk by chunk, and the number of rows of every chunk
+CSV_CHUNKED_THRESHOLD = 100 * 1024 * 1024
+CSV_CHUNK_SIZE = 50000
+
+# The column headers recognized as a language when detecting the source-language column of a table file
+# (the language code itself, e.g. "zh-CN" in the layout used by glossary/merge_xlsx_files.py, is always recognized)
+LANGUAGE_HEADER_DICT = {
+    "zh-CN": ["zh", "cn", "chinese", "中文", "简体中文", "중국어"],
+    "zh-TW": ["tw", "繁體中文", "繁体中文"],
+    "en": ["english", "英文", "영어"],
+    "ko": ["kr", "korean", "韩语", "韩文", "한국어"],
+    "ja": ["jp", "japanese", "日语", "日文", "일본어"],
+}
+
+# NLLB language code to Google language code dict (used by the custom model path)
+NLLB_LANGUAGE_CODE_DICT = {
+    "zho_Hans": "zh-CN",
+    "zho_Hant": "zh-TW",
+    "eng_Latn": "en",
+    "kor_Hang": "ko",
+    "jpn_Jpan": "ja",
+    "tha_Thai": "th",
+    "por_Latn": "pt",
+    "ind_Latn": "id",
+    "vie_Latn": "vi",
+}
+
+# The min length of the source terms of the local glossary (single characters would be masked everywhere)
+GLOSSARY_MIN_TERM_LENGTH = 2
+
+# The local glossary index (sqlite) built from the glossary xlsx files, one segment per game,
+# the languages kept in it, and the size of the database file mapped into memory
+GLOSSARY_INPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "glossary", "input")
+GLOSSARY_INDEX_PATH = os.path.join(CACHE_DIR, "glossary_index.sqlite3")
+GLOSSARY_LANGUAGE_LIST = ["zh-CN", "zh-TW", "en", "ko", "ja", "th", "pt", "id", "vi"]
+GLOSSARY_INDEX_MMAP_SIZE = 256 * 1024 * 1024
+
+# The backend of the custom model: "torch" (fp32), "int8" (dynamic int8 quantization, CPU only)
+# or "onnx" (ONNX Runtime on CPU), and the number of intra-op threads on CPU (None for default)
+MODEL_BACKEND = "torch"
+MODEL_CPU_THREADS = None
+# The directory of the ONNX exports of the custom model (exported once per model version, then loaded from here)
+MODEL_ONNX_CACHE_DIR = os.path.join(CACHE_DIR, "onnx")
+
+# Translate documents with a pool of model worker processes on CPU (each worker holds a copy of the model),
+# the max number of workers (None for the number of CPUs) and the max memory of all the copies of the model in bytes
+# (the workers and the copy loaded by the GUI)
+MODEL_POOL_ENABLED = False
+MODEL_POOL_MAX_WORKERS = None
+MODEL_POOL_MAX_MEMORY = 16 * 1024 * 1024 * 1024
+
+# The generation profiles of the custom model: "ui-fast" (greedy, short outputs) for UI labels and
+# "dialogue-quality" (beam search, max new tokens scaled by the input length) for long texts.
+# "auto" selects GENERATION_AUTO_PROFILES[0] for the batches up to GENERATION_AUTO_SHORT_LENGTH tokens,
+# GENERATION_AUTO_PROFILES[1] for the others. GENERATION_PROFILE is the profile used by the GUI.
+GENERATION_PROFILE_DICT = {
+    "ui-fast": {"num_beams": 1, "do_sample": False, "max_new_tokens": 64},
+    "dialogue-quality": {"num_beams": 4, "do_sample": False, "max_new_tokens_scale": 2.0,
+                         "max_new_tokens_offset": 16},
+}
+GENERATION_AUTO_PROFILES = ("ui-fast", "dialogue-quality")
+GENERATION_AUTO_SHORT_LENGTH = 16
+GENERATION_PROFILE = "auto"
+
+# The number of files translated at the same time by translate_cli.py (they share the client/model and the caches)
+CLI_MAX_WORKERS = 2
+
+# The suffix of the checkpoint journal written next to a document while it is translated,
+# and the persistent queue of the document jobs of the GUI
+CHECKPOINT_SUFFIX = ".checkpoint.jsonl"
+JOB_QUEUE_PATH = os.path.join(CACHE_DIR, "job_queue.sqlite3")
+
+# The state file of the rate limit of every project, shared by all the translators on the machine ({0}: the project id)
+RATE_LIMIT_STATE_PATH = os.path.join(CACHE_DIR, "rate_limit_{0}.json")
+# The rate is multiplied by RATE_LIMIT_DECREASE_FACTOR on RESOURCE_EXHAUSTED (at most once per
+# RATE_LIMIT_DECREASE_COOLDOWN seconds, never below RATE_LIMIT_MIN_SCALE of the quota),
+# and regains RATE_LIMIT_RECOVERY_PER_MINUTE of the quota every minute without quota errors
+RATE_LIMIT_DECREASE_FACTOR = 0.5
+RATE_LIMIT_DECREASE_COOLDOWN = 5.0
+RATE_LIMIT_MIN_SCALE = 0.05
+RATE_LIMIT_RECOVERY_PER_MINUTE = 0.1
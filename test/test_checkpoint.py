@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from checkpoint import CheckpointJournal
+
+
+@pytest.fixture
+def document(tmp_path):
+    file_path = tmp_path / "document.txt"
+    file_path.write_text("第一行\n第二行\n", encoding="utf-8")
+    return str(file_path)
+
+
+def _write_batches(document: str, job_key: str = "job") -> None:
+    checkpoint = CheckpointJournal(document, job_key)
+    call_index = checkpoint.next_call()
+    checkpoint.put(call_index, 0, ["第一行"], ["첫째 줄"])
+    checkpoint.put(call_index, 1, ["第二行"], ["둘째 줄"])
+    checkpoint.close()
+
+
+def test_journal_is_written_next_to_the_document(document):
+    _write_batches(document)
+    assert os.path.exists(document + ".checkpoint.jsonl")
+
+
+def test_restore_finished_batches(document):
+    _write_batches(document)
+    checkpoint = CheckpointJournal(document, "job")
+    call_index = checkpoint.next_call()
+    assert checkpoint.get(call_index, 0, ["第一行"]) == ["첫째 줄"]
+    assert checkpoint.get(call_index, 1, ["第二行"]) == ["둘째 줄"]
+    assert checkpoint.get(call_index, 2, ["第三行"]) is None
+    assert checkpoint.restored == 2
+    checkpoint.close()
+
+
+def test_calls_are_numbered_in_order(document):
+    checkpoint = CheckpointJournal(document, "job")
+    assert [checkpoint.next_call() for _ in range(3)] == [0, 1, 2]
+    checkpoint.close()
+
+
+def test_changed_source_texts_are_not_restored(document):
+    _write_batches(document)
+    checkpoint = CheckpointJournal(document, "job")
+    assert checkpoint.get(checkpoint.next_call(), 0, ["第一行（已修改）"]) is None
+    assert checkpoint.restored == 0
+    checkpoint.close()
+
+
+def test_changed_job_key_starts_over(document):
+    _write_batches(document, "job")
+    checkpoint = CheckpointJournal(document, "another job")
+    assert checkpoint.get(checkpoint.next_call(), 0, ["第一行"]) is None
+    checkpoint.close()
+    # 过期的日志被新的表头覆盖
+    with open(document + ".checkpoint.jsonl", "r", encoding="utf-8") as file_input:
+        lines = file_input.readlines()
+    assert len(lines) == 1 and json.loads(lines[0])["job_key"] == "another job"
+
+
+def test_changed_document_starts_over(document):
+    _write_batches(document)
+    with open(document, "a", encoding="utf-8") as file_output:
+        file_output.write("第三行\n")
+    checkpoint = CheckpointJournal(document, "job")
+    assert checkpoint.get(checkpoint.next_call(), 0, ["第一行"]) is None
+    checkpoint.close()
+
+
+def test_truncated_last_line_is_ignored(document):
+    _write_batches(document)
+    with open(document + ".checkpoint.jsonl", "a", encoding="utf-8") as file_output:
+        file_output.write('{"call": 0, "batch": 2, "ha')
+    checkpoint = CheckpointJournal(document, "job")
+    call_index = checkpoint.next_call()
+    assert checkpoint.get(call_index, 1, ["第二行"]) == ["둘째 줄"]
+    assert checkpoint.get(call_index, 2, ["第三行"]) is None
+    checkpoint.close()
+
+
+def test_batches_appended_after_restore_survive_another_restart(document):
+    _write_batches(document)
+    checkpoint = CheckpointJournal(document, "job")
+    checkpoint.put(checkpoint.next_call(), 2, ["第三行"], ["셋째 줄"])
+    checkpoint.close()
+    checkpoint = CheckpointJournal(document, "job")
+    call_index = checkpoint.next_call()
+    assert checkpoint.get(call_index, 0, ["第一行"]) == ["첫째 줄"]
+    assert checkpoint.get(call_index, 2, ["第三行"]) == ["셋째 줄"]
+    checkpoint.close()
+
+
+def test_remove_deletes_the_journal(document):
+    checkpoint = CheckpointJournal(document, "job")
+    checkpoint.remove()
+    assert not os.path.exists(document + ".checkpoint.jsonl")
@@ -0,0 +1,53 @@
+import io
+
+import pandas as pd
+
+from column_selector import ColumnSelector
+
+
+def test_select_sheet():
+    assert ColumnSelector().select_sheet("任意")
+    column_selector = ColumnSelector(sheets=["文本"])
+    assert column_selector.select_sheet("文本")
+    assert not column_selector.select_sheet("配置")
+
+
+def test_select_columns_by_header():
+    column_selector = ColumnSelector(source_columns=["desc", "name"])
+    assert column_selector.select_columns(["id", "name", "desc"], [[], [], []], "zh-CN") == [1, 2]
+
+
+def test_select_every_column_without_detection():
+    assert ColumnSelector().select_columns(["id", "name"], [[], []], "zh-CN") == [0, 1]
+
+
+def test_auto_detect_by_the_language_header():
+    column_selector = ColumnSelector(auto_detect=True)
+    assert column_selector.select_columns(["id", " 中文 ", "한국어"], [[], [], []], "zh-CN") == [1]
+    assert column_selector.select_columns(["id", "zh-cn"], [[], []], "zh-CN") == [1]
+
+
+def test_auto_detect_by_the_script_of_the_cells():
+    column_selector = ColumnSelector(auto_detect=True)
+    columns_values = [[1, 2, 3], ["勇者", "卡牌", "abc"], ["용사", "카드", "abc"]]
+    assert column_selector.select_columns(["id", "a", "b"], columns_values, "zh-CN") == [1]
+    assert column_selector.select_columns(["id", "a", "b"], columns_values, "ko") == [2]
+
+
+def test_auto_detect_finds_nothing_under_the_ratio():
+    column_selector = ColumnSelector(auto_detect=True, detect_ratio=0.5)
+    assert column_selector.select_columns(["a"], [["勇者", "abc", "def"]], "zh-CN") == []
+
+
+def test_get_target_positions():
+    column_selector = ColumnSelector(target_column="{column}_ko")
+    column_map, new_headers = column_selector.get_target_positions(["id", "name", "desc", "desc_ko"], [1, 2])
+    assert column_map == {1: 4, 2: 3}
+    assert new_headers == {4: "name_ko"}
+    assert ColumnSelector().get_target_positions(["id", "name"], [1]) == ({1: 1}, {})
+
+
+def test_select_dataframe_columns():
+    df = pd.read_csv(io.StringIO("id,zh\n1,勇者\n2,卡牌\n"))
+    column_selector = ColumnSelector(auto_detect=True, target_column="ko")
+    assert column_selector.select_dataframe_columns(df, "zh-CN") == ([1], {1: 2}, {2: "ko"})
@@ -0,0 +1,84 @@
+import pytest
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font, PatternFill
+
+pytest.importorskip("PyQt5.QtCore")
+
+from column_selector import ColumnSelector  # noqa: E402
+from excel_streaming import translate_workbook_streaming  # noqa: E402
+
+
+def _translate_function(texts: list) -> list:
+    return ["T:" + text for text in texts]
+
+
+@pytest.fixture
+def workbook_path(tmp_path):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = "文本"
+    worksheet.append(["你好", 42, "世界"])
+    worksheet.append(["标题", None, None])
+    worksheet.append(["你好", "a/b.png", None])
+    worksheet["A1"].font = Font(bold=True, color="FFFF0000")
+    worksheet["C1"].fill = PatternFill("solid", fgColor="FF00FF00")
+    worksheet["B1"].number_format = "0.00"
+    worksheet.merge_cells("A2:C2")
+    worksheet.column_dimensions["A"].width = 30
+    workbook.create_sheet("第二页").append(["再见"])
+    file_path = tmp_path / "source.xlsx"
+    workbook.save(file_path)
+    return str(file_path)
+
+
+def test_streaming_round_trip_keeps_values_styles_and_merged_cells(workbook_path, tmp_path):
+    file_path_target = str(tmp_path / "target.xlsx")
+    stats = translate_workbook_streaming(workbook_path, file_path_target, _translate_function, chunk_size=2)
+    workbook = load_workbook(file_path_target)
+    assert workbook.sheetnames == ["文本", "第二页"]
+    worksheet = workbook["文本"]
+    assert [[cell.value for cell in row] for row in worksheet.iter_rows()] == [
+        ["T:你好", 42, "T:世界"],
+        ["T:标题", None, None],
+        ["T:你好", "a/b.png", None],
+    ]
+    assert workbook["第二页"]["A1"].value == "T:再见"
+    assert worksheet["A1"].font.bold and worksheet["A1"].font.color.rgb == "FFFF0000"
+    assert worksheet["C1"].fill.fgColor.rgb == "FF00FF00"
+    assert worksheet["B1"].number_format == "0.00"
+    assert [str(merged_range) for merged_range in worksheet.merged_cells.ranges] == ["A2:C2"]
+    assert worksheet.column_dimensions["A"].width == 30
+    # 分块去重统计合并后覆盖全部可翻译单元格
+    assert stats["texts"] == 5
+
+
+def test_streaming_reports_progress_per_chunk(workbook_path, tmp_path):
+    class FakeSignal:
+        def __init__(self):
+            self.values = []
+
+        def emit(self, value: int) -> None:
+            self.values.append(value)
+
+    progress_bar_init, progress_bar_num = FakeSignal(), FakeSignal()
+    translate_workbook_streaming(workbook_path, str(tmp_path / "target.xlsx"), _translate_function,
+                                 progress_bar_init=progress_bar_init, progress_bar_num=progress_bar_num,
+                                 chunk_size=2)
+    assert progress_bar_init.values == [4]
+    assert progress_bar_num.values == [2, 3, 4]
+
+
+def test_skipped_cells_of_a_mixed_column_are_copied_to_the_target_column(tmp_path):
+    workbook = Workbook()
+    worksheet = workbook.active
+    for row in [["id", "zh"], [1, "勇者"], [2, 100], [3, None], [4, "icon/a.png"]]:
+        worksheet.append(row)
+    file_path_source = str(tmp_path / "source.xlsx")
+    workbook.save(file_path_source)
+    file_path_target = str(tmp_path / "target.xlsx")
+    translate_workbook_streaming(file_path_source, file_path_target, _translate_function, chunk_size=2,
+                                 column_selector=ColumnSelector(source_columns=["zh"], target_column="ko"),
+                                 source_language_code="zh-CN")
+    worksheet = load_workbook(file_path_target).active
+    assert [cell.value for cell in worksheet["B"]] == ["zh", "勇者", 100, None, "icon/a.png"]
+    assert [cell.value for cell in worksheet["C"]] == ["ko", "T:勇者", 100, None, "icon/a.png"]
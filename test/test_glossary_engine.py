@@ -0,0 +1,72 @@
+import re
+
+import pandas as pd
+
+from glossary_engine import Glossary
+
+TERMS = [("勇者", "용사"), ("勇者之剑", "용사의 검"), ("剑", "검"), ("之剑", "의 칼"), ("he", "HE"), ("she", "SHE")]
+
+
+def _find_terms_naively(terms: list, text: str) -> list:
+    # 逐个位置尝试最长的术语，作为自动机的对照
+    selected = []
+    start = 0
+    while start < len(text):
+        lengths = [len(term) for term, _ in terms if text.startswith(term, start)]
+        if len(lengths) == 0:
+            start += 1
+            continue
+        length = max(lengths)
+        term_id = [term for term, _ in terms].index(text[start:start + length])
+        selected.append((start, start + length, term_id))
+        start += length
+    return selected
+
+
+def test_find_terms_is_leftmost_longest_without_overlap():
+    glossary = Glossary(TERMS)
+    assert glossary.find_terms("勇者之剑和剑") == [(0, 4, 1), (5, 6, 2)]
+    assert glossary.find_terms("ushers") == [(1, 4, 5)]
+    assert glossary.find_terms("没有术语") == []
+
+
+def test_find_terms_matches_the_naive_scan():
+    glossary = Glossary(TERMS)
+    for text in ["勇者之剑", "勇者之", "他的勇者和勇者之剑之剑", "sheshe he", "", "之剑勇者剑"]:
+        assert glossary.find_terms(text) == _find_terms_naively(TERMS, text)
+
+
+def test_mask_and_unmask_round_trip():
+    glossary = Glossary(TERMS)
+    masked = glossary.mask("拿起勇者之剑，勇者！")
+    assert masked == "拿起<glossary_id=1>，<glossary_id=0>！"
+    assert glossary.unmask(masked) == "拿起용사의 검，용사！"
+
+
+def test_unmask_tolerates_spaces_in_placeholders_and_keeps_unknown_ids():
+    glossary = Glossary(TERMS)
+    assert glossary.unmask("< glossary_id = 2 >를 들다") == "검를 들다"
+    assert glossary.unmask("<glossary_id=99>") == "<glossary_id=99>"
+
+
+def test_is_masked_only():
+    glossary = Glossary(TERMS)
+    assert Glossary.is_masked_only(glossary.mask(" 勇者 剑 "))
+    assert not Glossary.is_masked_only(glossary.mask("勇者来了"))
+
+
+def test_large_glossary_masks_every_term():
+    terms = [("术语{0}号".format(index), "T{0}".format(index)) for index in range(5000)]
+    glossary = Glossary(terms)
+    text = "".join("术语{0}号，".format(index) for index in range(0, 5000, 7))
+    assert re.sub(r"<glossary_id=\d+>，", "", glossary.mask(text)) == ""
+    assert glossary.unmask(glossary.mask(text)) == "".join("T{0}，".format(index) for index in range(0, 5000, 7))
+
+
+def test_from_dataframe():
+    df = pd.DataFrame({"zh-CN": ["勇者", "勇者", "剑", " 盾 ", None], "ko": ["용사", "영웅", None, "방패", "x"]})
+    glossary = Glossary.from_dataframe(df, "zh-CN", "ko", fingerprint="v1", min_term_length=1)
+    assert list(zip(glossary.source_terms, glossary.target_terms)) == [("勇者", "용사"), ("盾", "방패")]
+    assert glossary.fingerprint == "v1"
+    assert Glossary.from_dataframe(df, "zh-CN", "ko", min_term_length=2).source_terms == ["勇者"]
+    assert Glossary.from_dataframe(df, "zh-CN", "ja").source_terms == []
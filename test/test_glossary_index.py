@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+import glossary_index
+from glossary_index import GlossaryIndex, get_glossary_id
+from settings import GLOSSARY_ID_ALL
+
+
+def _write_glossary(input_dir, file_name: str, terms: list) -> None:
+    pd.DataFrame(terms, columns=["zh-CN", "ko"]).to_excel(input_dir / file_name, index=False)
+
+
+@pytest.fixture
+def input_dir(tmp_path):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    _write_glossary(input_dir, "game_a.xlsx", [("勇者", "용사"), ("魔王", "마왕")])
+    _write_glossary(input_dir, "game_b.xlsx", [("卡牌", "카드")])
+    return input_dir
+
+
+@pytest.fixture
+def index(tmp_path, input_dir):
+    index = GlossaryIndex(str(tmp_path / "glossary_index.sqlite3"), min_term_length=1)
+    index.build(str(input_dir))
+    yield index
+    index.close()
+
+
+def test_get_glossary_id_falls_back_to_the_file_name():
+    assert get_glossary_id("game_a.xlsx") == "game_a"
+
+
+def test_build_only_rebuilds_changed_files(index, input_dir):
+    assert sorted(index.glossary_ids()) == ["game_a", "game_b"]
+    assert index.build(str(input_dir)) == []
+    _write_glossary(input_dir, "game_b.xlsx", [("卡牌", "카드"), ("宝箱", "보물상자")])
+    (input_dir / "game_a.xlsx").unlink()
+    assert sorted(index.build(str(input_dir))) == ["game_a", "game_b"]
+    assert index.glossary_ids() == ["game_b"]
+
+
+def test_get_glossary_of_a_segment_and_of_all_segments(index):
+    glossary = index.get_glossary("game_a", "zh-CN", "ko")
+    assert glossary.mask("勇者打败了魔王") == "<glossary_id=0>打败了<glossary_id=1>"
+    assert sorted(index.get_glossary(GLOSSARY_ID_ALL, "zh-CN", "ko").source_terms) == ["勇者", "卡牌", "魔王"]
+    assert index.get_glossary("game_c", "zh-CN", "ko") is None
+    assert index.get_glossary(None, "zh-CN", "ko") is None
+
+
+def test_switching_back_to_a_loaded_glossary_hits_the_memory(index, monkeypatch):
+    glossary = index.get_glossary(GLOSSARY_ID_ALL, "zh-CN", "ko")
+    index.get_glossary("game_a", "zh-CN", "ko")
+
+    def fail_loads(data):
+        raise AssertionError("the glossary is unpickled again")
+
+    monkeypatch.setattr(glossary_index.pickle, "loads", fail_loads)
+    assert index.get_glossary(GLOSSARY_ID_ALL, "zh-CN", "ko") is glossary
+
+
+def test_compiled_glossaries_persist_across_reopen(tmp_path, index):
+    glossary = index.get_glossary("game_a", "zh-CN", "ko")
+    index_reopened = GlossaryIndex(index.index_path, min_term_length=1)
+    glossary_reopened = index_reopened.get_glossary("game_a", "zh-CN", "ko")
+    assert glossary_reopened is not glossary
+    assert glossary_reopened.fingerprint == glossary.fingerprint
+    assert glossary_reopened.target_terms == glossary.target_terms
+    index_reopened.close()
+
+
+def test_rebuild_invalidates_the_loaded_glossaries(index, input_dir):
+    glossary = index.get_glossary(GLOSSARY_ID_ALL, "zh-CN", "ko")
+    _write_glossary(input_dir, "game_b.xlsx", [("宝箱", "보물상자")])
+    index.build(str(input_dir))
+    glossary_rebuilt = index.get_glossary(GLOSSARY_ID_ALL, "zh-CN", "ko")
+    assert glossary_rebuilt.fingerprint != glossary.fingerprint
+    assert sorted(glossary_rebuilt.source_terms) == ["勇者", "宝箱", "魔王"]
@@ -0,0 +1,129 @@
+import importlib.util
+import os
+import types
+
+import pytest
+
+pytest.importorskip("google.api_core.exceptions")
+pytest.importorskip("google.cloud.translate_v3")
+
+# glossary/glossary.py与glossary目录同名，按文件路径加载
+_spec = importlib.util.spec_from_file_location("glossary_tools", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "glossary", "glossary.py"))
+glossary_tools = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(glossary_tools)
+
+PROJECT_ID = "project"
+GLOSSARY_URI_DICT = {"glossary_a": "gs://bucket/glossary_a.csv", "glossary_b": "gs://bucket/glossary_b.csv"}
+
+
+class FakeOperation:
+    def __init__(self, result):
+        self._result = result
+
+    def done(self) -> bool:
+        return True
+
+    def result(self):
+        return self._result
+
+
+class FakeClient:
+    """
+    Keeps the remote glossaries in a dict and finishes every operation at once.
+    """
+
+    def __init__(self, remote_glossaries: dict):
+        self.remote_glossaries = dict(remote_glossaries)  # name: entry count
+        self.calls = []
+
+    @staticmethod
+    def glossary_path(project_id: str, location: str, glossary_id: str) -> str:
+        return "projects/{0}/locations/{1}/glossaries/{2}".format(project_id, location, glossary_id)
+
+    def _get_glossary(self, name: str):
+        glossary_id = name.rsplit("/", 1)[1]
+        return types.SimpleNamespace(
+            name=name, entry_count=self.remote_glossaries[name],
+            input_config=types.SimpleNamespace(gcs_source=types.SimpleNamespace(
+                input_uri=GLOSSARY_URI_DICT[glossary_id])))
+
+    def list_glossaries(self, parent: str):
+        self.calls.append("list")
+        return [self._get_glossary(name) for name in self.remote_glossaries]
+
+    def delete_glossary(self, name: str):
+        self.calls.append(("delete", name.rsplit("/", 1)[1]))
+        del self.remote_glossaries[name]
+        return FakeOperation(None)
+
+    def create_glossary(self, parent: str, glossary):
+        self.calls.append(("create", glossary.name.rsplit("/", 1)[1]))
+        self.remote_glossaries[glossary.name] = 10
+        return FakeOperation(self._get_glossary(glossary.name))
+
+
+class CountingRateLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self, characters: int = 0) -> None:
+        self.acquired += 1
+
+    def report_quota_exceeded(self) -> None:
+        pass
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    # 本地术语表csv位于output/下（merge_xlsx_files.py的输出）
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("output")
+    for glossary_id in GLOSSARY_URI_DICT:
+        with open(os.path.join("output", glossary_id + ".csv"), "w", encoding="utf-8") as file_output:
+            file_output.write("zh-CN,ko\n勇者,용사\n")
+    return tmp_path
+
+
+def _sync(client: FakeClient, rate_limiter: CountingRateLimiter) -> dict:
+    return glossary_tools.sync_glossaries(PROJECT_ID, GLOSSARY_URI_DICT, client=client, rate_limiter=rate_limiter,
+                                          sync_state_path="sync_state.json", poll_interval=0)
+
+
+def test_sync_creates_missing_glossaries_only(workspace):
+    client = FakeClient({FakeClient.glossary_path(PROJECT_ID, "us-central1", "glossary_a"): 10})
+    summary = _sync(client, CountingRateLimiter())
+    assert summary["created"] == ["glossary_b"]
+    assert summary["deleted"] == []
+    assert summary["unchanged"] == ["glossary_a"]
+    assert summary["errors"] == {}
+
+
+def test_sync_recreates_changed_glossaries(workspace):
+    client = FakeClient({})
+    _sync(client, CountingRateLimiter())
+    with open(os.path.join("output", "glossary_a.csv"), "a", encoding="utf-8") as file_output:
+        file_output.write("卡牌,카드\n")
+    client.calls.clear()
+    summary = _sync(client, CountingRateLimiter())
+    assert summary["created"] == ["glossary_a"]
+    assert summary["deleted"] == ["glossary_a"]
+    assert summary["unchanged"] == ["glossary_b"]
+    assert client.calls == ["list", ("delete", "glossary_a"), ("create", "glossary_a")]
+
+
+def test_sync_dry_run_changes_nothing(workspace):
+    client = FakeClient({})
+    summary = glossary_tools.sync_glossaries(PROJECT_ID, GLOSSARY_URI_DICT, client=client,
+                                             rate_limiter=CountingRateLimiter(),
+                                             sync_state_path="sync_state.json", dry_run=True)
+    assert summary["created"] == []
+    assert client.calls == ["list"]
+    assert not os.path.exists("sync_state.json")
+
+
+def test_sync_calls_go_through_the_given_rate_limiter(workspace):
+    rate_limiter = CountingRateLimiter()
+    _sync(FakeClient({}), rate_limiter)
+    # 1次列出 + 2次创建
+    assert rate_limiter.acquired == 3
@@ -0,0 +1,63 @@
+from job_queue import JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JobQueue
+
+
+def test_jobs_are_claimed_in_order(tmp_path):
+    job_queue = JobQueue("model", str(tmp_path / "jobs.sqlite3"))
+    job_id_a = job_queue.put("a.xlsx", {"glossary_id": "glossary_luna"})
+    job_id_b = job_queue.put("b.txt")
+    assert job_queue.pending() == 2
+    assert job_queue.claim() == (job_id_a, "a.xlsx", {"glossary_id": "glossary_luna"})
+    assert job_queue.claim() == (job_id_b, "b.txt", {})
+    assert job_queue.claim() is None
+    assert job_queue.pending() == 0
+    job_queue.close()
+
+
+def test_finish_and_fail(tmp_path):
+    job_queue = JobQueue("model", str(tmp_path / "jobs.sqlite3"))
+    for file_path in ("a.xlsx", "b.txt", "c.csv"):
+        job_queue.put(file_path)
+    job_queue.finish(job_queue.claim()[0])
+    job_queue.finish(job_queue.claim()[0], "2 texts failed and kept the source text")
+    job_queue.fail(job_queue.claim()[0], "file not found")
+    assert [job[1:] for job in job_queue.jobs()] == [
+        ("a.xlsx", JOB_DONE, None),
+        ("b.txt", JOB_DONE, "2 texts failed and kept the source text"),
+        ("c.csv", JOB_FAILED, "file not found"),
+    ]
+    assert [job[1] for job in job_queue.jobs(JOB_FAILED)] == ["c.csv"]
+    job_queue.close()
+
+
+def test_running_jobs_are_queued_again_after_a_crash(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    job_queue = JobQueue("model", db_path)
+    job_id_a = job_queue.put("a.xlsx")
+    job_queue.put("b.txt")
+    job_queue.finish(job_queue.claim()[0])
+    job_id_c = job_queue.put("c.csv")
+    # b.txt翻译到一半时程序退出
+    job_id_b = job_queue.claim()[0]
+    assert [job[2] for job in job_queue.jobs()] == [JOB_DONE, JOB_RUNNING, JOB_QUEUED]
+    job_queue.close()
+
+    job_queue = JobQueue("model", db_path)
+    assert job_queue.pending() == 2
+    assert job_queue.claim()[0] == job_id_b
+    assert job_queue.claim()[0] == job_id_c
+    assert job_queue.jobs(JOB_DONE)[0][0] == job_id_a
+    job_queue.close()
+
+
+def test_queues_are_separated_by_name(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    job_queue_model = JobQueue("model", db_path)
+    job_queue_google = JobQueue("google", db_path)
+    job_queue_model.put("a.xlsx")
+    job_queue_model.claim()
+    # 另一个应用打开队列时不会重新排队其它队列中运行的任务
+    job_queue_google_reopened = JobQueue("google", db_path)
+    assert job_queue_google.claim() is None
+    assert job_queue_model.jobs()[0][2] == JOB_RUNNING
+    for job_queue in (job_queue_model, job_queue_google, job_queue_google_reopened):
+        job_queue.close()
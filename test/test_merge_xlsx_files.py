@@ -0,0 +1,68 @@
+import importlib.util
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("tqdm")
+
+# glossary目录不是包，按文件路径加载（注册到sys.modules，供进程池按模块名找到解析函数）
+_spec = importlib.util.spec_from_file_location("merge_xlsx_files", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "glossary", "merge_xlsx_files.py"))
+merge_xlsx_files = importlib.util.module_from_spec(_spec)
+sys.modules["merge_xlsx_files"] = merge_xlsx_files
+_spec.loader.exec_module(merge_xlsx_files)
+
+
+def _write_glossary(file_path, terms: list) -> None:
+    pd.DataFrame(terms, columns=["zh-CN", "ko"]).to_excel(file_path, index=False)
+
+
+@pytest.fixture
+def glossary_dir(tmp_path, monkeypatch):
+    # 输入输出目录是相对路径（input/、output/），在临时目录中运行
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("input/game_a")
+    _write_glossary("input/game_a/a.xlsx", [("勇者", "용사")])
+    _write_glossary("input/b.xlsx", [("卡牌", "카드"), (100, "100")])
+    return tmp_path
+
+
+def _merge() -> pd.DataFrame:
+    return merge_xlsx_files.merge_xlsx_files("input/", max_workers=1)
+
+
+def test_merge_writes_every_output(glossary_dir):
+    df_all = _merge()
+    assert df_all["zh-CN"].tolist() == ["卡牌", 100, "勇者"]
+    assert df_all.columns.tolist() == ["zh-CN", "ko", "source"]
+    for extension in (".xlsx", ".csv", ".feather", ".parquet"):
+        assert os.path.exists("glossary_all" + extension)
+    assert pd.read_parquet("glossary_all.parquet")["zh-CN"].tolist() == ["卡牌", "100", "勇者"]
+
+
+def test_unchanged_files_are_not_parsed_again(glossary_dir):
+    _merge()
+    cache_file = merge_xlsx_files.get_output_paths("input/b.xlsx")[1]
+    mtime_cache = os.stat(cache_file).st_mtime_ns
+    mtime_output = os.stat("glossary_all.csv").st_mtime_ns
+    manifest = merge_xlsx_files.load_manifest()
+    assert merge_xlsx_files.get_changed_files(sorted(manifest), manifest) == []
+    # 只被touch过（内容没变）的文件同样不重新解析
+    os.utime("input/b.xlsx")
+    df_all = _merge()
+    assert os.stat(cache_file).st_mtime_ns == mtime_cache
+    assert os.stat("glossary_all.csv").st_mtime_ns == mtime_output
+    assert df_all["zh-CN"].tolist() == ["卡牌", 100, "勇者"]
+
+
+def test_changed_and_removed_files_are_merged_again(glossary_dir):
+    _merge()
+    _write_glossary("input/game_a/a.xlsx", [("勇者", "용사"), ("魔王", "마왕")])
+    assert _merge()["zh-CN"].tolist() == ["卡牌", 100, "勇者", "魔王"]
+    os.remove("input/b.xlsx")
+    assert _merge()["zh-CN"].tolist() == ["勇者", "魔王"]
+    assert list(merge_xlsx_files.load_manifest()) == [os.path.join("input/game_a", "a.xlsx")]
+    assert pd.read_csv("glossary_all.csv")["zh-CN"].tolist() == ["勇者", "魔王"]
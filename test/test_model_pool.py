@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("optimum.onnxruntime")
+pytest.importorskip("PyQt5.QtCore")
+
+import model_pool  # noqa: E402
+from model_pool import ModelProcessPool, get_model_size, get_pool_size  # noqa: E402
+
+GB = 1024 * 1024 * 1024
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    # 2GB的权重文件（稀疏文件，不占磁盘）
+    with open(tmp_path / "model.safetensors", "wb") as file_output:
+        file_output.truncate(2 * GB)
+    with open(tmp_path / "pytorch_model.bin", "wb") as file_output:
+        file_output.truncate(4 * GB)
+    (tmp_path / "config.json").write_text("{}")
+    return str(tmp_path)
+
+
+def test_get_model_size_prefers_safetensors(model_dir):
+    assert get_model_size(model_dir) == 2 * GB
+    assert get_model_size("facebook/nllb-200-distilled-600M") == 0
+
+
+def test_get_pool_size_is_capped_by_max_memory(model_dir):
+    # 每个工作进程约3GB
+    assert get_pool_size(model_dir, num_workers=8, max_memory=16 * GB) == 5
+    assert get_pool_size(model_dir, num_workers=8, max_memory=16 * GB, loaded_copies=1) == 4
+    assert get_pool_size(model_dir, num_workers=2, max_memory=16 * GB) == 2
+    assert get_pool_size(model_dir, num_workers=2, max_memory=None) == 2
+    assert get_pool_size("facebook/nllb-200-distilled-600M", num_workers=2, max_memory=GB) == 2
+
+
+def test_get_pool_size_is_zero_when_no_worker_fits(model_dir):
+    assert get_pool_size(model_dir, num_workers=8, max_memory=5 * GB, loaded_copies=1) == 0
+    assert get_pool_size(model_dir, num_workers=8, max_memory=2 * GB) == 0
+
+
+def test_pool_refuses_to_go_over_max_memory(model_dir, monkeypatch):
+    def fail_start(*args, **kwargs):
+        raise AssertionError("the pool started workers")
+
+    monkeypatch.setattr(model_pool, "ProcessPoolExecutor", fail_start)
+    with pytest.raises(ValueError):
+        ModelProcessPool(model_dir, num_workers=8, max_memory=5 * GB, loaded_copies=1)
@@ -0,0 +1,214 @@
+import io
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocess import (copy_dataframe_columns, count_lines, deduplicate_texts, expand_texts, get_dataframe_texts,
+                        get_deduplication_stats, get_translatable_indexes, is_translatable_text, join_segments,
+                        set_dataframe_texts, split_segments, translate_deduplicated)
+
+TEXTS = [
+    "你好\n",
+    "",
+    "  ",
+    "第一句。第二句！\n第三句",
+    "  前后都有空白  ",
+    "Hello world. Bye.",
+    "3.14是小数。",
+    "没有句末标点",
+]
+
+
+def test_deduplicate_texts_keeps_the_order_of_first_occurrence():
+    unique_texts, inverse_indexes = deduplicate_texts(["乙", "甲", "乙", "", "甲", ""])
+    assert unique_texts == ["乙", "甲", ""]
+    assert inverse_indexes == [0, 1, 0, 2, 1, 2]
+
+
+def test_expand_texts_restores_every_occurrence():
+    texts = ["乙", "甲", "乙", "", "甲"]
+    unique_texts, inverse_indexes = deduplicate_texts(texts)
+    assert expand_texts(unique_texts, inverse_indexes) == texts
+    assert expand_texts(["T:" + text for text in unique_texts], inverse_indexes) == ["T:" + text for text in texts]
+
+
+def test_deduplicate_texts_of_an_empty_list():
+    assert deduplicate_texts([]) == ([], [])
+    assert expand_texts([], []) == []
+
+
+def test_get_deduplication_stats():
+    texts = ["甲乙", "甲乙", "丙"]
+    stats = get_deduplication_stats(texts, deduplicate_texts(texts)[0])
+    assert stats["texts"] == 3 and stats["unique_texts"] == 2
+    assert stats["characters"] == 5 and stats["unique_characters"] == 3
+    assert stats["saved_ratio"] == pytest.approx(0.4)
+    assert get_deduplication_stats([], [])["saved_ratio"] == 0.0
+
+
+def test_translate_deduplicated_sends_every_unique_text_once():
+    calls = []
+
+    def translate_function(texts: list) -> list:
+        calls.append(list(texts))
+        return ["T:" + text for text in texts]
+
+    texts_translated, stats = translate_deduplicated(["甲", "乙", "甲", "甲"], translate_function)
+    assert texts_translated == ["T:甲", "T:乙", "T:甲", "T:甲"]
+    assert calls == [["甲", "乙"]]
+    assert stats["unique_texts"] == 2
+
+
+def _get_iterrows_texts(df: pd.DataFrame, column_positions: list = None) -> tuple:
+    # 向量化之前逐行提取单元格的写法
+    texts, coordinates = [], []
+    for row_position, (_, row) in enumerate(df.iterrows()):
+        for column_position, cell_value in enumerate(row):
+            if column_positions is not None and column_position not in column_positions:
+                continue
+            if isinstance(cell_value, float) and math.isnan(cell_value):
+                continue
+            texts.append(str(cell_value))
+            coordinates.append((row_position, column_position))
+    return texts, coordinates
+
+
+@pytest.mark.parametrize("content", [
+    # 文字、整数与缺失值混排
+    "name,count,note\n勇者,1,\n卡牌,,备注\n,3,\n",
+    # 只有数字（含缺失值，整列变为float）
+    "a,b\n1,2.5\n,4\n5,\n",
+    # 只有整数
+    "a,b\n1,2\n3,4\n",
+    # 只有文字
+    "a,b\n甲,乙\n丙,丁\n",
+    # 布尔值与文字
+    "flag,text\nTrue,是\nFalse,否\n",
+])
+@pytest.mark.parametrize("column_positions", [None, [1]])
+def test_get_dataframe_texts_matches_iterrows(content, column_positions):
+    df = pd.read_csv(io.StringIO(content))
+    texts, (rows, columns) = get_dataframe_texts(df, column_positions)
+    texts_expected, coordinates_expected = _get_iterrows_texts(df, column_positions)
+    assert texts == texts_expected
+    assert list(zip(rows.tolist(), columns.tolist())) == coordinates_expected
+
+
+def test_get_dataframe_texts_reads_as_strings():
+    df = pd.read_csv(io.StringIO("a,b\n001,x\n,y\n"), dtype=str)
+    texts, (rows, columns) = get_dataframe_texts(df)
+    assert texts == ["001", "x", "y"]
+    assert np.array_equal(rows, [0, 0, 1]) and np.array_equal(columns, [0, 1, 1])
+
+
+def test_set_dataframe_texts_writes_back_in_place():
+    df = pd.read_csv(io.StringIO("a,b\n甲,1\n,乙\n"))
+    texts, coordinates = get_dataframe_texts(df)
+    set_dataframe_texts(df, coordinates, ["T:" + text for text in texts])
+    assert df.iloc[0].tolist() == ["T:甲", "T:1"]
+    assert math.isnan(df.iloc[1, 0]) and df.iloc[1, 1] == "T:乙"
+
+
+def test_set_dataframe_texts_writes_to_the_target_column():
+    df = pd.read_csv(io.StringIO("a,b\n甲,\n乙,\n"))
+    texts, coordinates = get_dataframe_texts(df, [0])
+    set_dataframe_texts(df, coordinates, ["T:" + text for text in texts], {0: 1})
+    assert df["a"].tolist() == ["甲", "乙"]
+    assert df["b"].tolist() == ["T:甲", "T:乙"]
+
+
+@pytest.mark.parametrize("content, len_lines", [
+    (b"", 0),
+    (b"a\n", 1),
+    (b"a\nb\n", 2),
+    # 最后一行没有换行符
+    (b"a\nb", 2),
+    (b"a", 1),
+])
+def test_count_lines(tmp_path, content, len_lines):
+    file_path = tmp_path / "lines.txt"
+    file_path.write_bytes(content)
+    assert count_lines(str(file_path)) == len_lines
+
+
+def test_copy_dataframe_columns_keeps_the_target_where_the_source_is_empty():
+    df = pd.read_csv(io.StringIO("a,b,c\n甲,1,旧\n,2,旧\n"))
+    copy_dataframe_columns(df, {0: 2, 1: 1})
+    assert df["c"].tolist() == ["甲", "旧"]
+    assert df["b"].tolist() == [1, 2]
+
+
+@pytest.mark.parametrize("text", [
+    "", "  \n",
+    # 数字
+    "42", "-3.5", "1,000", "12.5%", "1e-3",
+    # UUID
+    "123e4567-e89b-12d3-a456-426614174000",
+    # 路径、URL、文件名
+    "ui/icons/sword.png", "C:\\game\\data.bin", "https://example.com/a?b=1", "sword.png",
+    # 占位符与标点
+    "{0}", "%s: %d", "<br/>", "[ITEM_NAME]", "\\n", "$name$", "{0}/{1}", "...",
+    # 源语言为中文时不含汉字的文本
+    "용사", "hello",
+])
+def test_texts_not_to_translate(text):
+    assert not is_translatable_text(text, "zh-CN")
+
+
+@pytest.mark.parametrize("text", [
+    "勇者", "  勇者  ", "获得{0}金币", "<b>攻击力</b>+10%", "%s的背包", "第1关",
+])
+def test_texts_to_translate(text):
+    assert is_translatable_text(text, "zh-CN")
+
+
+def test_is_translatable_text_by_source_language():
+    assert is_translatable_text("용사 {0}", "ko") and not is_translatable_text("勇者", "ko")
+    assert is_translatable_text("カード", "ja") and is_translatable_text("勇者", "ja")
+    # 没有已知文字的源语言：英文句子要翻译，键名不翻译
+    assert is_translatable_text("Hello world", "en")
+    assert not is_translatable_text("item.sword_name", "en") and not is_translatable_text("ITEM_NAME_01", "en")
+
+
+def test_get_translatable_indexes_skips_non_strings():
+    assert get_translatable_indexes(["勇者", 42, None, "100", "卡牌"], "zh-CN") == [0, 4]
+
+
+def _translate_identity(segments: list) -> list:
+    return [segment[2] for segment in segments]
+
+
+def test_split_segments_strips_every_segment():
+    for text_index, leading, segment, trailing in split_segments(TEXTS):
+        assert segment == segment.strip()
+        assert (leading + segment + trailing).strip() == segment
+
+
+def test_split_segments_strips_single_piece_text():
+    assert split_segments(["你好\n"]) == [(0, "", "你好", "\n")]
+
+
+def test_split_segments_keeps_one_segment_per_empty_text():
+    assert split_segments(["", "  "]) == [(0, "", "", ""), (1, "  ", "", "")]
+
+
+@pytest.mark.parametrize("target_language_code", ["zh-CN", "zh-TW", "ja"])
+def test_join_segments_round_trip(target_language_code):
+    segments = split_segments(TEXTS)
+    assert join_segments(segments, _translate_identity(segments), len(TEXTS), target_language_code) == TEXTS
+
+
+def test_join_segments_adds_separator_between_sentences_for_spaced_languages():
+    texts = ["第一句。第二句！\n第三句", "你好\n"]
+    segments = split_segments(texts)
+    assert join_segments(segments, _translate_identity(segments), len(texts), "ko") == \
+        ["第一句。 第二句！\n第三句", "你好\n"]
+
+
+def test_join_segments_round_trip_with_custom_split_function():
+    texts = ["aaaa bbbb cccc", " dd "]
+    segments = split_segments(texts, lambda text: [text[index:index + 5] for index in range(0, len(text), 5)])
+    assert [segment[2] for segment in segments] == ["aaaa", "bbbb", "cccc", "dd"]
+    assert join_segments(segments, _translate_identity(segments), len(texts), "zh-CN") == texts
@@ -0,0 +1,166 @@
+import json
+import os
+
+import pytest
+
+import rate_limit
+from rate_limit import AdaptiveRateLimiter, call_with_retry
+
+
+class FakeClock:
+    """
+    Stands in for the time module of rate_limit, sleeping only moves the clock forward.
+    """
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", fake_clock)
+    return fake_clock
+
+
+class Flaky:
+    def __init__(self, failures: int, exception: Exception):
+        self.failures = failures
+        self.exception = exception
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.exception
+        return "ok"
+
+
+def test_call_with_retry_backs_off_until_success(clock):
+    function = Flaky(3, TimeoutError("busy"))
+    retries = []
+    assert call_with_retry(function, (TimeoutError,), 5, initial_delay=1.0, max_delay=3.0,
+                           on_retry=lambda e, retry, delay: retries.append((retry, delay))) == "ok"
+    assert function.calls == 4
+    assert [retry for retry, _ in retries] == [1, 2, 3]
+    # 一半固定、一半随机：第n次重试等待[d/2, d]，d = min(max_delay, initial_delay * 2 ** (n - 1))
+    for (_, delay), max_delay in zip(retries, [1.0, 2.0, 3.0]):
+        assert max_delay / 2 <= delay <= max_delay
+    assert clock.sleeps == [delay for _, delay in retries]
+
+
+def test_call_with_retry_raises_when_retries_are_used_up(clock):
+    function = Flaky(10, TimeoutError("busy"))
+    with pytest.raises(TimeoutError):
+        call_with_retry(function, (TimeoutError,), 2)
+    assert function.calls == 3
+
+
+def test_call_with_retry_does_not_retry_other_exceptions(clock):
+    function = Flaky(1, ValueError("bad request"))
+    with pytest.raises(ValueError):
+        call_with_retry(function, (TimeoutError,), 5)
+    assert function.calls == 1
+    assert clock.sleeps == []
+
+
+def test_acquire_waits_for_the_bucket_to_refill(clock):
+    limiter = AdaptiveRateLimiter(None, characters_per_minute=600)
+    limiter.acquire(600)
+    assert clock.sleeps == []
+    # 600字符/分钟，即10字符/秒
+    limiter.acquire(60)
+    assert sum(clock.sleeps) == pytest.approx(6.0)
+
+
+def test_acquire_limits_requests_per_minute(clock):
+    limiter = AdaptiveRateLimiter(None, requests_per_minute=60)
+    for _ in range(60):
+        limiter.acquire()
+    limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+
+def test_oversized_request_waits_for_a_full_bucket(clock):
+    limiter = AdaptiveRateLimiter(None, characters_per_minute=600)
+    limiter.acquire(600)
+    limiter.acquire(1200)
+    assert sum(clock.sleeps) == pytest.approx(60.0)
+
+
+def test_quota_error_shrinks_the_rate(clock):
+    limiter = AdaptiveRateLimiter(None, characters_per_minute=1000, decrease_factor=0.5, decrease_cooldown=5.0)
+    limiter.report_quota_exceeded()
+    assert limiter.rate()["characters"] == pytest.approx(500)
+    # 冷却时间内的配额错误来自已在途的请求，不再降低
+    clock.now += 1
+    limiter.report_quota_exceeded()
+    assert limiter.rate()["characters"] == pytest.approx(500, rel=0.01)
+    clock.now += 5
+    limiter.report_quota_exceeded()
+    assert limiter.rate()["characters"] == pytest.approx(250, rel=0.02)
+
+
+def test_quota_error_empties_the_bucket(clock):
+    limiter = AdaptiveRateLimiter(None, characters_per_minute=600, decrease_factor=0.5)
+    limiter.report_quota_exceeded()
+    limiter.acquire(30)
+    # 速率减半后为5字符/秒
+    assert sum(clock.sleeps) == pytest.approx(6.0, rel=0.05)
+
+
+def test_rate_never_drops_below_min_scale(clock):
+    limiter = AdaptiveRateLimiter(None, characters_per_minute=1000, decrease_factor=0.1, min_scale=0.05,
+                                  decrease_cooldown=0)
+    for _ in range(5):
+        limiter.report_quota_exceeded()
+    assert limiter.rate()["characters"] == pytest.approx(50)
+
+
+def test_rate_recovers_linearly_up_to_the_quota(clock):
+    limiter = AdaptiveRateLimiter(None, characters_per_minute=1000, decrease_factor=0.5, recovery_per_minute=0.1)
+    limiter.report_quota_exceeded()
+    clock.now += 60
+    assert limiter.rate()["characters"] == pytest.approx(600)
+    clock.now += 120
+    assert limiter.rate()["characters"] == pytest.approx(800)
+    clock.now += 3600
+    assert limiter.rate()["characters"] == pytest.approx(1000)
+
+
+def test_unlimited_dimensions_are_not_tracked(clock):
+    limiter = AdaptiveRateLimiter(None)
+    for _ in range(1000):
+        limiter.acquire(10 ** 6)
+    assert clock.sleeps == []
+    assert limiter.rate() == {}
+
+
+def test_learned_rate_is_shared_through_the_state_file(clock, tmp_path):
+    pytest.importorskip("filelock")
+    state_path = str(tmp_path / "rate_limit.json")
+    limiter = AdaptiveRateLimiter(state_path, characters_per_minute=1000)
+    limiter.report_quota_exceeded()
+    # 另一个进程（或下一次运行）读到学到的速率
+    limiter_other = AdaptiveRateLimiter(state_path, characters_per_minute=1000)
+    assert limiter_other.rate()["characters"] == pytest.approx(500)
+    with open(state_path, "r", encoding="utf-8") as file_input:
+        assert json.load(file_input)["scale"] == pytest.approx(0.5)
+    # 状态文件整体替换，不留下临时文件
+    assert sorted(os.listdir(str(tmp_path))) == ["rate_limit.json", "rate_limit.json.lock"]
+
+
+def test_changed_quota_settings_start_over(clock, tmp_path):
+    pytest.importorskip("filelock")
+    state_path = str(tmp_path / "rate_limit.json")
+    AdaptiveRateLimiter(state_path, characters_per_minute=1000).report_quota_exceeded()
+    limiter = AdaptiveRateLimiter(state_path, requests_per_minute=60, characters_per_minute=1000)
+    assert limiter.rate() == {"requests": pytest.approx(60), "characters": pytest.approx(1000)}
@@ -0,0 +1,287 @@
+import threading
+import time
+import types
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+
+pytest.importorskip("PyQt5.QtCore")
+google_exceptions = pytest.importorskip("google.api_core.exceptions")
+pytest.importorskip("google.cloud.translate_v3")
+
+import translate  # noqa: E402
+from column_selector import ColumnSelector  # noqa: E402
+from rate_limit import AdaptiveRateLimiter  # noqa: E402
+
+
+class FakeClient:
+    """
+    Records the contents of every translate_text request and the max number of requests in flight,
+    rejects the requests containing "BAD", answers RESOURCE_EXHAUSTED to the first quota_errors requests
+    and raises error (if any) for every request.
+    """
+
+    def __init__(self, delay: float = 0.0, quota_errors: int = 0, error: Exception = None):
+        self.delay = delay
+        self.quota_errors = quota_errors
+        self.error = error
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def translate_text(self, request: dict):
+        contents = list(request["contents"])
+        with self._lock:
+            self.requests.append(contents)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+            if self.quota_errors > 0:
+                self.quota_errors -= 1
+                raise google_exceptions.ResourceExhausted("quota exceeded")
+        if self.error is not None:
+            raise self.error
+        if any("BAD" in content for content in contents):
+            raise google_exceptions.InvalidArgument("bad content")
+        translations = [types.SimpleNamespace(translated_text="T:" + content) for content in contents]
+        return types.SimpleNamespace(translations=translations, glossary_translations=translations)
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = []
+        self._lock = threading.Lock()
+
+    def acquire(self, characters: int = 0) -> None:
+        with self._lock:
+            self.acquired.append(characters)
+
+    def report_quota_exceeded(self) -> None:
+        pass
+
+
+class FakeSignal:
+    def __init__(self):
+        self.values = []
+
+    def emit(self, value: int) -> None:
+        self.values.append(value)
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(translate, "TRANSLATION_API_RETRY_INITIAL_DELAY", 0.0)
+    monkeypatch.setattr(translate, "TRANSLATION_API_RETRY_MAX_DELAY", 0.0)
+
+
+def _new_usage() -> dict:
+    return {"requests": 0, "characters": 0, "retries": 0, "failed_requests": 0, "failed_texts": 0}
+
+
+def _translate(texts: list, client: FakeClient, **kwargs) -> list:
+    kwargs.setdefault("quota_limiter", AdaptiveRateLimiter(None))
+    return translate.translate_texts(texts, "project", "zh-CN", "ko", client=client, **kwargs)
+
+
+def test_pack_batches_by_codepoints():
+    assert translate._pack_batches(["aaa", "bb", "c", "dddd", "e"], 5, 100) == [(0, 2), (2, 4), (4, 5)]
+
+
+def test_pack_batches_by_items():
+    assert translate._pack_batches(["a"] * 5, 100, 2) == [(0, 2), (2, 4), (4, 5)]
+
+
+def test_pack_batches_keeps_a_full_text_alone():
+    assert translate._pack_batches(["aaaaa", "b", "ccccc"], 5, 100) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_pack_batches_of_nothing():
+    assert translate._pack_batches([], 5, 100) == []
+
+
+def test_split_oversized_text():
+    text = "第一句。第二句很长很长。第三句。"
+    pieces = translate._split_oversized_text(text, 8)
+    assert "".join(pieces) == text
+    assert all(len(piece) <= 8 for piece in pieces)
+    assert translate._split_oversized_text("短句", 8) == ["短句"]
+
+
+def test_oversized_text_is_sent_in_pieces_and_joined_back():
+    client = FakeClient()
+    text = "第一句。第二句很长很长。第三句。"
+    assert _translate([text, "短"], client, max_codepoints=8) == ["T:第一句。 T:第二句很长很长。 T:第三句。", "T:短"]
+    assert all(sum(len(content) for content in request) <= 8 for request in client.requests)
+
+
+def test_translate_texts_packs_requests_and_keeps_the_order():
+    client = FakeClient()
+    usage = _new_usage()
+    texts = ["一", "二", "三", "四", "五"]
+    assert _translate(texts, client, batch_size=2, usage=usage) == ["T:" + text for text in texts]
+    assert sorted(client.requests) == [["一", "二"], ["三", "四"], ["五"]]
+    assert usage["requests"] == 3 and usage["characters"] == 5
+
+
+def test_batches_are_sent_concurrently_up_to_max_workers():
+    client = FakeClient(delay=0.05)
+    texts = [str(index) for index in range(12)]
+    assert _translate(texts, client, batch_size=1, max_workers=3) == ["T:" + text for text in texts]
+    assert client.max_in_flight == 3
+
+
+def test_every_batch_goes_through_the_limiter():
+    limiter = CountingLimiter()
+    _translate(["一二", "三", "四五六"], FakeClient(), batch_size=2, quota_limiter=limiter)
+    assert sorted(limiter.acquired) == [3, 3]
+
+
+def test_progress_is_reported_per_finished_batch():
+    progress_bar_init, progress_bar_num = FakeSignal(), FakeSignal()
+    _translate(["一", "二", "三"], FakeClient(), batch_size=2, max_workers=1,
+               progress_bar_init=progress_bar_init, progress_bar_num=progress_bar_num)
+    assert progress_bar_init.values == [3]
+    assert progress_bar_num.values == [2, 3]
+
+
+def test_translate_texts_does_not_send_blank_segments():
+    client = FakeClient()
+    assert _translate(["你好\n", "", "  "], client) == ["T:你好\n", "", "  "]
+    assert client.requests == [["你好"]]
+
+
+def test_bisection_isolates_the_failing_text():
+    client = FakeClient()
+    usage = _new_usage()
+    texts = ["一", "BAD", "三", "四"]
+    assert _translate(texts, client, usage=usage) == ["T:一", "BAD", "T:三", "T:四"]
+    # 4 -> 2 + 2 -> (1 + 1) + 2
+    assert client.requests[0] == texts
+    assert ["BAD"] in client.requests
+    assert usage["failed_texts"] == 1
+    assert usage["failed_requests"] == 3
+
+
+def test_failed_texts_are_none_without_fallback():
+    assert _translate(["一", "BAD"], FakeClient(), fallback_to_source=False) == ["T:一", None]
+
+
+def test_quota_error_is_retried_and_shrinks_the_rate():
+    client = FakeClient(quota_errors=1)
+    limiter = AdaptiveRateLimiter(None, characters_per_minute=1000)
+    usage = _new_usage()
+    assert _translate(["一", "二"], client, quota_limiter=limiter, usage=usage) == ["T:一", "T:二"]
+    assert usage["retries"] == 1 and usage["failed_texts"] == 0
+    assert limiter.rate()["characters"] < 1000
+
+
+def test_quota_error_after_the_retries_fails_the_whole_batch(monkeypatch):
+    monkeypatch.setattr(translate, "TRANSLATION_API_MAX_RETRIES", 1)
+    client = FakeClient(quota_errors=2)
+    usage = _new_usage()
+    assert _translate(["一", "二"], client, usage=usage) == ["一", "二"]
+    # 配额错误不拆分批次
+    assert client.requests == [["一", "二"], ["一", "二"]]
+    assert usage["failed_texts"] == 2
+
+
+@pytest.mark.parametrize("error", [
+    google_exceptions.NotFound("glossary not found"),
+    google_exceptions.PermissionDenied("permission denied"),
+])
+def test_errors_not_caused_by_the_texts_are_raised(error):
+    client = FakeClient(error=error)
+    with pytest.raises(type(error)):
+        _translate(["一", "二", "三"], client)
+    # 不拆分、不重试
+    assert client.requests == [["一", "二", "三"]]
+
+
+def test_txt_file_is_translated_chunk_by_chunk(tmp_path, monkeypatch):
+    chunks = []
+
+    def fake_translate_texts(texts: list, *args, **kwargs) -> list:
+        chunks.append(list(texts))
+        return ["T:" + text for text in texts]
+
+    monkeypatch.setattr(translate, "translate_texts", fake_translate_texts)
+    file_path = tmp_path / "document.txt"
+    file_path.write_text("你好\n\n123\n世界\n你好\n再见", encoding="utf-8")
+    progress_bar_init, progress_bar_num = FakeSignal(), FakeSignal()
+    translator = translate.TxtFileTranslator()
+    translator.chunk_size = 2
+    translator.translate(str(file_path), "project", "zh-CN", "ko",
+                         progress_bar_init=progress_bar_init, progress_bar_num=progress_bar_num)
+    assert (tmp_path / "document_translated.txt").read_text(encoding="utf-8") == \
+        "T:你好\n\n123\nT:世界\nT:你好\nT:再见"
+    # 每块只送可翻译的行，块内去重
+    assert chunks == [["你好\n"], ["世界\n"], ["你好\n", "再见"]]
+    assert progress_bar_init.values == [6]
+    assert progress_bar_num.values == [2, 4, 6]
+    assert translator.deduplication_stats["texts"] == 4
+
+
+def test_large_csv_file_is_translated_chunk_by_chunk(tmp_path, monkeypatch):
+    chunks = []
+
+    def fake_translate_texts(texts: list, *args, **kwargs) -> list:
+        chunks.append(list(texts))
+        return ["T:" + text for text in texts]
+
+    monkeypatch.setattr(translate, "translate_texts", fake_translate_texts)
+    file_path = tmp_path / "document.csv"
+    file_path.write_text("name,count\n勇者,1\n卡牌,2\n勇者,3\n魔王,4\n宝箱,5", encoding="utf-8")
+    progress_bar_init, progress_bar_num = FakeSignal(), FakeSignal()
+    translator = translate.CsvFileTranslator()
+    translator.chunked_threshold = 0
+    translator.chunk_size = 2
+    translator.translate(str(file_path), "project", "zh-CN", "ko",
+                         progress_bar_init=progress_bar_init, progress_bar_num=progress_bar_num)
+    assert (tmp_path / "document_translated.csv").read_text(encoding="utf-8").splitlines() == [
+        "name,count", "T:勇者,1", "T:卡牌,2", "T:勇者,3", "T:魔王,4", "T:宝箱,5",
+    ]
+    assert chunks == [["勇者", "卡牌"], ["勇者", "魔王"], ["宝箱"]]
+    # 表头不计入行数，最后一行没有换行符也计入
+    assert progress_bar_init.values == [5]
+    assert progress_bar_num.values == [2, 4, 5]
+
+
+@pytest.fixture
+def fake_translate_texts(monkeypatch):
+    def fake_translate_texts(texts: list, *args, **kwargs) -> list:
+        return ["T:" + text for text in texts]
+
+    monkeypatch.setattr(translate, "translate_texts", fake_translate_texts)
+
+
+@pytest.mark.parametrize("chunked_threshold", [0, 1024 * 1024])
+def test_skipped_cells_of_a_mixed_column_are_copied_to_the_target_column(tmp_path, fake_translate_texts,
+                                                                         chunked_threshold):
+    file_path = tmp_path / "document.csv"
+    file_path.write_text("id,zh\n1,勇者\n2,100\n3,\n4,icon/a.png\n", encoding="utf-8")
+    translator = translate.CsvFileTranslator()
+    translator.chunked_threshold = chunked_threshold
+    translator.translate(str(file_path), "project", "zh-CN", "ko",
+                         column_selector=ColumnSelector(source_columns=["zh"], target_column="ko"))
+    df = pd.read_csv(tmp_path / "document_translated.csv", dtype=str, keep_default_na=False)
+    assert df["zh"].tolist() == ["勇者", "100", "", "icon/a.png"]
+    assert df["ko"].tolist() == ["T:勇者", "100", "", "icon/a.png"]
+
+
+def test_skipped_cells_of_a_mixed_excel_column_are_copied_to_the_target_column(tmp_path, fake_translate_texts):
+    workbook = Workbook()
+    worksheet = workbook.active
+    for row in [["id", "zh"], [1, "勇者"], [2, 100], [3, None], [4, "icon/a.png"]]:
+        worksheet.append(row)
+    file_path = tmp_path / "document.xlsx"
+    workbook.save(file_path)
+    translate.ExcelFileTranslator().translate(str(file_path), "project", "zh-CN", "ko",
+                                              column_selector=ColumnSelector(source_columns=["zh"],
+                                                                             target_column="ko"))
+    worksheet = load_workbook(tmp_path / "document_translated.xlsx").active
+    assert [cell.value for cell in worksheet["B"]] == ["zh", "勇者", 100, None, "icon/a.png"]
+    assert [cell.value for cell in worksheet["C"]] == ["ko", "T:勇者", 100, None, "icon/a.png"]
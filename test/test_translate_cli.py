@@ -0,0 +1,51 @@
+import pytest
+
+from settings import MODEL_POOL_ENABLED
+from translate_cli import parse_args
+
+
+def test_defaults():
+    args = parse_args(["docs"])
+    assert args.paths == ["docs"]
+    assert args.engine == "google" and args.source == "zh-CN" and args.target == "ko"
+    assert args.pool == MODEL_POOL_ENABLED and args.generation_profile is None and not args.no_memory
+
+
+def test_pool_can_be_turned_on_and_off():
+    assert parse_args(["docs", "--pool"]).pool
+    assert not parse_args(["docs", "--no-pool"]).pool
+    assert not parse_args(["docs", "--pool", "--no-pool"]).pool
+
+
+def test_column_options():
+    args = parse_args(["a.xlsx", "--columns", "zh", "desc", "--sheets", "文本", "--target-column", "{column}_ko"])
+    assert args.columns == ["zh", "desc"] and args.sheets == ["文本"] and args.target_column == "{column}_ko"
+
+
+@pytest.mark.parametrize("generation_profile", ["ui-fast", "dialogue-quality", "auto"])
+def test_generation_profile_choices(generation_profile):
+    assert parse_args(["docs", "--generation-profile", generation_profile]).generation_profile == generation_profile
+
+
+def test_unknown_generation_profile_is_rejected(capsys):
+    with pytest.raises(SystemExit) as exc_info:
+        parse_args(["docs", "--generation-profile", "fastest"])
+    assert exc_info.value.code == 2
+    assert "--generation-profile" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("argv", [
+    ["docs", "--engine", "model", "--source", "fr"],
+    ["docs", "--engine", "model", "--target", "zh"],
+])
+def test_language_not_supported_by_the_model_is_rejected(argv, capsys):
+    with pytest.raises(SystemExit) as exc_info:
+        parse_args(argv)
+    assert exc_info.value.code == 2
+    assert "not supported by the model engine" in capsys.readouterr().err
+
+
+def test_model_languages_are_accepted_and_google_languages_are_not_checked():
+    args = parse_args(["docs", "--engine", "model", "--source", "ko", "--target", "zh-TW"])
+    assert (args.source, args.target) == ("ko", "zh-TW")
+    assert parse_args(["docs", "--source", "fr"]).source == "fr"
@@ -0,0 +1,97 @@
+import threading
+import time
+import types
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("optimum.onnxruntime")
+pytest.importorskip("PyQt5.QtCore")
+
+import translate_with_custom_model  # noqa: E402
+from translate_with_custom_model import LanguagePairTranslator, translate_texts  # noqa: E402
+
+
+class BorrowCheckingTokenizer:
+    """
+    Raises like a fast tokenizer of the tokenizers library when two threads use it at the same time.
+    """
+
+    def __init__(self):
+        self._borrowed = threading.Lock()
+
+    def __call__(self, texts: list, **kwargs) -> dict:
+        if not self._borrowed.acquire(blocking=False):
+            raise RuntimeError("Already borrowed")
+        try:
+            time.sleep(0.01)
+            return {"input_ids": [list(text) for text in texts]}
+        finally:
+            self._borrowed.release()
+
+
+class FakePipeline:
+    """
+    Tokenizes the inputs with the shared tokenizer, like a translation pipeline does.
+    """
+
+    def __init__(self):
+        self.tokenizer = BorrowCheckingTokenizer()
+        self.model = types.SimpleNamespace(name_or_path="fake")
+        self._preprocess_params = {}
+
+    def __call__(self, texts: list, src_lang: str = None, tgt_lang: str = None, **kwargs) -> list:
+        self.tokenizer(texts)
+        return [{"translation_text": "T:" + text} for text in texts]
+
+
+def test_shared_tokenizer_is_not_used_by_two_threads_at_once():
+    translator = FakePipeline()
+    translators = [LanguagePairTranslator(translator, "zho_Hans", "kor_Hang"),
+                   LanguagePairTranslator(translator, "kor_Hang", "zho_Hans")]
+    errors = []
+
+    def run(translator_pair: LanguagePairTranslator, thread_index: int) -> None:
+        try:
+            for round_index in range(5):
+                texts = ["文本{0}-{1}-{2}".format(thread_index, round_index, index) for index in range(3)]
+                assert translate_texts(texts, translator_pair, batch_size=1) == ["T:" + text for text in texts]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(translators[index % 2], index)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_token_lengths_fall_back_to_characters_without_a_tokenizer():
+    assert translate_with_custom_model._get_token_lengths(["一二", "三"], None) == [2, 1]
+    assert translate_with_custom_model._get_token_lengths(["一二", "三"], BorrowCheckingTokenizer()) == [2, 1]
+
+
+def test_onnx_backend_sets_the_session_threads(monkeypatch):
+    calls = {}
+
+    class FakeORTModel:
+        @classmethod
+        def from_pretrained(cls, model_path: str, session_options=None, **kwargs):
+            calls["model_path"], calls["session_options"] = model_path, session_options
+            return cls()
+
+    tokenizer = types.SimpleNamespace(src_lang="zho_Hans", tgt_lang="kor_Hang")
+    monkeypatch.setattr(translate_with_custom_model, "ORTModelForSeq2SeqLM", FakeORTModel)
+    monkeypatch.setattr(translate_with_custom_model, "AutoTokenizer",
+                        types.SimpleNamespace(from_pretrained=lambda model_name: tokenizer))
+    monkeypatch.setattr(translate_with_custom_model, "export_onnx_model", lambda model_name: "exported/" + model_name)
+    monkeypatch.setattr(translate_with_custom_model, "pipeline",
+                        lambda task, **kwargs: types.SimpleNamespace(**kwargs))
+    translator = translate_with_custom_model.load_translator("model", backend="onnx", num_threads=3)
+    assert calls["model_path"] == "exported/model"
+    assert calls["session_options"].intra_op_num_threads == 3
+    assert calls["session_options"].inter_op_num_threads == 1
+    assert translator.device is None and translator.backend == "onnx"
@@ -0,0 +1,68 @@
+from translation_memory import TranslationMemory
+
+
+class CountingTranslator:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts: list) -> list:
+        self.calls.append(list(texts))
+        return ["T:" + text for text in texts]
+
+
+def _translate(tm: TranslationMemory, texts: list, translate_function, engine: str = "google") -> list:
+    return tm.translate(texts, translate_function, "zh-CN", "ko", None, engine)
+
+
+def test_only_the_missed_texts_are_translated(tmp_path):
+    tm = TranslationMemory(str(tmp_path / "tm.sqlite3"))
+    translator = CountingTranslator()
+    assert _translate(tm, ["一", "二"], translator) == ["T:一", "T:二"]
+    assert _translate(tm, ["二", "三", "一"], translator) == ["T:二", "T:三", "T:一"]
+    assert translator.calls == [["一", "二"], ["三"]]
+    assert tm.stats() == {"hits": 2, "misses": 3, "entries": 3}
+    tm.close()
+
+
+def test_translate_function_is_not_called_when_everything_hits(tmp_path):
+    tm = TranslationMemory(str(tmp_path / "tm.sqlite3"))
+    _translate(tm, ["一"], CountingTranslator())
+    translator = CountingTranslator()
+    assert _translate(tm, ["一", "一"], translator) == ["T:一", "T:一"]
+    assert translator.calls == []
+    tm.close()
+
+
+def test_entries_are_keyed_by_the_engine_and_failures_are_not_saved(tmp_path):
+    tm = TranslationMemory(str(tmp_path / "tm.sqlite3"))
+    assert _translate(tm, ["一", "二"], lambda texts: ["T:一", None]) == ["T:一", None]
+    translator = CountingTranslator()
+    _translate(tm, ["一", "二"], translator)
+    _translate(tm, ["一"], translator, engine="nllb")
+    assert translator.calls == [["二"], ["一"]]
+    tm.close()
+
+
+def test_memory_persists_across_reopen(tmp_path):
+    db_path = str(tmp_path / "tm.sqlite3")
+    tm = TranslationMemory(db_path)
+    _translate(tm, ["一"], CountingTranslator())
+    tm.close()
+    tm = TranslationMemory(db_path)
+    translator = CountingTranslator()
+    assert _translate(tm, ["一"], translator) == ["T:一"]
+    assert translator.calls == []
+    tm.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    tm = TranslationMemory(str(tmp_path / "tm.sqlite3"), max_entries=2)
+    translator = CountingTranslator()
+    _translate(tm, ["一"], translator)
+    _translate(tm, ["二"], translator)
+    _translate(tm, ["一"], translator)
+    _translate(tm, ["三"], translator)
+    assert tm.stats()["entries"] == 2
+    _translate(tm, ["一", "二"], translator)
+    assert translator.calls[-1] == ["二"]
+    tm.close()
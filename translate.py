@@ -1,16 +1,93 @@
 # Imports the Google Cloud Translation library
 import html
+import itertools
 import logging
-import math
 import os
+import threading
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
 from PyQt5.QtCore import pyqtSignal
+from google.api_core import exceptions as google_exceptions
 from google.cloud import translate_v3 as translate
 from openpyxl import load_workbook
 
 from settings import *
+from checkpoint import CheckpointJournal
+from column_selector import ColumnSelector
+from excel_streaming import translate_workbook_streaming
+from preprocess import (copy_dataframe_columns, count_lines, get_dataframe_texts, get_translatable_indexes,
+                        join_segments, merge_deduplication_stats, set_dataframe_texts, split_segments, split_sentences,
+                        translate_deduplicated)
+from rate_limit import AdaptiveRateLimiter, call_with_retry
+from translation_client import get_client, get_glossary_config, get_rate_limiter
+from translation_memory import TranslationMemory
+
+
+# the errors of a request that are worth retrying (the quota is exhausted, the service is temporarily unavailable)
+RETRYABLE_EXCEPTIONS = (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable)
+
+
+def _split_oversized_text(text: str, max_codepoints: int) -> list:
+    """
+    Split a text longer than max_codepoints at sentence boundaries.
+    :param text: the text to split
+    :param max_codepoints: the max number of codepoints of every piece
+    :return: the pieces of the text, "".join(pieces) == text
+    """
+    if len(text) <= max_codepoints:
+        return [text]
+    pieces = []
+    piece = ""
+    for sentence in split_sentences(text):
+        # 单句仍然超长时按字符强制切分
+        while len(sentence) > max_codepoints:
+            if piece != "":
+                pieces.append(piece)
+                piece = ""
+            pieces.append(sentence[:max_codepoints])
+            sentence = sentence[max_codepoints:]
+        if len(piece) + len(sentence) > max_codepoints:
+            pieces.append(piece)
+            piece = ""
+        piece += sentence
+    if piece != "":
+        pieces.append(piece)
+    return pieces
+
+
+def _pack_batches(texts: list, max_codepoints: int, max_items: int) -> list:
+    """
+    Pack the texts in order into as few batches as possible.
+    :param texts: the texts to pack, every text is no longer than max_codepoints
+    :param max_codepoints: the max number of codepoints of every batch
+    :param max_items: the max number of texts of every batch
+    :return: the (start, end) index ranges of the batches
+    """
+    batch_ranges = []
+    start = 0
+    codepoints = 0
+    for index, text in enumerate(texts):
+        if index > start and (codepoints + len(text) > max_codepoints or index - start >= max_items):
+            batch_ranges.append((start, index))
+            start = index
+            codepoints = 0
+        codepoints += len(text)
+    if start < len(texts):
+        batch_ranges.append((start, len(texts)))
+    return batch_ranges
+
+
+def get_job_key(source_language_code: str,
+                target_language_code: str,
+                glossary_id: str = None,
+                location: str = "us-central1") -> str:
+    """
+    :return: the settings of a document job that change the translations (the job key of CheckpointJournal)
+    """
+    return "google_translation_v3:{0}:{1}:{2}:{3}".format(location, source_language_code, target_language_code,
+                                                          glossary_id)
 
 
 def translate_texts(
@@ -21,8 +98,16 @@ def translate_texts(
         glossary_id: str = None,
         progress_bar_init: pyqtSignal(int) = None,
         progress_bar_num: pyqtSignal(int) = None,
-        batch_size: int = 200,
+        batch_size: int = TRANSLATION_API_MAX_ITEMS,
         location: str = "us-central1",
+        translation_memory: TranslationMemory = None,
+        max_workers: int = TRANSLATION_API_MAX_WORKERS,
+        quota_limiter: AdaptiveRateLimiter = None,
+        client: translate.TranslationServiceClient = None,
+        max_codepoints: int = TRANSLATION_API_MAX_CODEPOINTS,
+        usage: dict = None,
+        checkpoint: CheckpointJournal = None,
+        fallback_to_source: bool = True,
 ) -> list:
     """
     Translate text with glossary.
@@ -33,49 +118,175 @@ def translate_texts(
     :param glossary_id: your glossary id
     :param progress_bar_init: signal to init the progressbar
     :param progress_bar_num: signal to update the value of progressbar
-    :param batch_size: the size of every batch of the texts to be translated
+    :param batch_size: the max number of texts of every request
     :param location: the location of Google Translation API Resources(you don't need to modify it)
+    :param translation_memory: the translation memory to look up before calling the API (None to disable)
+    :param max_workers: the max number of batch requests in flight at the same time
+    :param quota_limiter: the limiter of requests/characters per minute
+                          (None to use the adaptive limiter of the project shared by all the translators)
+    :param client: the client of Google Translation API (None to use the client shared by the process)
+    :param max_codepoints: the max number of codepoints of every request, longer texts are split into sentences
+    :param usage: {"requests", "characters", "retries", "failed_requests", "failed_texts"},
+                  the requests and the characters sent to the API and the failures are added to it
+    :param checkpoint: the journal of the finished batches of the document (None to disable)
+    :param fallback_to_source: the texts that still fail after the retries and the bisection keep the source text
+                               (False to return None for them), the errors not caused by the texts
+                               (permission, authentication, glossary not found, ...) are raised
     :return:
     """
-
-    client = translate.TranslationServiceClient()
+    # 翻译记忆：只有未命中的文本才调用接口（翻译失败的文本不存入记忆）
+    if translation_memory is not None:
+        texts_translated = translation_memory.translate(
+            texts,
+            lambda texts_missed: translate_texts(texts_missed, project_id,
+                                                 source_language_code,
+                                                 target_language_code,
+                                                 glossary_id,
+                                                 progress_bar_init=progress_bar_init,
+                                                 progress_bar_num=progress_bar_num,
+                                                 batch_size=batch_size,
+                                                 location=location,
+                                                 max_workers=max_workers,
+                                                 quota_limiter=quota_limiter,
+                                                 client=client,
+                                                 max_codepoints=max_codepoints,
+                                                 usage=usage,
+                                                 checkpoint=checkpoint,
+                                                 fallback_to_source=False),
+            source_language_code, target_language_code, glossary_id,
+            engine="google_translation_v3:{0}".format(location),
+        )
+        if fallback_to_source:
+            texts_translated = [text if text_translated is None else text_translated
+                                for text, text_translated in zip(texts, texts_translated)]
+        return texts_translated
+
+    if client is None:
+        client = get_client()
+    if quota_limiter is None:
+        quota_limiter = get_rate_limiter(project_id)
     parent = f"projects/{project_id}/locations/{location}"
 
     # 用语集参数
     glossary_config = None
     if glossary_id is not None:
-        glossary = client.glossary_path(
-            project_id, "us-central1", glossary_id  # The location of the glossary
-        )
-        glossary_config = translate.TranslateTextGlossaryConfig(glossary=glossary)
-
-    # 接口调用
-    texts_translated = []
-    len_texts = len(texts)
-    # 进度条
-    if progress_bar_init is not None:
-        progress_bar_init.emit(len_texts)
-    for index in range(0, len_texts, batch_size):
-        if progress_bar_num is not None:
-            progress_bar_num.emit(index)
-        batch_texts = texts[index:min(index + batch_size, len_texts)]
-        response = client.translate_text(
-            request={
-                "contents": batch_texts,
-                "source_language_code": source_language_code,
-                "target_language_code": target_language_code,
-                "parent": parent,
-                "glossary_config": glossary_config,
-            }
-        )
+        glossary_config = get_glossary_config(project_id, glossary_id, "us-central1")  # The location of the glossary
+
+    def request_batch(batch_texts: list) -> list:
+        quota_limiter.acquire(sum(len(text) for text in batch_texts))
+        try:
+            response = client.translate_text(
+                request={
+                    "contents": batch_texts,
+                    "source_language_code": source_language_code,
+                    "target_language_code": target_language_code,
+                    "parent": parent,
+                    "glossary_config": glossary_config,
+                }
+            )
+        except google_exceptions.ResourceExhausted:
+            # 超出配额时降低共享的速率，再由call_with_retry退避重试
+            quota_limiter.report_quota_exceeded()
+            raise
         if glossary_id is not None:
-            for response_translation in response.glossary_translations:
-                texts_translated.append(html.unescape(response_translation.translated_text))
+            response_translations = response.glossary_translations
         else:
-            for response_translation in response.translations:
-                texts_translated.append(html.unescape(response_translation.translated_text))
+            response_translations = response.translations
         logging.info("Translated text: {0}".format(batch_texts))
+        return [html.unescape(response_translation.translated_text) for response_translation in response_translations]
+
+    failures = {"retries": 0, "failed_requests": 0}
+    failures_lock = threading.Lock()
 
+    def on_retry(e: Exception, retry: int, delay: float) -> None:
+        logging.warning("Retry {0} in {1:.1f}s: {2}".format(retry, delay, str(e)))
+        with failures_lock:
+            failures["retries"] += 1
+
+    def translate_batch(batch_texts: list) -> list:
+        """
+        :return: the translated texts of the batch, None for the texts that failed
+        """
+        try:
+            return call_with_retry(lambda: request_batch(batch_texts), RETRYABLE_EXCEPTIONS,
+                                   TRANSLATION_API_MAX_RETRIES, TRANSLATION_API_RETRY_INITIAL_DELAY,
+                                   TRANSLATION_API_RETRY_MAX_DELAY, on_retry)
+        except RETRYABLE_EXCEPTIONS as e:
+            # 配额/服务不可用在重试后仍然失败时，拆分只会增加请求，整批记为失败
+            with failures_lock:
+                failures["failed_requests"] += 1
+            logging.error("Failed to translate {0} texts: {1}".format(len(batch_texts), str(e)))
+            return [None] * len(batch_texts)
+        except google_exceptions.InvalidArgument as e:
+            # 某个文本的内容或大小不被接受：二分批次，只让出错的文本失败
+            # 其它错误（权限、认证、用语集不存在等）与文本无关，直接抛出，任务失败并保留断点日志
+            with failures_lock:
+                failures["failed_requests"] += 1
+            if len(batch_texts) == 1:
+                logging.error("Failed to translate {0} texts: {1}".format(len(batch_texts), str(e)))
+                return [None]
+            middle = len(batch_texts) // 2
+            logging.warning("Splitting a batch of {0} texts: {1}".format(len(batch_texts), str(e)))
+            return translate_batch(batch_texts[:middle]) + translate_batch(batch_texts[middle:])
+
+    # 超长文本按句子拆分，拼接时保留片段之间的空白
+    segments = split_segments(texts, lambda text: _split_oversized_text(text, max_codepoints))
+    # 空片段（只有空白）不发送
+    segment_texts = [segment[2] for segment in segments if segment[2] != ""]
+
+    # 接口调用：按字符预算打包批次，同时保持最多max_workers个批次请求
+    batch_ranges = _pack_batches(segment_texts, max_codepoints, batch_size)
+    batches_translated = [None] * len(batch_ranges)
+    # 断点续传：上次运行已完成的批次直接从日志中恢复
+    if checkpoint is not None:
+        call_index = checkpoint.next_call()
+        for batch_index, (start, end) in enumerate(batch_ranges):
+            batches_translated[batch_index] = checkpoint.get(call_index, batch_index, segment_texts[start:end])
+    batch_indexes = [batch_index for batch_index, batch_translated in enumerate(batches_translated)
+                     if batch_translated is None]
+    if usage is not None:
+        usage["requests"] += len(batch_indexes)
+        usage["characters"] += sum(len(segment_text) for batch_index in batch_indexes
+                                   for segment_text in segment_texts[slice(*batch_ranges[batch_index])])
+    # 进度条
+    if progress_bar_init is not None:
+        progress_bar_init.emit(len(segment_texts))
+    len_segments_finished = sum(end - start for (start, end), batch_translated in zip(batch_ranges, batches_translated)
+                                if batch_translated is not None)
+    if progress_bar_num is not None and len_segments_finished > 0:
+        progress_bar_num.emit(len_segments_finished)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(translate_batch, segment_texts[slice(*batch_ranges[batch_index])]): batch_index
+                   for batch_index in batch_indexes}
+        # 进度按已完成的批次计算
+        for future in as_completed(futures):
+            batch_index = futures[future]
+            batches_translated[batch_index] = future.result()
+            start, end = batch_ranges[batch_index]
+            # 有失败文本的批次不写入日志，重新运行时再次翻译
+            if checkpoint is not None and None not in batches_translated[batch_index]:
+                checkpoint.put(call_index, batch_index, segment_texts[start:end], batches_translated[batch_index])
+            len_segments_finished += end - start
+            if progress_bar_num is not None:
+                progress_bar_num.emit(len_segments_finished)
+
+    segments_translated = iter(itertools.chain.from_iterable(batches_translated))
+    segments_translated = [next(segments_translated) if segment[2] != "" else "" for segment in segments]
+    # 有片段失败的文本整体保留原文（或返回None）
+    failed_indexes = sorted({segment[0] for segment, segment_translated in zip(segments, segments_translated)
+                             if segment_translated is None})
+    segments_translated = [segment[2] if segment_translated is None else segment_translated
+                           for segment, segment_translated in zip(segments, segments_translated)]
+    texts_translated = join_segments(segments, segments_translated, len(texts), target_language_code)
+    for failed_index in failed_indexes:
+        texts_translated[failed_index] = texts[failed_index] if fallback_to_source else None
+    if failures["retries"] > 0 or len(failed_indexes) > 0:
+        logging.warning("Translation API: {0} retries, {1} failed requests, {2} of {3} texts failed.".format(
+            failures["retries"], failures["failed_requests"], len(failed_indexes), len(texts)))
+    if usage is not None:
+        usage["retries"] += failures["retries"]
+        usage["failed_requests"] += failures["failed_requests"]
+        usage["failed_texts"] += len(failed_indexes)
     return texts_translated
 
 
@@ -88,7 +299,10 @@ class FileTranslatorInterface(metaclass=ABCMeta):
                   target_language_code: str,
                   glossary_id: str = None,
                   progress_bar_init: pyqtSignal(int) = None,
-                  progress_bar_num: pyqtSignal(int) = None) -> None:
+                  progress_bar_num: pyqtSignal(int) = None,
+                  translation_memory: TranslationMemory = None,
+                  column_selector: ColumnSelector = None,
+                  checkpoint: CheckpointJournal = None) -> None:
         """
         Translate txt file with glossary and progress bar.
         :param file_path_source: source file path
@@ -98,29 +312,52 @@ class FileTranslatorInterface(metaclass=ABCMeta):
         :param glossary_id: your glossary id
         :param progress_bar_init: signal to init the progressbar
         :param progress_bar_num: signal to update the value of progressbar
+        :param translation_memory: the translation memory to look up before translating (None to disable)
+        :param column_selector: the sheets/columns of a table file to translate (None to translate every cell)
+        :param checkpoint: the journal of the finished batches, a restarted job skips them (None to disable)
         :return:
         """
         pass
 
 
 class ExcelFileTranslator(FileTranslatorInterface):
+    # workbooks larger than this (in bytes) are translated in the streaming mode
+    streaming_threshold = EXCEL_STREAMING_THRESHOLD
 
     @staticmethod
-    def _get_translatable_texts(texts: list[str]):
-        indexes = []
-        texts_to_translate = []
-        for index, text in enumerate(texts):
-            if isinstance(text, str):
-                indexes.append(index)
-                texts_to_translate.append(text)
+    def _get_translatable_texts(texts: list, source_language_code: str = None):
+        indexes = get_translatable_indexes(texts, source_language_code)
+        texts_to_translate = [texts[index] for index in indexes]
         return indexes, texts_to_translate
 
     @staticmethod
-    def _map_translated_texts(indexes, texts_translated: list[str], texts: list[str]):
-        texts_translated_dict = dict(zip(indexes, texts_translated))
-        for index in indexes:
-            texts[index] = texts_translated_dict[index]
-        return texts
+    def _select_cells(worksheet, column_selector: ColumnSelector, source_language_code: str) -> list:
+        """
+        :return: the (source cell, target cell) pairs of the selected columns, the header row is not translated
+        """
+        rows = list(worksheet.iter_rows())
+        if len(rows) == 0:
+            return []
+        headers = [cell.value for cell in rows[0]]
+        columns_values = [[row[position].value for row in rows[1:column_selector.detect_sample_size + 1]]
+                          for position in range(len(headers))]
+        positions = column_selector.select_columns(headers, columns_values, source_language_code)
+        column_map, new_headers = column_selector.get_target_positions(headers, positions)
+        # 新增的目标列写入表头
+        for position, header in new_headers.items():
+            worksheet.cell(row=rows[0][0].row, column=position + 1, value=header)
+
+        cell_pairs = []
+        for position in positions:
+            for row in rows[1:]:
+                cell = row[position]
+                if cell.value is None:
+                    continue
+                cell_target = cell
+                if column_map[position] != position:
+                    cell_target = worksheet.cell(row=cell.row, column=column_map[position] + 1)
+                cell_pairs.append((cell, cell_target))
+        return cell_pairs
 
     def translate(self,
                   file_path_source: str,
@@ -129,48 +366,155 @@ class ExcelFileTranslator(FileTranslatorInterface):
                   target_language_code: str,
                   glossary_id: str = None,
                   progress_bar_init: pyqtSignal(int) = None,
-                  progress_bar_num: pyqtSignal(int) = None) -> None:
+                  progress_bar_num: pyqtSignal(int) = None,
+                  translation_memory: TranslationMemory = None,
+                  column_selector: ColumnSelector = None,
+                  checkpoint: CheckpointJournal = None) -> None:
+        # 本次调用接口的请求数与字符数（按量计费的依据）
+        self.usage = {"requests": 0, "characters": 0, "retries": 0, "failed_requests": 0, "failed_texts": 0}
+        file_name, file_type = os.path.splitext(file_path_source)
+        file_path_target = "{0}_translated{1}".format(file_name, file_type)
+        # 大文件使用只读/只写的流式模式，内存占用与文件大小无关
+        if os.path.getsize(file_path_source) > self.streaming_threshold:
+            self.deduplication_stats = translate_workbook_streaming(
+                file_path_source, file_path_target,
+                lambda texts: translate_texts(texts, project_id,
+                                              source_language_code,
+                                              target_language_code,
+                                              glossary_id,
+                                              translation_memory=translation_memory,
+                                              usage=self.usage,
+                                              checkpoint=checkpoint),
+                progress_bar_init=progress_bar_init,
+                progress_bar_num=progress_bar_num,
+                column_selector=column_selector,
+                source_language_code=source_language_code)
+            return
 
         # Load the source workbook
         workbook = load_workbook(filename=file_path_source)
 
-        # 过滤并翻译
+        # 收集所有工作表中的单元格，统一去重后翻译
+        cells = []
+        cells_target = []
         for sheet in workbook.sheetnames:
             worksheet = workbook[sheet]
-            cells = []
-            for row in worksheet.iter_rows():
-                for cell in row:
-                    if cell.value is not None:
-                        cells.append(cell)
-
-            texts = [str(cell.value) for cell in cells]
-            # 处理
-            indexes, texts_to_translate = self._get_translatable_texts(texts)
-            texts_translated = translate_texts(texts_to_translate, project_id,
-                                               source_language_code,
-                                               target_language_code,
-                                               glossary_id,
-                                               progress_bar_init=progress_bar_init,
-                                               progress_bar_num=progress_bar_num)
-            # reshape
-            texts = self._map_translated_texts(indexes, texts_translated, texts)
-
-            for i in range(len(cells)):
-                cells[i].value = texts[i]
+            if column_selector is None:
+                for row in worksheet.iter_rows():
+                    for cell in row:
+                        if cell.value is not None:
+                            cells.append(cell)
+                            cells_target.append(cell)
+            elif column_selector.select_sheet(sheet):
+                for cell, cell_target in self._select_cells(worksheet, column_selector, source_language_code):
+                    cells.append(cell)
+                    cells_target.append(cell_target)
+
+        # 处理：数字、日期、ID、路径、占位符等单元格不翻译，原样保留
+        values = [cell.value for cell in cells]
+        indexes, texts_to_translate = self._get_translatable_texts(values, source_language_code)
+        texts_translated, self.deduplication_stats = translate_deduplicated(
+            texts_to_translate,
+            lambda texts_unique: translate_texts(texts_unique, project_id,
+                                                 source_language_code,
+                                                 target_language_code,
+                                                 glossary_id,
+                                                 progress_bar_init=progress_bar_init,
+                                                 progress_bar_num=progress_bar_num,
+                                                 translation_memory=translation_memory,
+                                                 usage=self.usage,
+                                                 checkpoint=checkpoint))
+        # reshape（写入目标列时，未翻译的单元格照抄原文）
+        for cell, cell_target in zip(cells, cells_target):
+            if cell_target is not cell:
+                cell_target.value = cell.value
+        for index, text_translated in zip(indexes, texts_translated):
+            cells_target[index].value = text_translated
 
         # Save the destination workbook
-        file_name, file_type = os.path.splitext(file_path_source)
-        file_path_target = "{0}_translated{1}".format(file_name, file_type)
         workbook.save(filename=file_path_target)
 
 
 class BaseFileTranslator(FileTranslatorInterface):
+    # files larger than this (in bytes) are read, translated and written chunk by chunk
+    chunked_threshold = CSV_CHUNKED_THRESHOLD
+    # the number of rows of every chunk in the chunked mode
+    chunk_size = CSV_CHUNK_SIZE
+
     def load_file(self, file_path_source: str):
         raise NotImplementedError
 
+    def load_file_chunks(self, file_path_source: str, chunk_size: int):
+        raise NotImplementedError
+
     def save_file(self, df, file_path_source: str):
         raise NotImplementedError
 
+    def append_file_chunk(self, df, file_path_source: str, header: bool):
+        raise NotImplementedError
+
+    def _translate_dataframe(self,
+                             df,
+                             translate_function,
+                             column_selector: ColumnSelector = None,
+                             source_language_code: str = None) -> dict:
+        column_positions, column_map = None, None
+        if column_selector is not None:
+            # 分块模式下沿用第一块的选择结果
+            if self._column_selection is None:
+                self._column_selection = column_selector.select_dataframe_columns(df, source_language_code)
+            column_positions, column_map, new_headers = self._column_selection
+            for header in new_headers.values():
+                df[header] = None
+
+        # 按列向量化地提取待翻译文本，并过滤掉无需翻译的单元格
+        texts, (rows, columns) = get_dataframe_texts(df, column_positions)
+        indexes = get_translatable_indexes(texts, source_language_code)
+        texts = [texts[index] for index in indexes]
+        coordinates = (rows[indexes], columns[indexes])
+
+        # Translate
+        texts_translated, deduplication_stats = translate_deduplicated(texts, translate_function)
+        # 写入目标列时，未翻译的单元格（数字、ID、路径等）照抄原文
+        if column_map is not None:
+            copy_dataframe_columns(df, column_map)
+        # 按列批量写回
+        set_dataframe_texts(df, coordinates, texts_translated, column_map)
+        return deduplication_stats
+
+    def _translate_chunked(self,
+                           file_path_source: str,
+                           translate_function,
+                           progress_bar_init: pyqtSignal(int) = None,
+                           progress_bar_num: pyqtSignal(int) = None,
+                           column_selector: ColumnSelector = None,
+                           source_language_code: str = None) -> None:
+        # 进度条（按数据行数估算，表头行不计入）
+        if progress_bar_init is not None:
+            progress_bar_init.emit(max(count_lines(file_path_source) - 1, 0))
+
+        self.deduplication_stats = None
+        len_rows_finished = 0
+        chunks = self.load_file_chunks(file_path_source, self.chunk_size)
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            future = reader.submit(next, chunks, None)
+            header = True
+            while True:
+                df = future.result()
+                if df is None:
+                    break
+                # 翻译当前块的同时读取下一块
+                future = reader.submit(next, chunks, None)
+                deduplication_stats = self._translate_dataframe(df, translate_function,
+                                                                column_selector, source_language_code)
+                self.deduplication_stats = merge_deduplication_stats(self.deduplication_stats, deduplication_stats)
+                # 只有第一块写表头
+                self.append_file_chunk(df, file_path_source, header)
+                header = False
+                len_rows_finished += len(df)
+                if progress_bar_num is not None:
+                    progress_bar_num.emit(len_rows_finished)
+
     def translate(self,
                   file_path_source: str,
                   project_id: str,
@@ -178,31 +522,46 @@ class BaseFileTranslator(FileTranslatorInterface):
                   target_language_code: str,
                   glossary_id: str = None,
                   progress_bar_init: pyqtSignal(int) = None,
-                  progress_bar_num: pyqtSignal(int) = None) -> None:
+                  progress_bar_num: pyqtSignal(int) = None,
+                  translation_memory: TranslationMemory = None,
+                  column_selector: ColumnSelector = None,
+                  checkpoint: CheckpointJournal = None) -> None:
+        # 本次调用接口的请求数与字符数（按量计费的依据）
+        self.usage = {"requests": 0, "characters": 0, "retries": 0, "failed_requests": 0, "failed_texts": 0}
+        self._column_selection = None
+        # 大文件分块读取、翻译并追加写入，内存占用只与块大小有关
+        if os.path.getsize(file_path_source) > self.chunked_threshold:
+            self._translate_chunked(
+                file_path_source,
+                lambda texts_unique: translate_texts(texts_unique, project_id,
+                                                     source_language_code,
+                                                     target_language_code,
+                                                     glossary_id,
+                                                     translation_memory=translation_memory,
+                                                     usage=self.usage,
+                                                     checkpoint=checkpoint),
+                progress_bar_init=progress_bar_init,
+                progress_bar_num=progress_bar_num,
+                column_selector=column_selector,
+                source_language_code=source_language_code)
+            return
+
         # Load the source workbook
         df = self.load_file(file_path_source)
 
-        cells = []
-        for row_index, row in df.iterrows():
-            for column_index in df.columns:
-                cell_value = row[column_index]
-                if isinstance(cell_value, float) and math.isnan(cell_value):
-                    continue
-                cells.append([cell_value, (row_index, column_index)])
-
-        # Translate
-        texts = [str(item[0]) for item in cells]
-        coordinates = [item[1] for item in cells]
-        texts_translated = translate_texts(texts, project_id,
-                                           source_language_code,
-                                           target_language_code,
-                                           glossary_id,
-                                           progress_bar_init=progress_bar_init,
-                                           progress_bar_num=progress_bar_num)
-        # working
-        for index in range(len(texts)):
-            x, y = coordinates[index][0], coordinates[index][1]
-            df.at[x, y] = texts_translated[index]
+        self.deduplication_stats = self._translate_dataframe(
+            df,
+            lambda texts_unique: translate_texts(texts_unique, project_id,
+                                                 source_language_code,
+                                                 target_language_code,
+                                                 glossary_id,
+                                                 progress_bar_init=progress_bar_init,
+                                                 progress_bar_num=progress_bar_num,
+                                                 translation_memory=translation_memory,
+                                                 usage=self.usage,
+                                                 checkpoint=checkpoint),
+            column_selector,
+            source_language_code)
 
         # Save the destination workbook
         self.save_file(df, file_path_source)
@@ -212,23 +571,42 @@ class CsvFileTranslator(BaseFileTranslator):
     def load_file(self, file_path_source: str):
         return pd.read_csv(file_path_source)
 
+    def load_file_chunks(self, file_path_source: str, chunk_size: int):
+        return pd.read_csv(file_path_source, chunksize=chunk_size)
+
     def save_file(self, df, file_path_source: str):
         file_name, file_type = os.path.splitext(file_path_source)
         file_path_target = "{0}_translated{1}".format(file_name, file_type)
         df.to_csv(file_path_target, index=False)
 
+    def append_file_chunk(self, df, file_path_source: str, header: bool):
+        file_name, file_type = os.path.splitext(file_path_source)
+        file_path_target = "{0}_translated{1}".format(file_name, file_type)
+        df.to_csv(file_path_target, index=False, header=header, mode="w" if header else "a")
+
 
 class TsvFileTranslator(BaseFileTranslator):
     def load_file(self, file_path_source: str):
         return pd.read_csv(file_path_source, sep="\t")
 
+    def load_file_chunks(self, file_path_source: str, chunk_size: int):
+        return pd.read_csv(file_path_source, sep="\t", chunksize=chunk_size)
+
     def save_file(self, df, file_path_source: str):
         file_name, file_type = os.path.splitext(file_path_source)
         file_path_target = "{0}_translated{1}".format(file_name, file_type)
         df.to_csv(file_path_target, index=False, sep='\t')
 
+    def append_file_chunk(self, df, file_path_source: str, header: bool):
+        file_name, file_type = os.path.splitext(file_path_source)
+        file_path_target = "{0}_translated{1}".format(file_name, file_type)
+        df.to_csv(file_path_target, index=False, sep='\t', header=header, mode="w" if header else "a")
+
 
 class TxtFileTranslator(FileTranslatorInterface):
+    # the number of lines read and translated at a time
+    chunk_size = TXT_CHUNK_SIZE
+
     def translate(self,
                   file_path_source: str,
                   project_id: str,
@@ -236,24 +614,48 @@ class TxtFileTranslator(FileTranslatorInterface):
                   target_language_code: str,
                   glossary_id: str = None,
                   progress_bar_init: pyqtSignal(int) = None,
-                  progress_bar_num: pyqtSignal(int) = None) -> None:
-        # read
-        with open(file_path_source, "r", encoding="utf-8") as file_input:
-            lines = file_input.readlines()
-            texts = [line for line in lines]
-        # translate
-        translated_texts = translate_texts(texts, project_id,
-                                           source_language_code,
-                                           target_language_code,
-                                           glossary_id,
-                                           progress_bar_init=progress_bar_init,
-                                           progress_bar_num=progress_bar_num)
-
-        # write
+                  progress_bar_num: pyqtSignal(int) = None,
+                  translation_memory: TranslationMemory = None,
+                  column_selector: ColumnSelector = None,
+                  checkpoint: CheckpointJournal = None) -> None:
+        # 本次调用接口的请求数与字符数（按量计费的依据）
+        self.usage = {"requests": 0, "characters": 0, "retries": 0, "failed_requests": 0, "failed_texts": 0}
         file_name, file_type = os.path.splitext(file_path_source)
         file_path_target = "{0}_translated{1}".format(file_name, file_type)
-        with open(file_path_target, "w", encoding="utf-8") as file_output:
-            file_output.writelines(translated_texts)
+        # 进度条（逐行计数，不把文件读入内存）
+        if progress_bar_init is not None:
+            with open(file_path_source, "r", encoding="utf-8") as file_input:
+                progress_bar_init.emit(sum(1 for _ in file_input))
+
+        # 流式处理：逐块读取、翻译，并在每块完成后立即追加写入
+        self.deduplication_stats = None
+        len_lines_finished = 0
+        with open(file_path_source, "r", encoding="utf-8") as file_input, \
+                open(file_path_target, "w", encoding="utf-8") as file_output:
+            while True:
+                texts = list(itertools.islice(file_input, self.chunk_size))
+                if len(texts) == 0:
+                    break
+                # 空行、数字、占位符等无需翻译的行原样保留
+                indexes = get_translatable_indexes(texts, source_language_code)
+                texts_translated, deduplication_stats = translate_deduplicated(
+                    [texts[index] for index in indexes],
+                    lambda texts_unique: translate_texts(texts_unique, project_id,
+                                                         source_language_code,
+                                                         target_language_code,
+                                                         glossary_id,
+                                                         translation_memory=translation_memory,
+                                                         usage=self.usage,
+                                                         checkpoint=checkpoint))
+                translated_texts = list(texts)
+                for index, text_translated in zip(indexes, texts_translated):
+                    translated_texts[index] = text_translated
+                self.deduplication_stats = merge_deduplication_stats(self.deduplication_stats, deduplication_stats)
+                file_output.writelines(translated_texts)
+                file_output.flush()
+                len_lines_finished += len(texts)
+                if progress_bar_num is not None:
+                    progress_bar_num.emit(len_lines_finished)
 
 
 # Simple Factory Pattern
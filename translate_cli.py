@@ -0,0 +1,287 @@
+import argparse
+import contextlib
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from checkpoint import CheckpointJournal
+from column_selector import ColumnSelector
+from settings import (CLI_MAX_WORKERS, GENERATION_PROFILE_DICT, GLOSSARY_DICT, MODEL_BACKEND, MODEL_POOL_ENABLED,
+                      NLLB_LANGUAGE_CODE_DICT, PRIVATE_KEY_NAME, PROJECT_ID)
+from translation_memory import TranslationMemory
+
+SUPPORTED_FILE_TYPES = ("xlsx", "csv", "tsv", "txt")
+
+
+def collect_files(paths: list) -> list:
+    """
+    :param paths: files, directories (searched recursively) or glob patterns
+    :return: the files to translate in a stable order, the outputs of earlier runs (*_translated.*) are skipped
+    """
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = glob.glob(os.path.join(glob.escape(path), "**", "*"), recursive=True)
+        elif os.path.isfile(path):
+            candidates = [path]
+        else:
+            candidates = glob.glob(path, recursive=True)
+            if len(candidates) == 0:
+                logging.warning("No file matches {0}.".format(path))
+        for candidate in sorted(candidates):
+            file_name, file_type = os.path.splitext(os.path.basename(candidate))
+            if not os.path.isfile(candidate) or file_type.lstrip(".") not in SUPPORTED_FILE_TYPES:
+                continue
+            # 跳过上次运行的输出文件与Excel的临时文件
+            if file_name.endswith("_translated") or file_name.startswith("~$"):
+                continue
+            file_paths.append(os.path.abspath(candidate))
+    return list(dict.fromkeys(file_paths))
+
+
+def get_google_translate_file(args, translation_memory: TranslationMemory, column_selector: ColumnSelector):
+    """
+    :return: a function that translates a file with the Google Translation API and returns the file translator
+    """
+    from translate import FileTranslateFactory, get_job_key
+    from translation_client import get_client
+
+    if os.environ.get("GOOGLE_APPLICATION_CREDENTIALS") is None:
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.abspath("./front/{0}".format(PRIVATE_KEY_NAME))
+    # 所有文件共用同一个客户端
+    get_client()
+    glossary_id = GLOSSARY_DICT.get(args.glossary, args.glossary)
+
+    def translate_file(file_path: str):
+        file_type = os.path.splitext(file_path)[1].lstrip(".")
+        file_translator = FileTranslateFactory().create_document_translator(file_type)
+        checkpoint = CheckpointJournal(file_path, get_job_key(args.source, args.target, glossary_id))
+        try:
+            file_translator.translate(file_path, args.project_id, args.source, args.target,
+                                      glossary_id=glossary_id,
+                                      translation_memory=translation_memory,
+                                      column_selector=column_selector,
+                                      checkpoint=checkpoint)
+        except Exception:
+            # 保留日志，重新运行时跳过已完成的批次
+            checkpoint.close()
+            raise
+        checkpoint.remove()
+        return file_translator
+
+    return translate_file
+
+
+def get_model_translate_file(args, translation_memory: TranslationMemory, column_selector: ColumnSelector,
+                             exit_stack: contextlib.ExitStack):
+    """
+    :param exit_stack: the model pool (if any) is closed when it exits
+    :return: a function that translates a file with the custom model and returns the file translator
+    """
+    from glossary_index import GlossaryIndex
+    from model_pool import ModelProcessPool, ProcessPoolTranslator, get_pool_size
+    from translate_with_custom_model import (FileTranslateFactory, LanguagePairTranslator, get_device,
+                                             get_job_key, load_translator)
+
+    google_to_nllb = {google_code: nllb_code for nllb_code, google_code in NLLB_LANGUAGE_CODE_DICT.items()}
+    src_lang, tgt_lang = google_to_nllb[args.source], google_to_nllb[args.target]
+    # 所有文件共用同一个模型（或同一个多进程模型池）
+    translator = None
+    if args.pool and get_device() == "cpu":
+        # 内存上限连一个工作进程都容纳不下时，改为在本进程内加载模型
+        num_workers = get_pool_size(args.model)
+        if num_workers > 0:
+            model_pool = ModelProcessPool(args.model, num_workers=num_workers, backend=args.backend)
+            exit_stack.callback(model_pool.close)
+            translator = ProcessPoolTranslator(model_pool, src_lang, tgt_lang)
+        else:
+            logging.warning("MODEL_POOL_MAX_MEMORY leaves no room for a model worker, translating in-process.")
+    if translator is None:
+        translator = LanguagePairTranslator(load_translator(args.model, backend=args.backend), src_lang, tgt_lang)
+
+    glossary = None
+    if args.glossary is not None:
+        glossary_index = GlossaryIndex()
+        glossary_index.build()
+        glossary = glossary_index.get_glossary(GLOSSARY_DICT.get(args.glossary, args.glossary),
+                                               args.source, args.target)
+
+    job_key = get_job_key(translator, glossary, args.generation_profile)
+
+    def translate_file(file_path: str):
+        file_type = os.path.splitext(file_path)[1].lstrip(".")
+        file_translator = FileTranslateFactory().create_document_translator(file_type)
+        checkpoint = CheckpointJournal(file_path, job_key)
+        try:
+            file_translator.translate(file_path, translator,
+                                      translation_memory=translation_memory,
+                                      column_selector=column_selector,
+                                      glossary=glossary,
+                                      generation_profile=args.generation_profile,
+                                      checkpoint=checkpoint)
+        except Exception:
+            # 保留日志，重新运行时跳过已完成的批次
+            checkpoint.close()
+            raise
+        checkpoint.remove()
+        return file_translator
+
+    return translate_file
+
+
+def translate_files(file_paths: list, translate_file, max_workers: int = CLI_MAX_WORKERS) -> list:
+    """
+    Translate the files concurrently, a failed file does not stop the others.
+    :param file_paths: the files to translate
+    :param translate_file: a function that translates a file and returns the file translator
+    :param max_workers: the number of files translated at the same time
+    :return: the result of every file, in the order of file_paths
+    """
+
+    def translate_one(file_path: str) -> dict:
+        file_name, file_type = os.path.splitext(file_path)
+        result = {"file": file_path, "output": "{0}_translated{1}".format(file_name, file_type)}
+        start_time = time.perf_counter()
+        try:
+            file_translator = translate_file(file_path)
+            deduplication_stats = getattr(file_translator, "deduplication_stats", None) or {}
+            usage = getattr(file_translator, "usage", None) or {}
+            result.update({
+                "status": "ok",
+                "cells": deduplication_stats.get("texts", 0),
+                "unique_cells": deduplication_stats.get("unique_texts", 0),
+                "characters": deduplication_stats.get("characters", 0),
+                "requests": usage.get("requests", 0),
+                "characters_sent": usage.get("characters", 0),
+                "retries": usage.get("retries", 0),
+                "failed_requests": usage.get("failed_requests", 0),
+                "failed_texts": usage.get("failed_texts", 0),
+            })
+        except Exception as e:
+            logging.exception("Failed to translate {0}.".format(file_path))
+            result.update({"status": "failed", "error": "{0}: {1}".format(type(e).__name__, str(e))})
+        result["seconds"] = round(time.perf_counter() - start_time, 3)
+        logging.info("{0} {1} in {2:.1f}s.".format(result["status"], file_path, result["seconds"]))
+        return result
+
+    results = [None] * len(file_paths)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(translate_one, file_path): index for index, file_path in enumerate(file_paths)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+
+def get_summary(results: list, engine: str, seconds: float, translation_memory: TranslationMemory = None) -> dict:
+    """
+    :param results: the results returned by translate_files
+    :param engine: "google" or "model"
+    :param seconds: the wall time of the whole job
+    :param translation_memory: the translation memory shared by the files
+    :return: the summary of the job, only the characters sent to the Google Translation API are billed
+    """
+    for result in results:
+        if result["status"] == "ok":
+            result["characters_billed"] = result["characters_sent"] if engine == "google" else 0
+    results_ok = [result for result in results if result["status"] == "ok"]
+    summary = {
+        "engine": engine,
+        "seconds": round(seconds, 3),
+        "files": len(results),
+        "files_failed": len(results) - len(results_ok),
+        "cells": sum(result["cells"] for result in results_ok),
+        "characters": sum(result["characters"] for result in results_ok),
+        "characters_billed": sum(result["characters_billed"] for result in results_ok),
+        "retries": sum(result["retries"] for result in results_ok),
+        "failed_requests": sum(result["failed_requests"] for result in results_ok),
+        "failed_texts": sum(result["failed_texts"] for result in results_ok),
+        "results": results,
+    }
+    if translation_memory is not None:
+        summary["translation_memory"] = translation_memory.stats()
+    return summary
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Translate xlsx/csv/tsv/txt files without the GUI.")
+    parser.add_argument("paths", nargs="+", help="files, directories or glob patterns (quote them)")
+    parser.add_argument("--engine", choices=("google", "model"), default="google")
+    parser.add_argument("-s", "--source", default="zh-CN", help="source language code (default: zh-CN)")
+    parser.add_argument("-t", "--target", default="ko", help="target language code (default: ko)")
+    parser.add_argument("-g", "--glossary", default=None,
+                        help="glossary name (a key of GLOSSARY_DICT) or glossary id")
+    parser.add_argument("-w", "--workers", type=int, default=CLI_MAX_WORKERS,
+                        help="files translated at the same time (default: {0})".format(CLI_MAX_WORKERS))
+    parser.add_argument("--summary", default="translation_summary.json", help="path of the JSON summary")
+    parser.add_argument("--no-memory", action="store_true", help="do not use the translation memory")
+    parser.add_argument("--columns", nargs="+", default=None, help="headers of the columns to translate")
+    parser.add_argument("--sheets", nargs="+", default=None, help="names of the sheets to translate")
+    parser.add_argument("--target-column", default=None,
+                        help='header of the column to write into, e.g. "{column}_ko" (default: overwrite)')
+    parser.add_argument("--auto-detect", action="store_true", help="detect the source-language columns")
+    # Google Translation API
+    parser.add_argument("--project-id", default=PROJECT_ID)
+    # 自训练模型
+    parser.add_argument("--model", default="models/nllb-200-1.3B/zh2ko_0907", help="name or path of the model")
+    parser.add_argument("--backend", choices=("torch", "int8", "onnx"), default=MODEL_BACKEND)
+    parser.add_argument("--pool", action="store_true", default=MODEL_POOL_ENABLED,
+                        help="translate on CPU with a pool of model processes "
+                             "(default: {0})".format(MODEL_POOL_ENABLED))
+    parser.add_argument("--no-pool", action="store_false", dest="pool", help="translate with a single model")
+    parser.add_argument("--generation-profile", choices=list(GENERATION_PROFILE_DICT) + ["auto"], default=None,
+                        help="generation settings of the model (default: the settings of the model)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    # 自训练模型只支持NLLB_LANGUAGE_CODE_DICT中的语言，在加载模型之前检查
+    if args.engine == "model":
+        language_codes = list(NLLB_LANGUAGE_CODE_DICT.values())
+        for option, language_code in (("--source", args.source), ("--target", args.target)):
+            if language_code not in language_codes:
+                parser.error("argument {0}: {1} is not supported by the model engine (choose from {2})".format(
+                    option, language_code, ", ".join(language_codes)))
+    return args
+
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(threadName)s %(message)s")
+
+    file_paths = collect_files(args.paths)
+    if len(file_paths) == 0:
+        logging.error("No file to translate.")
+        return 1
+    logging.info("{0} files to translate with {1}.".format(len(file_paths), args.engine))
+
+    translation_memory = None if args.no_memory else TranslationMemory()
+    column_selector = None
+    if args.columns is not None or args.sheets is not None or args.target_column is not None or args.auto_detect:
+        column_selector = ColumnSelector(source_columns=args.columns, sheets=args.sheets,
+                                         target_column=args.target_column, auto_detect=args.auto_detect)
+
+    start_time = time.perf_counter()
+    # 翻译结束（或出错）时停止模型池的工作进程
+    with contextlib.ExitStack() as exit_stack:
+        if args.engine == "google":
+            translate_file = get_google_translate_file(args, translation_memory, column_selector)
+        else:
+            translate_file = get_model_translate_file(args, translation_memory, column_selector, exit_stack)
+        results = translate_files(file_paths, translate_file, args.workers)
+    summary = get_summary(results, args.engine, time.perf_counter() - start_time, translation_memory)
+
+    with open(args.summary, "w", encoding="utf-8") as file_output:
+        json.dump(summary, file_output, ensure_ascii=False, indent=2)
+    logging.info("{0} files ({1} failed), {2} cells ({3} failed, kept the source text), {4} characters billed, "
+                 "{5} retries, {6:.1f}s. Summary: {7}".format(summary["files"], summary["files_failed"],
+                                                             summary["cells"], summary["failed_texts"],
+                                                             summary["characters_billed"], summary["retries"],
+                                                             summary["seconds"], args.summary))
+    return 0 if summary["files_failed"] == 0 and summary["failed_texts"] == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,61 +1,359 @@
 # Imports the Google Cloud Translation library
-import math
+import hashlib
+import itertools
+import logging
 import os
+import shutil
+import tempfile
+import threading
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import onnxruntime
 import pandas as pd
+import torch
 from PyQt5.QtCore import pyqtSignal
 from openpyxl import load_workbook
+from optimum.onnxruntime import ORTModelForSeq2SeqLM
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline
 
+from checkpoint import CheckpointJournal
+from column_selector import ColumnSelector
+from excel_streaming import translate_workbook_streaming
+from glossary_engine import Glossary
+from preprocess import (copy_dataframe_columns, count_lines, deduplicate_texts, expand_texts, get_dataframe_texts,
+                        get_translatable_indexes, join_segments, merge_deduplication_stats, set_dataframe_texts,
+                        split_segments, translate_deduplicated)
+from settings import (CSV_CHUNK_SIZE, CSV_CHUNKED_THRESHOLD, EXCEL_STREAMING_THRESHOLD, GENERATION_AUTO_PROFILES,
+                      GENERATION_AUTO_SHORT_LENGTH, GENERATION_PROFILE_DICT, MODEL_BACKEND, MODEL_CPU_THREADS,
+                      MODEL_ONNX_CACHE_DIR, NLLB_LANGUAGE_CODE_DICT, TXT_CHUNK_SIZE)
+from translation_memory import TranslationMemory
+
+# 各翻译方向共用同一个模型与分词器，调用时切换分词器的语言代码，因此同一时间只允许一个调用
+_translator_lock = threading.Lock()
+
+
+def get_device() -> str:
+    """
+    :return: the first GPU if CUDA is available, otherwise the CPU
+    """
+    return "cuda:0" if torch.cuda.is_available() else "cpu"
+
+
+def get_model_version(model_name: str) -> str:
+    """
+    :param model_name: the name or path of the model
+    :return: the name of the model, or the path with the latest modified time of the files of a local model
+    """
+    if not os.path.isdir(model_name):
+        return model_name
+    modified_times = [os.path.getmtime(os.path.join(model_name, file_name)) for file_name in os.listdir(model_name)]
+    return "{0}@{1}".format(model_name, max(modified_times, default=0))
+
+
+def export_onnx_model(model_name: str, cache_dir: str = MODEL_ONNX_CACHE_DIR) -> str:
+    """
+    Export the model to ONNX once, the export is cached on disk and keyed by the version of the model
+    (a retrained local model is exported again).
+    :param model_name: the name or path of the model
+    :param cache_dir: the directory of the exports
+    :return: the directory of the exported model
+    """
+    if os.path.isdir(model_name):
+        model_name = os.path.abspath(model_name)
+    export_path = os.path.join(cache_dir, hashlib.sha256(get_model_version(model_name).encode("utf-8")).hexdigest())
+    if os.path.isdir(export_path):
+        return export_path
+    # 先导出到临时目录再改名，中断或并发的导出不会留下不完整的模型
+    os.makedirs(cache_dir, exist_ok=True)
+    export_path_temp = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        logging.info("Exporting {0} to ONNX, this takes a few minutes the first time.".format(model_name))
+        ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True).save_pretrained(export_path_temp)
+        try:
+            os.replace(export_path_temp, export_path)
+        except OSError:
+            # 其它进程已经完成了同一个导出
+            if not os.path.isdir(export_path):
+                raise
+    finally:
+        shutil.rmtree(export_path_temp, ignore_errors=True)
+    return export_path
+
+
+def load_translator(model_name: str,
+                    device: str = None,
+                    backend: str = MODEL_BACKEND,
+                    num_threads: int = MODEL_CPU_THREADS) -> pipeline:
+    """
+    Load the model and the tokenizer once, and build the translation pipeline shared by every direction.
+    :param model_name: the name or path of the model
+    :param device: the device to run the model on (None to select it automatically)
+    :param backend: "torch" (fp32), "int8" (dynamic int8 quantization of the linear layers, CPU only)
+                    or "onnx" (ONNX Runtime on CPU, exported once into MODEL_ONNX_CACHE_DIR)
+    :param num_threads: the number of intra-op threads on CPU (None for the default of torch/ONNX Runtime)
+    :return: transformers.pipeline (in the default direction of the tokenizer)
+    """
+    if device is None:
+        device = get_device()
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend == "torch":
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    elif backend == "int8":
+        device = "cpu"
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "onnx":
+        device = None
+        # 算子内并行使用num_threads个线程；算子间串行，避免与算子内的线程池争抢CPU
+        session_options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            session_options.intra_op_num_threads = num_threads
+        session_options.inter_op_num_threads = 1
+        model = ORTModelForSeq2SeqLM.from_pretrained(export_onnx_model(model_name), session_options=session_options)
+    else:
+        raise ValueError("暂未支持的模型后端:{0}".format(backend))
+    if device in ("cpu", None) and num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    translator = pipeline("translation", model=model, tokenizer=tokenizer,
+                          src_lang=tokenizer.src_lang, tgt_lang=tokenizer.tgt_lang,
+                          device=device)
+    # 不同后端的译文可能不同，翻译记忆按后端区分
+    translator.backend = backend
+    return translator
+
+
+class LanguagePairTranslator:
+    """
+    One direction of a shared translation pipeline, usable wherever a pipeline is expected.
+    The language codes are passed to the pipeline on every call instead of building a pipeline per direction.
+    """
+
+    def __init__(self, translator: pipeline, src_lang: str, tgt_lang: str):
+        """
+        :param translator: the shared transformers.pipeline
+        :param src_lang: source language code of the model (e.g. "zho_Hans")
+        :param tgt_lang: target language code of the model (e.g. "kor_Hang")
+        """
+        self.translator = translator
+        self.model = translator.model
+        self.tokenizer = translator.tokenizer
+        self.backend = getattr(translator, "backend", "torch")
+        self._preprocess_params = dict(getattr(translator, "_preprocess_params", {}),
+                                       src_lang=src_lang, tgt_lang=tgt_lang)
+
+    def __call__(self, texts, **kwargs):
+        with _translator_lock:
+            return self.translator(texts,
+                                   src_lang=self._preprocess_params["src_lang"],
+                                   tgt_lang=self._preprocess_params["tgt_lang"],
+                                   **kwargs)
+
+
+def _get_token_lengths(texts: list, tokenizer) -> list:
+    """
+    :param texts: your text list to translate
+    :param tokenizer: the tokenizer of the pipeline (falls back to the character length if None)
+    :return: the token length of every text
+    """
+    if tokenizer is None or len(texts) == 0:
+        return [len(text) for text in texts]
+    # 分词器与模型调用共用（快速分词器不能被多个线程同时使用，否则报"Already borrowed"），同样需要加锁
+    with _translator_lock:
+        input_ids_list = tokenizer(texts, add_special_tokens=False)["input_ids"]
+    return [len(input_ids) for input_ids in input_ids_list]
+
+
+def get_generation_kwargs(generation_profile: str, max_input_length: int) -> dict:
+    """
+    :param generation_profile: a key of GENERATION_PROFILE_DICT, "auto" to select it by the input length,
+                               or None for the default generation settings of the pipeline
+    :param max_input_length: the max token length of the texts of the batch
+    :return: the generation kwargs of the pipeline call
+    """
+    if generation_profile is None:
+        return {}
+    if generation_profile == "auto":
+        generation_profile = GENERATION_AUTO_PROFILES[0] if max_input_length <= GENERATION_AUTO_SHORT_LENGTH \
+            else GENERATION_AUTO_PROFILES[1]
+    generation_kwargs = dict(GENERATION_PROFILE_DICT[generation_profile])
+    # 最大生成长度按输入长度缩放，避免长文本被截断
+    scale = generation_kwargs.pop("max_new_tokens_scale", None)
+    offset = generation_kwargs.pop("max_new_tokens_offset", 0)
+    if scale is not None:
+        generation_kwargs["max_new_tokens"] = int(max_input_length * scale) + offset
+    return generation_kwargs
+
+
+def get_language_codes(translator: pipeline) -> tuple:
+    """
+    :param translator: transformers.pipeline
+    :return: the (src_lang, tgt_lang) of the translation pipeline
+    """
+    preprocess_params = getattr(translator, "_preprocess_params", {})
+    return preprocess_params.get("src_lang"), preprocess_params.get("tgt_lang")
+
+
+def get_source_language_code(translator: pipeline) -> str:
+    """
+    :param translator: transformers.pipeline
+    :return: the Google language code of the source language of the pipeline (e.g. "zh-CN" for "zho_Hans")
+    """
+    src_lang, _ = get_language_codes(translator)
+    return NLLB_LANGUAGE_CODE_DICT.get(src_lang, src_lang)
+
+
+def get_target_language_code(translator: pipeline) -> str:
+    """
+    :param translator: transformers.pipeline
+    :return: the Google language code of the target language of the pipeline (e.g. "ko" for "kor_Hang")
+    """
+    _, tgt_lang = get_language_codes(translator)
+    return NLLB_LANGUAGE_CODE_DICT.get(tgt_lang, tgt_lang)
+
+
+def get_model_fingerprint(translator: pipeline) -> str:
+    """
+    Fingerprint of the model behind the pipeline, so that the translation memory is invalidated by retraining.
+    :param translator: transformers.pipeline
+    :return: the name or path of the model, with the latest modified time of the model files if it is a local model,
+             and the backend if it is not the fp32 torch model
+    """
+    name_or_path = getattr(getattr(translator, "model", None), "name_or_path", getattr(translator, "name_or_path", ""))
+    fingerprint = get_model_version(name_or_path)
+    backend = getattr(translator, "backend", "torch")
+    if backend != "torch":
+        fingerprint = "{0}#{1}".format(fingerprint, backend)
+    return fingerprint
+
+
+def get_job_key(translator: pipeline, glossary: Glossary = None, generation_profile: str = None) -> str:
+    """
+    :param translator: transformers.pipeline
+    :param glossary: the local glossary of the job
+    :param generation_profile: the generation profile of the job
+    :return: the settings of a document job that change the translations (the job key of CheckpointJournal)
+    """
+    src_lang, tgt_lang = get_language_codes(translator)
+    return "{0}:{1}:{2}:{3}:{4}".format(get_model_fingerprint(translator), src_lang, tgt_lang,
+                                        glossary.fingerprint if glossary is not None else None, generation_profile)
+
 
 def translate_texts(
         texts: list,
         translator: pipeline,
         progress_bar_init: pyqtSignal(int) = None,
         progress_bar_num: pyqtSignal(int) = None,
+        batch_size: int = 16,
+        translation_memory: TranslationMemory = None,
+        glossary: Glossary = None,
+        generation_profile: str = None,
+        usage: dict = None,
+        checkpoint: CheckpointJournal = None,
 ) -> list:
     """
     :param texts: your text list to translate
     :param translator: transformers.pipeline
     :param progress_bar_init: signal to init the progressbar
     :param progress_bar_num: signal to update the value of progressbar
+    :param batch_size: the size of every batch of the texts sent to the model
+    :param translation_memory: the translation memory to look up before calling the model (None to disable)
+    :param glossary: the terms are masked before inference and restored with the target terms (None to disable)
+    :param generation_profile: a key of GENERATION_PROFILE_DICT, "auto" to select it per batch by the input length,
+                               or None for the default generation settings of the pipeline
+    :param usage: {"requests", "characters"}, the batches and the characters sent to the model are added to it
+    :param checkpoint: the journal of the finished batches of the document (None to disable)
     :return:
     """
+    # 翻译记忆：只有未命中的文本才交给模型
+    if translation_memory is not None:
+        source_language_code, target_language_code = get_language_codes(translator)
+        return translation_memory.translate(
+            texts,
+            lambda texts_missed: translate_texts(texts_missed, translator,
+                                                 progress_bar_init=progress_bar_init,
+                                                 progress_bar_num=progress_bar_num,
+                                                 batch_size=batch_size,
+                                                 glossary=glossary,
+                                                 generation_profile=generation_profile,
+                                                 usage=usage,
+                                                 checkpoint=checkpoint),
+            source_language_code, target_language_code, glossary.fingerprint if glossary is not None else None,
+            engine="{0}#{1}".format(get_model_fingerprint(translator), generation_profile)
+            if generation_profile is not None else get_model_fingerprint(translator),
+        )
+
+    # 术语替换为占位符，翻译后还原为目标语言的术语
+    if glossary is not None:
+        texts = [glossary.mask(text) for text in texts]
+
+    # 按句子切分（单元格内的换行也视为边界），所有片段去重后统一分批翻译，再按单元格拼回并保留原有空白与换行
+    segments = split_segments(texts)
+    # 空片段（只有空白）与只剩占位符的片段（整段都是术语）不送入模型
+    segments_to_translate = [segment[2] != "" and (glossary is None or not glossary.is_masked_only(segment[2]))
+                             for segment in segments]
+    unique_segment_texts, inverse_indexes = deduplicate_texts([segment[2] for segment, to_translate in
+                                                               zip(segments, segments_to_translate) if to_translate])
+
+    len_texts = len(unique_segment_texts)
+    # 按token长度排序后分批翻译，结果按原顺序放回
+    lengths = _get_token_lengths(unique_segment_texts, getattr(translator, "tokenizer", None))
+    order = sorted(range(len_texts), key=lambda index: lengths[index])
+    batches_indexes = [order[index:min(index + batch_size, len_texts)] for index in range(0, len_texts, batch_size)]
+    batches_texts = [[unique_segment_texts[index] for index in batch_indexes] for batch_indexes in batches_indexes]
+    batches_translated = [None] * len(batches_indexes)
+    # 断点续传：上次运行已完成的批次直接从日志中恢复
+    if checkpoint is not None:
+        call_index = checkpoint.next_call()
+        for batch_number, batch_texts in enumerate(batches_texts):
+            batches_translated[batch_number] = checkpoint.get(call_index, batch_number, batch_texts)
+    batch_numbers = [batch_number for batch_number, batch_translated in enumerate(batches_translated)
+                     if batch_translated is None]
+    if usage is not None:
+        usage["requests"] += len(batch_numbers)
+        usage["characters"] += sum(len(text) for batch_number in batch_numbers for text in batches_texts[batch_number])
+
+    def translate_batch(batch_number: int) -> list:
+        batch_texts = batches_texts[batch_number]
+        # 批次按长度排序，最后一个文本最长
+        generation_kwargs = get_generation_kwargs(generation_profile, lengths[batches_indexes[batch_number][-1]])
+        with torch.inference_mode():
+            results = translator(batch_texts, batch_size=len(batch_texts), **generation_kwargs)
+        return [result['translation_text'] for result in results]
 
-    len_texts = len(texts)
     # 进度条
     if progress_bar_init is not None:
         progress_bar_init.emit(len_texts)
-    # 翻译
-    texts_translated = []
-    for index, text in enumerate(texts):
-        if progress_bar_num is not None:
-            progress_bar_num.emit(index)
-        text_translated = translator(text)[0]['translation_text']
-        texts_translated.append(text_translated)
-
-    # TODO:
-    # df = pd.read_csv(glossary_filepath)
-    # glossary_dict = {index: {"zh-CN": row["zh-CN"], "ko": row["ko"]} for index, row in df.iterrows()}
-
-    # # pre-process
-    # texts_tagged = []
-    # for text in texts:
-    #     for glossary_id, glossary in glossary_dict.items():
-    #         text = text.replace(glossary["zh-CN"], "<glossary_id={0}>".format(glossary_id))
-    #     texts_tagged.append(text)
-    # # translate4
-    # translated = translator(texts_tagged)
-    # texts_tagged_translated = [item['translation_text'] for item in translated]
-    # # post-process
-    # texts_translated = []
-    # for text_tagged in texts_tagged_translated:
-    #     glossary_ids = re.findall(r"<glossary_id=(\d+)>", text_tagged)
-    #     glossary_ids = [int(glossary_id) for glossary_id in glossary_ids]
-    #     for glossary_id in glossary_ids:
-    #         text_tagged = text_tagged.replace("<glossary_id={0}>".format(glossary_id), glossary_dict[glossary_id]["ko"])
-    #     texts_translated.append(text_tagged)
+    len_texts_finished = sum(len(batch_texts) for batch_texts, batch_translated in
+                             zip(batches_texts, batches_translated) if batch_translated is not None)
+    if progress_bar_num is not None and len_texts_finished > 0:
+        progress_bar_num.emit(len_texts_finished)
+    # 多进程模型池可以同时处理多个批次（num_workers个），单个模型时逐批处理
+    with ThreadPoolExecutor(max_workers=getattr(translator, "num_workers", 1)) as executor:
+        futures = {executor.submit(translate_batch, batch_number): batch_number for batch_number in batch_numbers}
+        # 进度按已完成的批次计算
+        for future in as_completed(futures):
+            batch_number = futures[future]
+            batches_translated[batch_number] = future.result()
+            if checkpoint is not None:
+                checkpoint.put(call_index, batch_number, batches_texts[batch_number], batches_translated[batch_number])
+            len_texts_finished += len(batches_texts[batch_number])
+            if progress_bar_num is not None:
+                progress_bar_num.emit(len_texts_finished)
+    unique_segments_translated = [None] * len_texts
+    for batch_indexes, batch_translated in zip(batches_indexes, batches_translated):
+        for index, text_translated in zip(batch_indexes, batch_translated):
+            unique_segments_translated[index] = text_translated
+
+    # 未送入模型的片段原样保留（占位符随后还原为目标语言的术语）
+    segments_translated = iter(expand_texts(unique_segments_translated, inverse_indexes))
+    segments_translated = [next(segments_translated) if to_translate else segment[2]
+                           for segment, to_translate in zip(segments, segments_to_translate)]
+    texts_translated = join_segments(segments, segments_translated, len(texts), get_target_language_code(translator))
+
+    if glossary is not None:
+        texts_translated = [glossary.unmask(text_translated) for text_translated in texts_translated]
 
     return texts_translated
 
@@ -66,107 +364,264 @@ class FileTranslatorInterface(metaclass=ABCMeta):
                   file_path_source: str,
                   translator: pipeline,
                   progress_bar_init: pyqtSignal(int) = None,
-                  progress_bar_num: pyqtSignal(int) = None) -> None:
+                  progress_bar_num: pyqtSignal(int) = None,
+                  translation_memory: TranslationMemory = None,
+                  column_selector: ColumnSelector = None,
+                  glossary: Glossary = None,
+                  generation_profile: str = None,
+                  checkpoint: CheckpointJournal = None) -> None:
         """
         Translate txt file with glossary and progress bar.
         :param file_path_source: source file path
         :param translator: transformers.pipeline
         :param progress_bar_init: signal to init the progressbar
         :param progress_bar_num: signal to update the value of progressbar
+        :param translation_memory: the translation memory to look up before translating (None to disable)
+        :param column_selector: the sheets/columns of a table file to translate (None to translate every cell)
+        :param glossary: the local glossary applied around the model (None to disable)
+        :param generation_profile: the generation profile of the model ("auto" to select it by the text length)
+        :param checkpoint: the journal of the finished batches, a restarted job skips them (None to disable)
         :return:
         """
         pass
 
 
 class ExcelFileTranslator(FileTranslatorInterface):
+    # workbooks larger than this (in bytes) are translated in the streaming mode
+    streaming_threshold = EXCEL_STREAMING_THRESHOLD
 
     @staticmethod
-    def _get_translatable_texts(texts: list[str]):
-        indexes = []
-        texts_to_translate = []
-        for index, text in enumerate(texts):
-            if isinstance(text, str):
-                indexes.append(index)
-                texts_to_translate.append(text)
+    def _get_translatable_texts(texts: list, source_language_code: str = None):
+        indexes = get_translatable_indexes(texts, source_language_code)
+        texts_to_translate = [texts[index] for index in indexes]
         return indexes, texts_to_translate
 
     @staticmethod
-    def _map_translated_texts(indexes, texts_translated: list[str], texts: list[str]):
-        texts_translated_dict = dict(zip(indexes, texts_translated))
-        for index in indexes:
-            texts[index] = texts_translated_dict[index]
-        return texts
+    def _select_cells(worksheet, column_selector: ColumnSelector, source_language_code: str) -> list:
+        """
+        :return: the (source cell, target cell) pairs of the selected columns, the header row is not translated
+        """
+        rows = list(worksheet.iter_rows())
+        if len(rows) == 0:
+            return []
+        headers = [cell.value for cell in rows[0]]
+        columns_values = [[row[position].value for row in rows[1:column_selector.detect_sample_size + 1]]
+                          for position in range(len(headers))]
+        positions = column_selector.select_columns(headers, columns_values, source_language_code)
+        column_map, new_headers = column_selector.get_target_positions(headers, positions)
+        # 新增的目标列写入表头
+        for position, header in new_headers.items():
+            worksheet.cell(row=rows[0][0].row, column=position + 1, value=header)
+
+        cell_pairs = []
+        for position in positions:
+            for row in rows[1:]:
+                cell = row[position]
+                if cell.value is None:
+                    continue
+                cell_target = cell
+                if column_map[position] != position:
+                    cell_target = worksheet.cell(row=cell.row, column=column_map[position] + 1)
+                cell_pairs.append((cell, cell_target))
+        return cell_pairs
 
     def translate(self,
                   file_path_source: str,
                   translator: pipeline,
                   progress_bar_init: pyqtSignal(int) = None,
-                  progress_bar_num: pyqtSignal(int) = None) -> None:
+                  progress_bar_num: pyqtSignal(int) = None,
+                  translation_memory: TranslationMemory = None,
+                  column_selector: ColumnSelector = None,
+                  glossary: Glossary = None,
+                  generation_profile: str = None,
+                  checkpoint: CheckpointJournal = None) -> None:
+        # 本次送入模型的批次数与字符数
+        self.usage = {"requests": 0, "characters": 0}
+        file_name, file_type = os.path.splitext(file_path_source)
+        file_path_target = "{0}_translated{1}".format(file_name, file_type)
+        # 大文件使用只读/只写的流式模式，内存占用与文件大小无关
+        if os.path.getsize(file_path_source) > self.streaming_threshold:
+            self.deduplication_stats = translate_workbook_streaming(
+                file_path_source, file_path_target,
+                lambda texts: translate_texts(texts, translator,
+                                              translation_memory=translation_memory,
+                                              usage=self.usage,
+                                              checkpoint=checkpoint,
+                                              glossary=glossary,
+                                              generation_profile=generation_profile),
+                progress_bar_init=progress_bar_init,
+                progress_bar_num=progress_bar_num,
+                column_selector=column_selector,
+                source_language_code=get_source_language_code(translator))
+            return
 
         # Load the source workbook
         workbook = load_workbook(filename=file_path_source)
 
-        # 过滤并翻译
+        # 收集所有工作表中的单元格，统一去重后翻译
+        cells = []
+        cells_target = []
         for sheet in workbook.sheetnames:
             worksheet = workbook[sheet]
-            cells = []
-            for row in worksheet.iter_rows():
-                for cell in row:
-                    if cell.value is not None:
-                        cells.append(cell)
-
-            texts = [str(cell.value) for cell in cells]
-            # 处理
-            indexes, texts_to_translate = self._get_translatable_texts(texts)
-            texts_translated = translate_texts(texts_to_translate,
-                                               translator,
-                                               progress_bar_init=progress_bar_init,
-                                               progress_bar_num=progress_bar_num)
-            # reshape
-            texts = self._map_translated_texts(indexes, texts_translated, texts)
-
-            for i in range(len(cells)):
-                cells[i].value = texts[i]
+            if column_selector is None:
+                for row in worksheet.iter_rows():
+                    for cell in row:
+                        if cell.value is not None:
+                            cells.append(cell)
+                            cells_target.append(cell)
+            elif column_selector.select_sheet(sheet):
+                for cell, cell_target in self._select_cells(worksheet, column_selector, get_source_language_code(translator)):
+                    cells.append(cell)
+                    cells_target.append(cell_target)
+
+        # 处理：数字、日期、ID、路径、占位符等单元格不翻译，原样保留
+        values = [cell.value for cell in cells]
+        indexes, texts_to_translate = self._get_translatable_texts(values, get_source_language_code(translator))
+        texts_translated, self.deduplication_stats = translate_deduplicated(
+            texts_to_translate,
+            lambda texts_unique: translate_texts(texts_unique, translator,
+                                                 progress_bar_init=progress_bar_init,
+                                                 progress_bar_num=progress_bar_num,
+                                                 translation_memory=translation_memory,
+                                                 usage=self.usage,
+                                                 checkpoint=checkpoint,
+                                                 glossary=glossary,
+                                                 generation_profile=generation_profile))
+        # reshape（写入目标列时，未翻译的单元格照抄原文）
+        for cell, cell_target in zip(cells, cells_target):
+            if cell_target is not cell:
+                cell_target.value = cell.value
+        for index, text_translated in zip(indexes, texts_translated):
+            cells_target[index].value = text_translated
 
         # Save the destination workbook
-        file_name, file_type = os.path.splitext(file_path_source)
-        file_path_target = "{0}_translated{1}".format(file_name, file_type)
         workbook.save(filename=file_path_target)
 
 
 class BaseFileTranslator(FileTranslatorInterface):
+    # files larger than this (in bytes) are read, translated and written chunk by chunk
+    chunked_threshold = CSV_CHUNKED_THRESHOLD
+    # the number of rows of every chunk in the chunked mode
+    chunk_size = CSV_CHUNK_SIZE
+
     def load_file(self, file_path_source: str):
         raise NotImplementedError
 
+    def load_file_chunks(self, file_path_source: str, chunk_size: int):
+        raise NotImplementedError
+
     def save_file(self, df, file_path_source: str):
         raise NotImplementedError
 
+    def append_file_chunk(self, df, file_path_source: str, header: bool):
+        raise NotImplementedError
+
+    def _translate_dataframe(self,
+                             df,
+                             translate_function,
+                             column_selector: ColumnSelector = None,
+                             source_language_code: str = None) -> dict:
+        column_positions, column_map = None, None
+        if column_selector is not None:
+            # 分块模式下沿用第一块的选择结果
+            if self._column_selection is None:
+                self._column_selection = column_selector.select_dataframe_columns(df, source_language_code)
+            column_positions, column_map, new_headers = self._column_selection
+            for header in new_headers.values():
+                df[header] = None
+
+        # 按列向量化地提取待翻译文本，并过滤掉无需翻译的单元格
+        texts, (rows, columns) = get_dataframe_texts(df, column_positions)
+        indexes = get_translatable_indexes(texts, source_language_code)
+        texts = [texts[index] for index in indexes]
+        coordinates = (rows[indexes], columns[indexes])
+
+        # Translate
+        texts_translated, deduplication_stats = translate_deduplicated(texts, translate_function)
+        # 写入目标列时，未翻译的单元格（数字、ID、路径等）照抄原文
+        if column_map is not None:
+            copy_dataframe_columns(df, column_map)
+        # 按列批量写回
+        set_dataframe_texts(df, coordinates, texts_translated, column_map)
+        return deduplication_stats
+
+    def _translate_chunked(self,
+                           file_path_source: str,
+                           translate_function,
+                           progress_bar_init: pyqtSignal(int) = None,
+                           progress_bar_num: pyqtSignal(int) = None,
+                           column_selector: ColumnSelector = None,
+                           source_language_code: str = None) -> None:
+        # 进度条（按数据行数估算，表头行不计入）
+        if progress_bar_init is not None:
+            progress_bar_init.emit(max(count_lines(file_path_source) - 1, 0))
+
+        self.deduplication_stats = None
+        len_rows_finished = 0
+        chunks = self.load_file_chunks(file_path_source, self.chunk_size)
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            future = reader.submit(next, chunks, None)
+            header = True
+            while True:
+                df = future.result()
+                if df is None:
+                    break
+                # 翻译当前块的同时读取下一块
+                future = reader.submit(next, chunks, None)
+                deduplication_stats = self._translate_dataframe(df, translate_function,
+                                                                column_selector, source_language_code)
+                self.deduplication_stats = merge_deduplication_stats(self.deduplication_stats, deduplication_stats)
+                # 只有第一块写表头
+                self.append_file_chunk(df, file_path_source, header)
+                header = False
+                len_rows_finished += len(df)
+                if progress_bar_num is not None:
+                    progress_bar_num.emit(len_rows_finished)
+
     def translate(self,
                   file_path_source: str,
                   translator: pipeline,
                   progress_bar_init: pyqtSignal(int) = None,
-                  progress_bar_num: pyqtSignal(int) = None) -> None:
+                  progress_bar_num: pyqtSignal(int) = None,
+                  translation_memory: TranslationMemory = None,
+                  column_selector: ColumnSelector = None,
+                  glossary: Glossary = None,
+                  generation_profile: str = None,
+                  checkpoint: CheckpointJournal = None) -> None:
+        # 本次送入模型的批次数与字符数
+        self.usage = {"requests": 0, "characters": 0}
+        self._column_selection = None
+        # 大文件分块读取、翻译并追加写入，内存占用只与块大小有关
+        if os.path.getsize(file_path_source) > self.chunked_threshold:
+            self._translate_chunked(
+                file_path_source,
+                lambda texts_unique: translate_texts(texts_unique, translator,
+                                                     translation_memory=translation_memory,
+                                                     usage=self.usage,
+                                                     checkpoint=checkpoint,
+                                                     glossary=glossary,
+                                                     generation_profile=generation_profile),
+                progress_bar_init=progress_bar_init,
+                progress_bar_num=progress_bar_num,
+                column_selector=column_selector,
+                source_language_code=get_source_language_code(translator))
+            return
+
         # Load the source workbook
         df = self.load_file(file_path_source)
 
-        cells = []
-        for row_index, row in df.iterrows():
-            for column_index in df.columns:
-                cell_value = row[column_index]
-                if isinstance(cell_value, float) and math.isnan(cell_value):
-                    continue
-                cells.append([cell_value, (row_index, column_index)])
-
-        # Translate
-        texts = [str(item[0]) for item in cells]
-        coordinates = [item[1] for item in cells]
-        texts_translated = translate_texts(texts, translator,
-                                           progress_bar_init=progress_bar_init,
-                                           progress_bar_num=progress_bar_num)
-        # working
-        for index in range(len(texts)):
-            x, y = coordinates[index][0], coordinates[index][1]
-            df.at[x, y] = texts_translated[index]
+        self.deduplication_stats = self._translate_dataframe(
+            df,
+            lambda texts_unique: translate_texts(texts_unique, translator,
+                                                 progress_bar_init=progress_bar_init,
+                                                 progress_bar_num=progress_bar_num,
+                                                 translation_memory=translation_memory,
+                                                 usage=self.usage,
+                                                 checkpoint=checkpoint,
+                                                 glossary=glossary,
+                                                 generation_profile=generation_profile),
+            column_selector,
+            get_source_language_code(translator))
 
         # Save the destination workbook
         self.save_file(df, file_path_source)
@@ -176,42 +631,89 @@ class CsvFileTranslator(BaseFileTranslator):
     def load_file(self, file_path_source: str):
         return pd.read_csv(file_path_source)
 
+    def load_file_chunks(self, file_path_source: str, chunk_size: int):
+        return pd.read_csv(file_path_source, chunksize=chunk_size)
+
     def save_file(self, df, file_path_source: str):
         file_name, file_type = os.path.splitext(file_path_source)
         file_path_target = "{0}_translated{1}".format(file_name, file_type)
         df.to_csv(file_path_target, index=False)
 
+    def append_file_chunk(self, df, file_path_source: str, header: bool):
+        file_name, file_type = os.path.splitext(file_path_source)
+        file_path_target = "{0}_translated{1}".format(file_name, file_type)
+        df.to_csv(file_path_target, index=False, header=header, mode="w" if header else "a")
+
 
 class TsvFileTranslator(BaseFileTranslator):
     def load_file(self, file_path_source: str):
         return pd.read_csv(file_path_source, sep="\t")
 
+    def load_file_chunks(self, file_path_source: str, chunk_size: int):
+        return pd.read_csv(file_path_source, sep="\t", chunksize=chunk_size)
+
     def save_file(self, df, file_path_source: str):
         file_name, file_type = os.path.splitext(file_path_source)
         file_path_target = "{0}_translated{1}".format(file_name, file_type)
         df.to_csv(file_path_target, index=False, sep='\t')
 
+    def append_file_chunk(self, df, file_path_source: str, header: bool):
+        file_name, file_type = os.path.splitext(file_path_source)
+        file_path_target = "{0}_translated{1}".format(file_name, file_type)
+        df.to_csv(file_path_target, index=False, sep='\t', header=header, mode="w" if header else "a")
+
 
 class TxtFileTranslator(FileTranslatorInterface):
+    # the number of lines read and translated at a time
+    chunk_size = TXT_CHUNK_SIZE
+
     def translate(self,
                   file_path_source: str,
                   translator: pipeline,
                   progress_bar_init: pyqtSignal(int) = None,
-                  progress_bar_num: pyqtSignal(int) = None) -> None:
-        # read
-        with open(file_path_source, "r", encoding="utf-8") as file_input:
-            lines = file_input.readlines()
-            texts = [line for line in lines]
-        # translate
-        translated_texts = translate_texts(texts, translator,
-                                           progress_bar_init=progress_bar_init,
-                                           progress_bar_num=progress_bar_num)
-
-        # write
+                  progress_bar_num: pyqtSignal(int) = None,
+                  translation_memory: TranslationMemory = None,
+                  column_selector: ColumnSelector = None,
+                  glossary: Glossary = None,
+                  generation_profile: str = None,
+                  checkpoint: CheckpointJournal = None) -> None:
+        # 本次送入模型的批次数与字符数
+        self.usage = {"requests": 0, "characters": 0}
         file_name, file_type = os.path.splitext(file_path_source)
         file_path_target = "{0}_translated{1}".format(file_name, file_type)
-        with open(file_path_target, "w", encoding="utf-8") as file_output:
-            file_output.writelines([text.rstrip("\n") + "\n" for text in translated_texts])
+        # 进度条（逐行计数，不把文件读入内存）
+        if progress_bar_init is not None:
+            with open(file_path_source, "r", encoding="utf-8") as file_input:
+                progress_bar_init.emit(sum(1 for _ in file_input))
+
+        # 流式处理：逐块读取、翻译，并在每块完成后立即追加写入
+        self.deduplication_stats = None
+        len_lines_finished = 0
+        with open(file_path_source, "r", encoding="utf-8") as file_input, \
+                open(file_path_target, "w", encoding="utf-8") as file_output:
+            while True:
+                texts = list(itertools.islice(file_input, self.chunk_size))
+                if len(texts) == 0:
+                    break
+                # 空行、数字、占位符等无需翻译的行原样保留
+                indexes = get_translatable_indexes(texts, get_source_language_code(translator))
+                texts_translated, deduplication_stats = translate_deduplicated(
+                    [texts[index] for index in indexes],
+                    lambda texts_unique: translate_texts(texts_unique, translator,
+                                                         translation_memory=translation_memory,
+                                                         usage=self.usage,
+                                                         checkpoint=checkpoint,
+                                                         glossary=glossary,
+                                                         generation_profile=generation_profile))
+                translated_texts = list(texts)
+                for index, text_translated in zip(indexes, texts_translated):
+                    translated_texts[index] = text_translated
+                self.deduplication_stats = merge_deduplication_stats(self.deduplication_stats, deduplication_stats)
+                file_output.writelines([text.rstrip("\n") + "\n" for text in translated_texts])
+                file_output.flush()
+                len_lines_finished += len(texts)
+                if progress_bar_num is not None:
+                    progress_bar_num.emit(len_lines_finished)
 
 
 # Simple Factory Pattern
@@ -236,11 +738,7 @@ class FileTranslateFactory:
 
 if __name__ == '__main__':
     model_name = r"D:\LongtuKoreaTranslationModel\fine-tuned-models\nllb-200-1.3B\zh2ko_0907"
-    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    translator = pipeline("translation", model=model, tokenizer=tokenizer,
-                          src_lang=tokenizer.src_lang, tgt_lang=tokenizer.tgt_lang,
-                          device="cuda:0")
+    translator = load_translator(model_name)
 
     results = translate_texts(["你好", "世界"], translator)
     pass
@@ -0,0 +1,72 @@
+import functools
+import logging
+import os
+import threading
+
+from google.cloud import translate_v3 as translate
+
+from rate_limit import AdaptiveRateLimiter
+from settings import (RATE_LIMIT_DECREASE_COOLDOWN, RATE_LIMIT_DECREASE_FACTOR, RATE_LIMIT_MIN_SCALE,
+                      RATE_LIMIT_RECOVERY_PER_MINUTE, RATE_LIMIT_STATE_PATH, TRANSLATION_API_CHARACTERS_PER_MINUTE,
+                      TRANSLATION_API_REQUESTS_PER_MINUTE)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> translate.TranslationServiceClient:
+    """
+    Get the TranslationServiceClient shared by the whole process.
+    The client (credentials and gRPC channel) is created on first use and reused by the text path,
+    the file translators and the glossary tools; a forked child process creates its own client.
+    :return: the shared client
+    """
+    global _client, _client_pid
+    with _client_lock:
+        # gRPC通道不能跨进程复用
+        if _client is None or _client_pid != os.getpid():
+            _client = translate.TranslationServiceClient()
+            _client_pid = os.getpid()
+            logging.debug("Created the TranslationServiceClient of process {0}.".format(_client_pid))
+        return _client
+
+
+def reset_client() -> None:
+    """
+    Drop the shared client (e.g. after GOOGLE_APPLICATION_CREDENTIALS changed), the next get_client creates a new one.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        _client, _client_pid = None, None
+
+
+@functools.lru_cache(maxsize=None)
+def get_glossary_config(project_id: str,
+                        glossary_id: str,
+                        location: str = "us-central1") -> translate.TranslateTextGlossaryConfig:
+    """
+    :param project_id: your project id
+    :param glossary_id: your glossary id
+    :param location: the location of the glossary
+    :return: the glossary config of translate_text requests (built once per glossary)
+    """
+    glossary = translate.TranslationServiceClient.glossary_path(project_id, location, glossary_id)
+    return translate.TranslateTextGlossaryConfig(glossary=glossary)
+
+
+@functools.lru_cache(maxsize=None)
+def get_rate_limiter(project_id: str) -> AdaptiveRateLimiter:
+    """
+    Get the rate limiter of a project shared by the whole process (and, through its state file, by the other processes).
+    The text path, the file translators and the glossary tools all acquire it before calling the API.
+    :param project_id: your project id
+    :return: the shared rate limiter
+    """
+    return AdaptiveRateLimiter(RATE_LIMIT_STATE_PATH.format(project_id),
+                               requests_per_minute=TRANSLATION_API_REQUESTS_PER_MINUTE,
+                               characters_per_minute=TRANSLATION_API_CHARACTERS_PER_MINUTE,
+                               decrease_factor=RATE_LIMIT_DECREASE_FACTOR,
+                               recovery_per_minute=RATE_LIMIT_RECOVERY_PER_MINUTE,
+                               min_scale=RATE_LIMIT_MIN_SCALE,
+                               decrease_cooldown=RATE_LIMIT_DECREASE_COOLDOWN)
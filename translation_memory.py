@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from settings import TRANSLATION_MEMORY_MAX_ENTRIES, TRANSLATION_MEMORY_PATH
+
+
+class TranslationMemory:
+    """
+    On-disk translation memory (sqlite) shared by the Google engine and the custom model engine.
+    Entries are keyed by (source text, language pair, glossary id, engine fingerprint),
+    and the least recently used entries are evicted when the memory grows over max_entries.
+    """
+
+    def __init__(self,
+                 db_path: str = TRANSLATION_MEMORY_PATH,
+                 max_entries: int = TRANSLATION_MEMORY_MAX_ENTRIES):
+        """
+        :param db_path: the path of the sqlite file
+        :param max_entries: the max number of the entries kept in the memory
+        """
+        if os.path.dirname(db_path) != "":
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # 文档翻译线程与主线程共用同一个连接
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS translation_memory ("
+            "key TEXT PRIMARY KEY, "
+            "text_translated TEXT NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS translation_memory_last_used ON translation_memory (last_used)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(text: str,
+                 source_language_code: str,
+                 target_language_code: str,
+                 glossary_id: str,
+                 engine: str) -> str:
+        """
+        :param text: source text
+        :param source_language_code: source language code
+        :param target_language_code: target language code
+        :param glossary_id: your glossary id (None if no glossary is used)
+        :param engine: the fingerprint of the translation engine/model
+        :return: the key of the entry
+        """
+        fields = [text, source_language_code or "", target_language_code or "", glossary_id or "", engine or ""]
+        return hashlib.sha256("\x1f".join(fields).encode("utf-8")).hexdigest()
+
+    def get_many(self,
+                 texts: list,
+                 source_language_code: str,
+                 target_language_code: str,
+                 glossary_id: str,
+                 engine: str) -> list:
+        """
+        Look up the texts in the memory.
+        :return: the translated texts, None for the texts not found
+        """
+        keys = [self.make_key(text, source_language_code, target_language_code, glossary_id, engine)
+                for text in texts]
+        found = {}
+        with self._lock:
+            unique_keys = list(set(keys))
+            # sqlite对参数个数有限制，分批查询
+            for index in range(0, len(unique_keys), 500):
+                batch_keys = unique_keys[index:index + 500]
+                placeholders = ",".join("?" * len(batch_keys))
+                rows = self._connection.execute(
+                    "SELECT key, text_translated FROM translation_memory WHERE key IN ({0})".format(placeholders),
+                    batch_keys,
+                ).fetchall()
+                found.update(rows)
+            if len(found) > 0:
+                now = time.time()
+                self._connection.executemany("UPDATE translation_memory SET last_used = ? WHERE key = ?",
+                                             [(now, key) for key in found])
+                self._connection.commit()
+            texts_translated = [found.get(key) for key in keys]
+            hits = sum(1 for text_translated in texts_translated if text_translated is not None)
+            self.hits += hits
+            self.misses += len(texts_translated) - hits
+        return texts_translated
+
+    def put_many(self,
+                 texts: list,
+                 texts_translated: list,
+                 source_language_code: str,
+                 target_language_code: str,
+                 glossary_id: str,
+                 engine: str) -> None:
+        """
+        Save the translated texts into the memory, then evict the least recently used entries if needed.
+        """
+        now = time.time()
+        rows = [(self.make_key(text, source_language_code, target_language_code, glossary_id, engine),
+                 text_translated, now)
+                for text, text_translated in zip(texts, texts_translated)]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO translation_memory (key, text_translated, last_used) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self) -> None:
+        count = self._connection.execute("SELECT COUNT(*) FROM translation_memory").fetchone()[0]
+        if count > self.max_entries:
+            self._connection.execute(
+                "DELETE FROM translation_memory WHERE key IN "
+                "(SELECT key FROM translation_memory ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+            logging.debug("Evicted {0} entries from the translation memory.".format(count - self.max_entries))
+
+    def translate(self,
+                  texts: list,
+                  translate_function,
+                  source_language_code: str,
+                  target_language_code: str,
+                  glossary_id: str,
+                  engine: str) -> list:
+        """
+        Translate the texts, only the texts not found in the memory are sent to translate_function.
+        :param texts: your text list to translate
+        :param translate_function: a function that translates a text list and returns the translated list
+                                   (None for the texts that failed, they are not saved)
+        :return: the translated texts in the original order
+        """
+        texts_translated = self.get_many(texts, source_language_code, target_language_code, glossary_id, engine)
+        indexes_missed = [index for index, text_translated in enumerate(texts_translated) if text_translated is None]
+        texts_missed = [texts[index] for index in indexes_missed]
+        logging.info("Translation memory: {0} hits, {1} misses.".format(len(texts) - len(texts_missed),
+                                                                         len(texts_missed)))
+        # 全部命中时不再调用翻译函数（避免无谓的加载/请求与进度条刷新）
+        if len(texts_missed) == 0:
+            return texts_translated
+        texts_missed_translated = translate_function(texts_missed)
+        for index, text_translated in zip(indexes_missed, texts_missed_translated):
+            texts_translated[index] = text_translated
+        # 翻译失败（None）的文本不存入记忆
+        texts_saved = [(text, text_translated) for text, text_translated in zip(texts_missed, texts_missed_translated)
+                       if text_translated is not None]
+        self.put_many([text for text, _ in texts_saved], [text_translated for _, text_translated in texts_saved],
+                      source_language_code, target_language_code, glossary_id, engine)
+        return texts_translated
+
+    def stats(self) -> dict:
+        """
+        :return: the hit/miss counters and the number of the entries
+        """
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM translation_memory").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()